@@ -2,6 +2,25 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from .tf_impl import isosurface, batch_isosurface, batch_padded_isosurface
+import importlib
 
-__all__ = [isosurface, batch_isosurface, batch_padded_isosurface]
+# Exported from `tf_impl`, which is only imported on first access so that
+# e.g. `from tf_marching_cubes import np_impl` does not import tensorflow.
+__all__ = [
+    'isosurface', 'sparse_isosurface', 'isosurface_levels', 'batch_isosurface',
+    'batch_padded_isosurface', 'batch_flat_isosurface',
+    'batch_ragged_isosurface', 'compact_mesh', 'static_isosurface', 'contour',
+    'batch_flat_contour', 'contour_slices']
+
+
+def __getattr__(name):
+    if name in __all__:
+        value = getattr(importlib.import_module('.tf_impl', __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(
+        'module %r has no attribute %r' % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
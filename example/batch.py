@@ -4,7 +4,6 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import tensorflow as tf
 import numpy as np
 import os
 from tf_marching_cubes import batch_padded_isosurface
@@ -13,15 +12,15 @@ folder = os.path.join(
     os.path.dirname(os.path.realpath(__file__)), 'data')
 fns = ['car_vox.npy', 'plane_vox.npy']
 voxels = np.array(
-    [np.load(os.path.join(folder, fn)) for fn in fns], dtype=np.bool)
+    [np.load(os.path.join(folder, fn)) for fn in fns], dtype=bool)
 
 data = np.array(voxels, dtype=np.float32)
 
 max_vertices = 5000
 max_faces = 5000
 
-verts, faces, nv, nf = batch_padded_isosurface(
-    data, 0.5, max_vertices, max_faces)
+v, f, nv, nf = (x.numpy() for x in batch_padded_isosurface(
+    data, 0.5, max_vertices, max_faces))
 
 
 def vis_meshes(verts, faces, num_verts, num_faces):
@@ -37,8 +36,4 @@ def vis_meshes(verts, faces, num_verts, num_faces):
     mlab.show()
 
 
-with tf.Session() as sess:
-    v, f, nv, nf = sess.run((verts, faces, nv, nf))
-
-
 vis_meshes(v, f, nv, nf)
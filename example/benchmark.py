@@ -0,0 +1,147 @@
+#!/usr/bin/python
+"""
+Times isosurface extraction of a sphere embedding at various resolutions.
+
+Pass `--reference <revision>` to also time `np_impl` and `tf_impl` from a git
+revision of this repository, e.g. the parent of a commit to measure its
+speedup:
+
+    python benchmark.py --reference <commit>~1
+
+Revisions from before the port to TensorFlow 2 are run in a `tf.compat.v1`
+graph session, as they were benchmarked at the time.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import importlib
+import io
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import types
+from time import time
+import numpy as np
+import tensorflow as tf
+from tf_marching_cubes import isosurface
+from tf_marching_cubes import np_impl, numba_impl
+
+n_warm_up = 2
+n_runs = 10
+level = 0.5
+
+
+def sphere(n):
+    x = np.linspace(-1, 1, n)
+    x, y, z = np.meshgrid(x, x, x, indexing='ij')
+    return np.sqrt(x*x + y*y + z*z).astype(np.float32)
+
+
+def time_np(fn, data):
+    for i in range(n_warm_up):
+        fn(data, level)
+    t = time()
+    for i in range(n_runs):
+        fn(data, level)
+    return (time() - t) / n_runs
+
+
+def time_graph(fn, data):
+    """Time `fn` built once in a graph and run in a `tf.compat.v1.Session`."""
+    graph = tf.Graph()
+    with graph.as_default():
+        # feed data rather than using a constant to avoid constant folding
+        placeholder = tf.compat.v1.placeholder(
+            shape=data.shape, dtype=tf.float32)
+        outputs = fn(placeholder, level)
+        with tf.compat.v1.Session(graph=graph) as sess:
+            return time_np(
+                lambda data, level: sess.run(outputs, {placeholder: data}),
+                data)
+
+
+def load_reference(revision):
+    """
+    Import `np_impl` and `tf_impl` of this repository at a git revision.
+
+    Modules are imported as submodules of a separate package, without running
+    its `__init__`, so they do not clash with the current package.
+
+    Returns `(np_impl, tf_impl, graph)` where `graph` is True if `tf_impl`
+    predates TensorFlow 2 and must be run with `time_graph`.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    path = tempfile.mkdtemp()
+    archive = subprocess.check_output(['git', '-C', root, 'archive', revision])
+    tarfile.open(fileobj=io.BytesIO(archive)).extractall(path)
+    package = types.ModuleType('tf_marching_cubes_reference')
+    package.__path__ = [path]
+    sys.modules[package.__name__] = package
+    np_ref = importlib.import_module(package.__name__ + '.np_impl')
+    name = package.__name__ + '.tf_impl'
+    tf_ref = importlib.import_module(name)
+    try:
+        tf_ref.isosurface(tf.constant(sphere(4)), level)
+        return np_ref, tf_ref, False
+    except AttributeError:
+        # TensorFlow 1 API, e.g. `tf.get_default_graph`
+        del sys.modules[name]
+        sys.modules['tensorflow'] = tf.compat.v1
+        try:
+            tf_ref = importlib.import_module(name)
+        finally:
+            sys.modules['tensorflow'] = tf
+        return np_ref, tf_ref, True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--reference', help='git revision of np_impl/tf_impl to compare to')
+    parser.add_argument(
+        '--resolutions', type=int, nargs='+', default=(32, 64, 128))
+    args = parser.parse_args()
+    if args.reference is not None:
+        np_ref, tf_ref, graph = load_reference(args.reference)
+
+    for n in args.resolutions:
+        data = tf.constant(sphere(n))
+        for i in range(n_warm_up):
+            v, f = isosurface(data, level)
+        t = time()
+        for i in range(n_runs):
+            isosurface(data, level)
+        dt = (time() - t) / n_runs
+        dt_np = time_np(np_impl.isosurface, sphere(n))
+        dt_numba = time_np(numba_impl.isosurface, sphere(n))
+        # pyramid built once, as when sweeping levels
+        pyramid = np_impl.MinMaxPyramid(sphere(n))
+        dt_pyramid = time_np(
+            lambda data, level: np_impl.isosurface(
+                data, level, pyramid=pyramid),
+            sphere(n))
+        print('%d^3: %d vertices, %d faces' % (n, len(v), len(f)))
+        print('  isosurface dt: %.4f' % dt)
+        print('  np_impl dt:    %.4f' % dt_np)
+        print('  numba_impl dt: %.4f' % dt_numba)
+        print('  np_impl pyramid dt: %.4f' % dt_pyramid)
+        if args.reference is None:
+            continue
+        if graph:
+            dt_ref = time_graph(tf_ref.isosurface, sphere(n))
+        else:
+            dt_ref = time_np(tf_ref.isosurface, data)
+        dt_np_ref = time_np(np_ref.isosurface, sphere(n))
+        print('  reference isosurface dt: %.4f (%.2fx)' % (
+            dt_ref, dt_ref / dt))
+        print('  reference np_impl dt:    %.4f (%.2fx)' % (
+            dt_np_ref, dt_np_ref / dt_np))
+
+
+if __name__ == '__main__':
+    main()
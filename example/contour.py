@@ -31,9 +31,7 @@ data = np.sqrt(np.min(
 # contours = measure.find_contours(data, level)
 verts, lengths = find_contours(
     tf.constant(data, dtype=tf.float32), level, back_prop=True)
-
-with tf.Session() as sess:
-    verts, lengths = sess.run((verts, lengths))
+verts, lengths = verts.numpy(), lengths.numpy()
 contours = np.split(verts, lengths)
 
 # contours = [verts[starts[i]: starts[i+1]] for i in range(len(starts) - 1)]
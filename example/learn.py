@@ -18,15 +18,29 @@ x, y, z = np.meshgrid(x, x, x)
 x = 1 - (x*x + y*y + z)
 
 x = tf.Variable(x.astype(np.float32))
-x = tf.pad(x, [[1, 1], [1, 1], [1, 1]], constant_values=-1)
 
-verts, faces = isosurface(x, 0)
-verts = (verts - n/2) * (4 / n)
 
-radius = tf.reduce_sum(verts**2, axis=-1)
-loss = tf.reduce_sum((radius - 1)**2)
+def get_mesh():
+    data = tf.pad(x, [[1, 1], [1, 1], [1, 1]], constant_values=-1)
+    verts, faces = isosurface(data, 0, spacing=4 / n, origin=-2)
+    return verts, faces
+
+
+def get_loss(verts):
+    radius = tf.reduce_sum(verts**2, axis=-1)
+    return tf.reduce_sum((radius - 1)**2)
+
+
+opt = tf.keras.optimizers.Adam(1e-1)
+
+
+@tf.function
+def train_step():
+    with tf.GradientTape() as tape:
+        loss = get_loss(get_mesh()[0])
+    opt.apply_gradients([(tape.gradient(loss, x), x)])
+    return loss
 
-opt = tf.train.AdamOptimizer(1e-1).minimize(loss)
 
 n1 = 1000
 n2 = 3
@@ -46,23 +60,20 @@ def vis_mesh(vertices, faces, include_wireframe=True, color=(0, 0, 1),
     mlab.show()
 
 
-with tf.Session() as sess:
-    sess.run(tf.global_variables_initializer())
-    v, f = sess.run([verts, faces])
-    vis_mesh(v, f)
-    for _ in range(n2):
-
-        try:
-            bar = IncrementalBar(max=n1)
-        except NameError:
-            bar = None
-        for i in range(n1):
-            if bar is not None:
-                bar.next()
-            sess.run(opt)
-            # print(loss_val)
-        v, f, loss_val = sess.run([verts, faces, loss])
-        vis_mesh(v, f)
-        print(loss_val)
+v, f = get_mesh()
+vis_mesh(v.numpy(), f.numpy())
+for _ in range(n2):
+
+    try:
+        bar = IncrementalBar(max=n1)
+    except NameError:
+        bar = None
+    for i in range(n1):
         if bar is not None:
-            bar.finish()
+            bar.next()
+        train_step()
+    v, f = get_mesh()
+    vis_mesh(v.numpy(), f.numpy())
+    print(get_loss(v).numpy())
+    if bar is not None:
+        bar.finish()
@@ -8,7 +8,7 @@ import numpy as np
 import mayavi.mlab as mlab
 from skimage.draw import ellipsoid
 import tensorflow as tf
-from tf_marching_cubes import isosurface
+from tf_marching_cubes import isosurface_levels
 
 # Generate a level set about zero of two identical ellipsoids in 3D
 ellip_base = ellipsoid(16, 20, 16, levelset=True)
@@ -18,17 +18,18 @@ ellip_double = np.concatenate((ellip_base[:-1, ...],
 ellip_double = tf.constant(np.array(ellip_double), dtype=tf.float32)
 
 # Use marching cubes to obtain surface meshes at different levels
-v0, f0 = isosurface(ellip_double, 0.2)
-v1, f1 = isosurface(ellip_double, 0.5)
-with tf.Session() as sess:
-    v0, f0, v1, f1 = sess.run((v0, f0, v1, f1))
+levels = (0.2, 0.5)
+verts, faces, vertex_splits, face_splits = (
+    x.numpy() for x in isosurface_levels(ellip_double, levels))
 
 figure = mlab.figure()
 
-for verts, faces, color in ((v0, f0, (0, 0, 1)), (v1, f1, (0, 1, 0))):
-    x, y, z = verts.T
+for i, color in enumerate(((0, 0, 1), (0, 1, 0))):
+    v = verts[vertex_splits[i]:vertex_splits[i+1]]
+    f = faces[face_splits[i]:face_splits[i+1]]
+    x, y, z = v.T
     mlab.triangular_mesh(
-        x, y, z, faces, figure=figure, color=color, opacity=0.3)
-    mlab.triangular_mesh(x, y, z, faces, representation='wireframe',
+        x, y, z, f, figure=figure, color=color, opacity=0.3)
+    mlab.triangular_mesh(x, y, z, f, representation='wireframe',
                          color=(0, 0, 0), figure=figure, opacity=0.2)
 mlab.show()
@@ -6,7 +6,6 @@ from __future__ import print_function
 
 import os
 import numpy as np
-import tensorflow as tf
 from tf_marching_cubes import isosurface
 
 
@@ -18,8 +17,7 @@ voxels = np.load(voxel_path)
 data = voxels.astype(np.float32)
 
 verts, faces = isosurface(data, 0.5)
-with tf.Session() as sess:
-    v, f = sess.run([verts, faces])
+v, f = verts.numpy(), faces.numpy()
 
 
 def vis(v, f, voxels):
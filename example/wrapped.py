@@ -20,28 +20,36 @@ data = np.concatenate((ellip_base[:-1, ...],
 data = tf.constant(data, dtype=tf.float32)
 level = 0.1
 
+
 # Use marching cubes to obtain surface meshes at different levels
-v, f = isosurface(data, level)
-v_wrapped, f_wrapped = wrapped.marching_cubes_lewiner(data, level=level)[:2]
-# v_wrapped, f_wrapped = wrapped.marching_cubes_classic(data, level=level)[:2]
-v_hacked = wrapped.vertex_gradient_hack(v_wrapped, data, level)
-n_warm_up = 5
-n_runs = 5
-with tf.Session() as sess:
+def native():
+    return isosurface(data, level)
+
+
+def wrapped_mesh():
+    return wrapped.marching_cubes_lewiner(data, level=level)[:2]
+    # return wrapped.marching_cubes_classic(data, level=level)[:2]
+
+
+def hacked():
+    v, f = wrapped_mesh()
+    return wrapped.vertex_gradient_hack(v, data, level), f
+
+
+def time_fn(fn):
     for i in range(n_warm_up):
-        sess.run((v, f, v_wrapped, f_wrapped))
+        fn()
     t = time()
     for i in range(n_runs):
-        v0, f0 = sess.run((v, f))
-    dt = time() - t
-    t = time()
-    for i in range(n_runs):
-        v1, f1 = sess.run((v_wrapped, f_wrapped))
-    dt_wrapped = time() - t
-    t = time()
-    for i in range(n_runs):
-        v2, f2 = sess.run((v_hacked, f_wrapped))
-    dt_hacked = time() - t
+        v, f = fn()
+    return v.numpy(), f.numpy(), time() - t
+
+
+n_warm_up = 5
+n_runs = 5
+v0, f0, dt = time_fn(native)
+v1, f1, dt_wrapped = time_fn(wrapped_mesh)
+v2, f2, dt_hacked = time_fn(hacked)
 
 # print(v1[:5])
 # print('---')
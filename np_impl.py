@@ -3,359 +3,277 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from multiprocessing.pool import ThreadPool
 import numpy as np
+from . import tables
 
 
-def _get_isosurface_data():
-    # map from grid cell index to edge index.
-    # grid cell index tells us which corners are below the isosurface,
-    # edge index tells us which edges are cut by the isosurface.
-    # (Data stolen from Bourk; see above.)
-    edgeTable = np.array([
-          0x0  , 0x109, 0x203, 0x30a, 0x406, 0x50f, 0x605, 0x70c,  # NOQA
-          0x80c, 0x905, 0xa0f, 0xb06, 0xc0a, 0xd03, 0xe09, 0xf00,  # NOQA
-          0x190, 0x99 , 0x393, 0x29a, 0x596, 0x49f, 0x795, 0x69c,  # NOQA
-          0x99c, 0x895, 0xb9f, 0xa96, 0xd9a, 0xc93, 0xf99, 0xe90,  # NOQA
-          0x230, 0x339, 0x33 , 0x13a, 0x636, 0x73f, 0x435, 0x53c,  # NOQA
-          0xa3c, 0xb35, 0x83f, 0x936, 0xe3a, 0xf33, 0xc39, 0xd30,  # NOQA
-          0x3a0, 0x2a9, 0x1a3, 0xaa , 0x7a6, 0x6af, 0x5a5, 0x4ac,  # NOQA
-          0xbac, 0xaa5, 0x9af, 0x8a6, 0xfaa, 0xea3, 0xda9, 0xca0,  # NOQA
-          0x460, 0x569, 0x663, 0x76a, 0x66 , 0x16f, 0x265, 0x36c,  # NOQA
-          0xc6c, 0xd65, 0xe6f, 0xf66, 0x86a, 0x963, 0xa69, 0xb60,  # NOQA
-          0x5f0, 0x4f9, 0x7f3, 0x6fa, 0x1f6, 0xff , 0x3f5, 0x2fc,  # NOQA
-          0xdfc, 0xcf5, 0xfff, 0xef6, 0x9fa, 0x8f3, 0xbf9, 0xaf0,  # NOQA
-          0x650, 0x759, 0x453, 0x55a, 0x256, 0x35f, 0x55 , 0x15c,  # NOQA
-          0xe5c, 0xf55, 0xc5f, 0xd56, 0xa5a, 0xb53, 0x859, 0x950,  # NOQA
-          0x7c0, 0x6c9, 0x5c3, 0x4ca, 0x3c6, 0x2cf, 0x1c5, 0xcc ,  # NOQA
-          0xfcc, 0xec5, 0xdcf, 0xcc6, 0xbca, 0xac3, 0x9c9, 0x8c0,  # NOQA
-          0x8c0, 0x9c9, 0xac3, 0xbca, 0xcc6, 0xdcf, 0xec5, 0xfcc,  # NOQA
-          0xcc , 0x1c5, 0x2cf, 0x3c6, 0x4ca, 0x5c3, 0x6c9, 0x7c0,  # NOQA
-          0x950, 0x859, 0xb53, 0xa5a, 0xd56, 0xc5f, 0xf55, 0xe5c,  # NOQA
-          0x15c, 0x55 , 0x35f, 0x256, 0x55a, 0x453, 0x759, 0x650,  # NOQA
-          0xaf0, 0xbf9, 0x8f3, 0x9fa, 0xef6, 0xfff, 0xcf5, 0xdfc,  # NOQA
-          0x2fc, 0x3f5, 0xff , 0x1f6, 0x6fa, 0x7f3, 0x4f9, 0x5f0,  # NOQA
-          0xb60, 0xa69, 0x963, 0x86a, 0xf66, 0xe6f, 0xd65, 0xc6c,  # NOQA
-          0x36c, 0x265, 0x16f, 0x66 , 0x76a, 0x663, 0x569, 0x460,  # NOQA
-          0xca0, 0xda9, 0xea3, 0xfaa, 0x8a6, 0x9af, 0xaa5, 0xbac,  # NOQA
-          0x4ac, 0x5a5, 0x6af, 0x7a6, 0xaa , 0x1a3, 0x2a9, 0x3a0,  # NOQA
-          0xd30, 0xc39, 0xf33, 0xe3a, 0x936, 0x83f, 0xb35, 0xa3c,  # NOQA
-          0x53c, 0x435, 0x73f, 0x636, 0x13a, 0x33 , 0x339, 0x230,  # NOQA
-          0xe90, 0xf99, 0xc93, 0xd9a, 0xa96, 0xb9f, 0x895, 0x99c,  # NOQA
-          0x69c, 0x795, 0x49f, 0x596, 0x29a, 0x393, 0x99 , 0x190,  # NOQA
-          0xf00, 0xe09, 0xd03, 0xc0a, 0xb06, 0xa0f, 0x905, 0x80c,  # NOQA
-          0x70c, 0x605, 0x50f, 0x406, 0x30a, 0x203, 0x109, 0x0  # NOQA
-          ], dtype=np.uint16)
-
-    # Table of triangles to use for filling each grid cell.
-    # Each set of three integers tells us which three edges to
-    # draw a triangle between.
-    # (Data stolen from Bourk; see above.)
-    triTable = [
-        [],
-        [0, 8, 3],
-        [0, 1, 9],
-        [1, 8, 3, 9, 8, 1],
-        [1, 2, 10],
-        [0, 8, 3, 1, 2, 10],
-        [9, 2, 10, 0, 2, 9],
-        [2, 8, 3, 2, 10, 8, 10, 9, 8],
-        [3, 11, 2],
-        [0, 11, 2, 8, 11, 0],
-        [1, 9, 0, 2, 3, 11],
-        [1, 11, 2, 1, 9, 11, 9, 8, 11],
-        [3, 10, 1, 11, 10, 3],
-        [0, 10, 1, 0, 8, 10, 8, 11, 10],
-        [3, 9, 0, 3, 11, 9, 11, 10, 9],
-        [9, 8, 10, 10, 8, 11],
-        [4, 7, 8],
-        [4, 3, 0, 7, 3, 4],
-        [0, 1, 9, 8, 4, 7],
-        [4, 1, 9, 4, 7, 1, 7, 3, 1],
-        [1, 2, 10, 8, 4, 7],
-        [3, 4, 7, 3, 0, 4, 1, 2, 10],
-        [9, 2, 10, 9, 0, 2, 8, 4, 7],
-        [2, 10, 9, 2, 9, 7, 2, 7, 3, 7, 9, 4],
-        [8, 4, 7, 3, 11, 2],
-        [11, 4, 7, 11, 2, 4, 2, 0, 4],
-        [9, 0, 1, 8, 4, 7, 2, 3, 11],
-        [4, 7, 11, 9, 4, 11, 9, 11, 2, 9, 2, 1],
-        [3, 10, 1, 3, 11, 10, 7, 8, 4],
-        [1, 11, 10, 1, 4, 11, 1, 0, 4, 7, 11, 4],
-        [4, 7, 8, 9, 0, 11, 9, 11, 10, 11, 0, 3],
-        [4, 7, 11, 4, 11, 9, 9, 11, 10],
-        [9, 5, 4],
-        [9, 5, 4, 0, 8, 3],
-        [0, 5, 4, 1, 5, 0],
-        [8, 5, 4, 8, 3, 5, 3, 1, 5],
-        [1, 2, 10, 9, 5, 4],
-        [3, 0, 8, 1, 2, 10, 4, 9, 5],
-        [5, 2, 10, 5, 4, 2, 4, 0, 2],
-        [2, 10, 5, 3, 2, 5, 3, 5, 4, 3, 4, 8],
-        [9, 5, 4, 2, 3, 11],
-        [0, 11, 2, 0, 8, 11, 4, 9, 5],
-        [0, 5, 4, 0, 1, 5, 2, 3, 11],
-        [2, 1, 5, 2, 5, 8, 2, 8, 11, 4, 8, 5],
-        [10, 3, 11, 10, 1, 3, 9, 5, 4],
-        [4, 9, 5, 0, 8, 1, 8, 10, 1, 8, 11, 10],
-        [5, 4, 0, 5, 0, 11, 5, 11, 10, 11, 0, 3],
-        [5, 4, 8, 5, 8, 10, 10, 8, 11],
-        [9, 7, 8, 5, 7, 9],
-        [9, 3, 0, 9, 5, 3, 5, 7, 3],
-        [0, 7, 8, 0, 1, 7, 1, 5, 7],
-        [1, 5, 3, 3, 5, 7],
-        [9, 7, 8, 9, 5, 7, 10, 1, 2],
-        [10, 1, 2, 9, 5, 0, 5, 3, 0, 5, 7, 3],
-        [8, 0, 2, 8, 2, 5, 8, 5, 7, 10, 5, 2],
-        [2, 10, 5, 2, 5, 3, 3, 5, 7],
-        [7, 9, 5, 7, 8, 9, 3, 11, 2],
-        [9, 5, 7, 9, 7, 2, 9, 2, 0, 2, 7, 11],
-        [2, 3, 11, 0, 1, 8, 1, 7, 8, 1, 5, 7],
-        [11, 2, 1, 11, 1, 7, 7, 1, 5],
-        [9, 5, 8, 8, 5, 7, 10, 1, 3, 10, 3, 11],
-        [5, 7, 0, 5, 0, 9, 7, 11, 0, 1, 0, 10, 11, 10, 0],
-        [11, 10, 0, 11, 0, 3, 10, 5, 0, 8, 0, 7, 5, 7, 0],
-        [11, 10, 5, 7, 11, 5],
-        [10, 6, 5],
-        [0, 8, 3, 5, 10, 6],
-        [9, 0, 1, 5, 10, 6],
-        [1, 8, 3, 1, 9, 8, 5, 10, 6],
-        [1, 6, 5, 2, 6, 1],
-        [1, 6, 5, 1, 2, 6, 3, 0, 8],
-        [9, 6, 5, 9, 0, 6, 0, 2, 6],
-        [5, 9, 8, 5, 8, 2, 5, 2, 6, 3, 2, 8],
-        [2, 3, 11, 10, 6, 5],
-        [11, 0, 8, 11, 2, 0, 10, 6, 5],
-        [0, 1, 9, 2, 3, 11, 5, 10, 6],
-        [5, 10, 6, 1, 9, 2, 9, 11, 2, 9, 8, 11],
-        [6, 3, 11, 6, 5, 3, 5, 1, 3],
-        [0, 8, 11, 0, 11, 5, 0, 5, 1, 5, 11, 6],
-        [3, 11, 6, 0, 3, 6, 0, 6, 5, 0, 5, 9],
-        [6, 5, 9, 6, 9, 11, 11, 9, 8],
-        [5, 10, 6, 4, 7, 8],
-        [4, 3, 0, 4, 7, 3, 6, 5, 10],
-        [1, 9, 0, 5, 10, 6, 8, 4, 7],
-        [10, 6, 5, 1, 9, 7, 1, 7, 3, 7, 9, 4],
-        [6, 1, 2, 6, 5, 1, 4, 7, 8],
-        [1, 2, 5, 5, 2, 6, 3, 0, 4, 3, 4, 7],
-        [8, 4, 7, 9, 0, 5, 0, 6, 5, 0, 2, 6],
-        [7, 3, 9, 7, 9, 4, 3, 2, 9, 5, 9, 6, 2, 6, 9],
-        [3, 11, 2, 7, 8, 4, 10, 6, 5],
-        [5, 10, 6, 4, 7, 2, 4, 2, 0, 2, 7, 11],
-        [0, 1, 9, 4, 7, 8, 2, 3, 11, 5, 10, 6],
-        [9, 2, 1, 9, 11, 2, 9, 4, 11, 7, 11, 4, 5, 10, 6],
-        [8, 4, 7, 3, 11, 5, 3, 5, 1, 5, 11, 6],
-        [5, 1, 11, 5, 11, 6, 1, 0, 11, 7, 11, 4, 0, 4, 11],
-        [0, 5, 9, 0, 6, 5, 0, 3, 6, 11, 6, 3, 8, 4, 7],
-        [6, 5, 9, 6, 9, 11, 4, 7, 9, 7, 11, 9],
-        [10, 4, 9, 6, 4, 10],
-        [4, 10, 6, 4, 9, 10, 0, 8, 3],
-        [10, 0, 1, 10, 6, 0, 6, 4, 0],
-        [8, 3, 1, 8, 1, 6, 8, 6, 4, 6, 1, 10],
-        [1, 4, 9, 1, 2, 4, 2, 6, 4],
-        [3, 0, 8, 1, 2, 9, 2, 4, 9, 2, 6, 4],
-        [0, 2, 4, 4, 2, 6],
-        [8, 3, 2, 8, 2, 4, 4, 2, 6],
-        [10, 4, 9, 10, 6, 4, 11, 2, 3],
-        [0, 8, 2, 2, 8, 11, 4, 9, 10, 4, 10, 6],
-        [3, 11, 2, 0, 1, 6, 0, 6, 4, 6, 1, 10],
-        [6, 4, 1, 6, 1, 10, 4, 8, 1, 2, 1, 11, 8, 11, 1],
-        [9, 6, 4, 9, 3, 6, 9, 1, 3, 11, 6, 3],
-        [8, 11, 1, 8, 1, 0, 11, 6, 1, 9, 1, 4, 6, 4, 1],
-        [3, 11, 6, 3, 6, 0, 0, 6, 4],
-        [6, 4, 8, 11, 6, 8],
-        [7, 10, 6, 7, 8, 10, 8, 9, 10],
-        [0, 7, 3, 0, 10, 7, 0, 9, 10, 6, 7, 10],
-        [10, 6, 7, 1, 10, 7, 1, 7, 8, 1, 8, 0],
-        [10, 6, 7, 10, 7, 1, 1, 7, 3],
-        [1, 2, 6, 1, 6, 8, 1, 8, 9, 8, 6, 7],
-        [2, 6, 9, 2, 9, 1, 6, 7, 9, 0, 9, 3, 7, 3, 9],
-        [7, 8, 0, 7, 0, 6, 6, 0, 2],
-        [7, 3, 2, 6, 7, 2],
-        [2, 3, 11, 10, 6, 8, 10, 8, 9, 8, 6, 7],
-        [2, 0, 7, 2, 7, 11, 0, 9, 7, 6, 7, 10, 9, 10, 7],
-        [1, 8, 0, 1, 7, 8, 1, 10, 7, 6, 7, 10, 2, 3, 11],
-        [11, 2, 1, 11, 1, 7, 10, 6, 1, 6, 7, 1],
-        [8, 9, 6, 8, 6, 7, 9, 1, 6, 11, 6, 3, 1, 3, 6],
-        [0, 9, 1, 11, 6, 7],
-        [7, 8, 0, 7, 0, 6, 3, 11, 0, 11, 6, 0],
-        [7, 11, 6],
-        [7, 6, 11],
-        [3, 0, 8, 11, 7, 6],
-        [0, 1, 9, 11, 7, 6],
-        [8, 1, 9, 8, 3, 1, 11, 7, 6],
-        [10, 1, 2, 6, 11, 7],
-        [1, 2, 10, 3, 0, 8, 6, 11, 7],
-        [2, 9, 0, 2, 10, 9, 6, 11, 7],
-        [6, 11, 7, 2, 10, 3, 10, 8, 3, 10, 9, 8],
-        [7, 2, 3, 6, 2, 7],
-        [7, 0, 8, 7, 6, 0, 6, 2, 0],
-        [2, 7, 6, 2, 3, 7, 0, 1, 9],
-        [1, 6, 2, 1, 8, 6, 1, 9, 8, 8, 7, 6],
-        [10, 7, 6, 10, 1, 7, 1, 3, 7],
-        [10, 7, 6, 1, 7, 10, 1, 8, 7, 1, 0, 8],
-        [0, 3, 7, 0, 7, 10, 0, 10, 9, 6, 10, 7],
-        [7, 6, 10, 7, 10, 8, 8, 10, 9],
-        [6, 8, 4, 11, 8, 6],
-        [3, 6, 11, 3, 0, 6, 0, 4, 6],
-        [8, 6, 11, 8, 4, 6, 9, 0, 1],
-        [9, 4, 6, 9, 6, 3, 9, 3, 1, 11, 3, 6],
-        [6, 8, 4, 6, 11, 8, 2, 10, 1],
-        [1, 2, 10, 3, 0, 11, 0, 6, 11, 0, 4, 6],
-        [4, 11, 8, 4, 6, 11, 0, 2, 9, 2, 10, 9],
-        [10, 9, 3, 10, 3, 2, 9, 4, 3, 11, 3, 6, 4, 6, 3],
-        [8, 2, 3, 8, 4, 2, 4, 6, 2],
-        [0, 4, 2, 4, 6, 2],
-        [1, 9, 0, 2, 3, 4, 2, 4, 6, 4, 3, 8],
-        [1, 9, 4, 1, 4, 2, 2, 4, 6],
-        [8, 1, 3, 8, 6, 1, 8, 4, 6, 6, 10, 1],
-        [10, 1, 0, 10, 0, 6, 6, 0, 4],
-        [4, 6, 3, 4, 3, 8, 6, 10, 3, 0, 3, 9, 10, 9, 3],
-        [10, 9, 4, 6, 10, 4],
-        [4, 9, 5, 7, 6, 11],
-        [0, 8, 3, 4, 9, 5, 11, 7, 6],
-        [5, 0, 1, 5, 4, 0, 7, 6, 11],
-        [11, 7, 6, 8, 3, 4, 3, 5, 4, 3, 1, 5],
-        [9, 5, 4, 10, 1, 2, 7, 6, 11],
-        [6, 11, 7, 1, 2, 10, 0, 8, 3, 4, 9, 5],
-        [7, 6, 11, 5, 4, 10, 4, 2, 10, 4, 0, 2],
-        [3, 4, 8, 3, 5, 4, 3, 2, 5, 10, 5, 2, 11, 7, 6],
-        [7, 2, 3, 7, 6, 2, 5, 4, 9],
-        [9, 5, 4, 0, 8, 6, 0, 6, 2, 6, 8, 7],
-        [3, 6, 2, 3, 7, 6, 1, 5, 0, 5, 4, 0],
-        [6, 2, 8, 6, 8, 7, 2, 1, 8, 4, 8, 5, 1, 5, 8],
-        [9, 5, 4, 10, 1, 6, 1, 7, 6, 1, 3, 7],
-        [1, 6, 10, 1, 7, 6, 1, 0, 7, 8, 7, 0, 9, 5, 4],
-        [4, 0, 10, 4, 10, 5, 0, 3, 10, 6, 10, 7, 3, 7, 10],
-        [7, 6, 10, 7, 10, 8, 5, 4, 10, 4, 8, 10],
-        [6, 9, 5, 6, 11, 9, 11, 8, 9],
-        [3, 6, 11, 0, 6, 3, 0, 5, 6, 0, 9, 5],
-        [0, 11, 8, 0, 5, 11, 0, 1, 5, 5, 6, 11],
-        [6, 11, 3, 6, 3, 5, 5, 3, 1],
-        [1, 2, 10, 9, 5, 11, 9, 11, 8, 11, 5, 6],
-        [0, 11, 3, 0, 6, 11, 0, 9, 6, 5, 6, 9, 1, 2, 10],
-        [11, 8, 5, 11, 5, 6, 8, 0, 5, 10, 5, 2, 0, 2, 5],
-        [6, 11, 3, 6, 3, 5, 2, 10, 3, 10, 5, 3],
-        [5, 8, 9, 5, 2, 8, 5, 6, 2, 3, 8, 2],
-        [9, 5, 6, 9, 6, 0, 0, 6, 2],
-        [1, 5, 8, 1, 8, 0, 5, 6, 8, 3, 8, 2, 6, 2, 8],
-        [1, 5, 6, 2, 1, 6],
-        [1, 3, 6, 1, 6, 10, 3, 8, 6, 5, 6, 9, 8, 9, 6],
-        [10, 1, 0, 10, 0, 6, 9, 5, 0, 5, 6, 0],
-        [0, 3, 8, 5, 6, 10],
-        [10, 5, 6],
-        [11, 5, 10, 7, 5, 11],
-        [11, 5, 10, 11, 7, 5, 8, 3, 0],
-        [5, 11, 7, 5, 10, 11, 1, 9, 0],
-        [10, 7, 5, 10, 11, 7, 9, 8, 1, 8, 3, 1],
-        [11, 1, 2, 11, 7, 1, 7, 5, 1],
-        [0, 8, 3, 1, 2, 7, 1, 7, 5, 7, 2, 11],
-        [9, 7, 5, 9, 2, 7, 9, 0, 2, 2, 11, 7],
-        [7, 5, 2, 7, 2, 11, 5, 9, 2, 3, 2, 8, 9, 8, 2],
-        [2, 5, 10, 2, 3, 5, 3, 7, 5],
-        [8, 2, 0, 8, 5, 2, 8, 7, 5, 10, 2, 5],
-        [9, 0, 1, 5, 10, 3, 5, 3, 7, 3, 10, 2],
-        [9, 8, 2, 9, 2, 1, 8, 7, 2, 10, 2, 5, 7, 5, 2],
-        [1, 3, 5, 3, 7, 5],
-        [0, 8, 7, 0, 7, 1, 1, 7, 5],
-        [9, 0, 3, 9, 3, 5, 5, 3, 7],
-        [9, 8, 7, 5, 9, 7],
-        [5, 8, 4, 5, 10, 8, 10, 11, 8],
-        [5, 0, 4, 5, 11, 0, 5, 10, 11, 11, 3, 0],
-        [0, 1, 9, 8, 4, 10, 8, 10, 11, 10, 4, 5],
-        [10, 11, 4, 10, 4, 5, 11, 3, 4, 9, 4, 1, 3, 1, 4],
-        [2, 5, 1, 2, 8, 5, 2, 11, 8, 4, 5, 8],
-        [0, 4, 11, 0, 11, 3, 4, 5, 11, 2, 11, 1, 5, 1, 11],
-        [0, 2, 5, 0, 5, 9, 2, 11, 5, 4, 5, 8, 11, 8, 5],
-        [9, 4, 5, 2, 11, 3],
-        [2, 5, 10, 3, 5, 2, 3, 4, 5, 3, 8, 4],
-        [5, 10, 2, 5, 2, 4, 4, 2, 0],
-        [3, 10, 2, 3, 5, 10, 3, 8, 5, 4, 5, 8, 0, 1, 9],
-        [5, 10, 2, 5, 2, 4, 1, 9, 2, 9, 4, 2],
-        [8, 4, 5, 8, 5, 3, 3, 5, 1],
-        [0, 4, 5, 1, 0, 5],
-        [8, 4, 5, 8, 5, 3, 9, 0, 5, 0, 3, 5],
-        [9, 4, 5],
-        [4, 11, 7, 4, 9, 11, 9, 10, 11],
-        [0, 8, 3, 4, 9, 7, 9, 11, 7, 9, 10, 11],
-        [1, 10, 11, 1, 11, 4, 1, 4, 0, 7, 4, 11],
-        [3, 1, 4, 3, 4, 8, 1, 10, 4, 7, 4, 11, 10, 11, 4],
-        [4, 11, 7, 9, 11, 4, 9, 2, 11, 9, 1, 2],
-        [9, 7, 4, 9, 11, 7, 9, 1, 11, 2, 11, 1, 0, 8, 3],
-        [11, 7, 4, 11, 4, 2, 2, 4, 0],
-        [11, 7, 4, 11, 4, 2, 8, 3, 4, 3, 2, 4],
-        [2, 9, 10, 2, 7, 9, 2, 3, 7, 7, 4, 9],
-        [9, 10, 7, 9, 7, 4, 10, 2, 7, 8, 7, 0, 2, 0, 7],
-        [3, 7, 10, 3, 10, 2, 7, 4, 10, 1, 10, 0, 4, 0, 10],
-        [1, 10, 2, 8, 7, 4],
-        [4, 9, 1, 4, 1, 7, 7, 1, 3],
-        [4, 9, 1, 4, 1, 7, 0, 8, 1, 8, 7, 1],
-        [4, 0, 3, 7, 4, 3],
-        [4, 8, 7],
-        [9, 10, 8, 10, 11, 8],
-        [3, 0, 9, 3, 9, 11, 11, 9, 10],
-        [0, 1, 10, 0, 10, 8, 8, 10, 11],
-        [3, 1, 10, 11, 3, 10],
-        [1, 2, 11, 1, 11, 9, 9, 11, 8],
-        [3, 0, 9, 3, 9, 11, 1, 2, 9, 2, 11, 9],
-        [0, 2, 11, 8, 0, 11],
-        [3, 2, 11],
-        [2, 3, 8, 2, 8, 10, 10, 8, 9],
-        [9, 10, 2, 0, 9, 2],
-        [2, 3, 8, 2, 8, 10, 0, 1, 8, 1, 10, 8],
-        [1, 10, 2],
-        [1, 3, 8, 9, 1, 8],
-        [0, 9, 1],
-        [0, 3, 8],
-        []
-    ]
-    edgeShifts = np.array([
-        # #maps edge ID (0-11) to (x,y,z) cell offset and edge ID (0-2)
-        [0, 0, 0, 0],
-        [1, 0, 0, 1],
-        [0, 1, 0, 0],
-        [0, 0, 0, 1],
-        [0, 0, 1, 0],
-        [1, 0, 1, 1],
-        [0, 1, 1, 0],
-        [0, 0, 1, 1],
-        [0, 0, 0, 2],
-        [1, 0, 0, 2],
-        [1, 1, 0, 2],
-        [0, 1, 0, 2],
-        # [9, 9, 9, 9]  ## fake
-    ], dtype=np.uint16)
-    # don't use ubyte here! This value gets added to cell index later;
-    # will need the extra precision.
-    nTableFaces = np.array(
-        [len(f)/3 for f in triTable], dtype=np.ubyte)
-    faceShiftTables = [None]
-    for i in range(1, 6):
-        # # compute lookup table of index: vertexes mapping
-        faceTableI = np.zeros((len(triTable), i*3), dtype=np.ubyte)
-        faceTableInds = np.argwhere(nTableFaces == i)
-
-        faceTableI[faceTableInds[:, 0]] = np.array(
-                [triTable[j] for j in faceTableInds[:, 0]])
-        faceTableI = faceTableI.reshape((len(triTable), i, 3))
-        faceShiftTables.append(edgeShifts[faceTableI])
-
-    return faceShiftTables, edgeShifts, edgeTable, nTableFaces
-
-
-IsosurfaceDataCache = None
-
-
-def isosurface(data, level):
+def _flat_data(data):
+    """
+    Get a flat view of `data` for gathering values by linear offset.
+
+    Works with any strided array (C- or Fortran-ordered, sliced or flipped)
+    without copying, unless strides are not a multiple of the item size.
+
+    Returns `(dataFlat, ds, origin)` such that
+    `data[x, y, z] == dataFlat[origin + x*ds[0] + y*ds[1] + z*ds[2]]`.
+    """
+    if any(s % data.itemsize for s in data.strides):
+        data = np.ascontiguousarray(data)
+    ds = np.array(data.strides) // data.itemsize
+    # flip axes with negative strides so the view starts at the lowest address
+    flipped = [slice(None, None, -1) if s < 0 else slice(None) for s in ds]
+    origin = sum((n - 1) * -s for n, s in zip(data.shape, ds) if s < 0)
+    span = np.sum((np.array(data.shape) - 1) * np.abs(ds)) + 1
+    dataFlat = np.lib.stride_tricks.as_strided(
+        data[tuple(flipped)], shape=(span,), strides=(data.itemsize,),
+        writeable=False)
+    return dataFlat, ds, origin
+
+
+def _vertex_dtype(data):
+    return np.float64 if data.dtype == np.float64 else np.float32
+
+
+def _interpolate_vertices(data, level, vertexInds, axis, offset=(0, 0, 0)):
+    """
+    Get vertex positions on cut edges.
+
+    *data*        3D numpy array of scalar values.
+    *level*       The level of the isosurface.
+    *vertexInds*  (N, 3) integer array of cut edge start coordinates.
+    *axis*        (N,) integer array of cut edge axes.
+    *offset*      (x, y, z) position of `data` within a larger volume, added
+                  to vertex positions.
+
+    Returns an (N, 3) float array of vertex positions, float64 if `data` is
+    float64 and float32 otherwise.
+    """
+    dtype = _vertex_dtype(data)
+    dataFlat, ds, origin = _flat_data(data)
+    viFlat = origin + vertexInds.dot(ds)
+    v1 = dataFlat[viFlat].astype(dtype, copy=False)
+    v2 = dataFlat[viFlat + ds[axis]].astype(dtype, copy=False)
+    vertexes = (vertexInds + offset).astype(dtype)
+    vertexes[np.arange(len(vertexes)), axis] += (level - v1) / (v2 - v1)
+    return vertexes
+
+
+def _edge_weights(data, level, vertexInds, axis):
+    """
+    Get the fraction along each cut edge at which data is equal to the level.
+
+    *data*        3D numpy array of scalar values.
+    *level*       The level of the isosurface.
+    *vertexInds*  (N, 3) integer array of cut edge start coordinates.
+    *axis*        (N,) integer array of cut edge axes.
+
+    Returns an (N,) float array, `(level - v1) / (v2 - v1)`.
+    """
+    dtype = _vertex_dtype(data)
+    dataFlat, ds, origin = _flat_data(data)
+    viFlat = origin + vertexInds.dot(ds)
+    v1 = dataFlat[viFlat].astype(dtype, copy=False)
+    v2 = dataFlat[viFlat + ds[axis]].astype(dtype, copy=False)
+    return (level - v1) / (v2 - v1)
+
+
+def _vertex_attributes(data, level, vertexInds, axis, attributes):
+    """
+    Interpolate per-voxel attributes at vertices on cut edges.
+
+    *data*        3D numpy array of scalar values.
+    *level*       The level of the isosurface.
+    *vertexInds*  (N, 3) integer array of cut edge start coordinates.
+    *axis*        (N,) integer array of cut edge axes.
+    *attributes*  Array of shape data.shape + (...) of per-voxel values.
+
+    Returns an (N, ...) float array of attributes, linearly interpolated
+    along each edge with the same weights as vertex positions.
+    """
+    t = _edge_weights(data, level, vertexInds, axis)
+    a1 = attributes[tuple(vertexInds.T)]
+    vertexInds = vertexInds.copy()
+    vertexInds[np.arange(len(vertexInds)), axis] += 1
+    a2 = attributes[tuple(vertexInds.T)]
+    t = t.reshape(t.shape + (1,) * (a1.ndim - 1))
+    return a1 + t * (a2 - a1)
+
+
+def _vertex_normals(data, level, vertexInds, axis):
+    """
+    Get unit normals of vertices on cut edges.
+
+    The gradient of `data` is estimated at both ends of each edge by central
+    differences (one-sided at the grid boundary) and linearly interpolated
+    with the same weights as vertex positions.
+
+    *data*        3D numpy array of scalar values.
+    *level*       The level of the isosurface.
+    *vertexInds*  (N, 3) integer array of cut edge start coordinates.
+    *axis*        (N,) integer array of cut edge axes.
+
+    Returns an (N, 3) float array of normals pointing towards decreasing
+    values of `data`, consistent with the winding of faces.
+    """
+    dtype = _vertex_dtype(data)
+    dataFlat, ds, origin = _flat_data(data)
+    t = _edge_weights(data, level, vertexInds, axis)
+
+    normals = np.zeros((len(vertexInds), 3), dtype=dtype)
+    for end, weight in ((0, 1 - t), (1, t)):
+        points = vertexInds.copy()
+        points[np.arange(len(points)), axis] += end
+        flat = origin + points.dot(ds)
+        for a in range(3):
+            hi = points[:, a] < data.shape[a] - 1
+            lo = points[:, a] > 0
+            diff = dataFlat[flat + hi * ds[a]].astype(dtype) - \
+                dataFlat[flat - lo * ds[a]]
+            step = np.maximum(hi.astype(dtype) + lo, 1)
+            normals[:, a] -= weight * diff / step
+    norm = np.sqrt(np.sum(normals ** 2, axis=1, keepdims=True))
+    return normals / np.where(norm > 0, norm, 1)
+
+
+def _affine(spacing=None, origin=None, affine=None):
+    """
+    Get the transform from grid indices to world coordinates.
+
+    *spacing*  Optional scalar or (3,) grid spacing.
+    *origin*   Optional scalar or (3,) world position of grid index (0, 0, 0).
+    *affine*   Optional (4, 4) or (3, 4) affine matrix, mapping homogeneous
+               grid indices to world coordinates. Exclusive with `spacing`
+               and `origin`.
+
+    Returns a (3, 4) float64 array `[L | b]` such that world coordinates are
+    `L.dot(index) + b`, or None if no transform is given.
+    """
+    if affine is not None:
+        if spacing is not None or origin is not None:
+            raise ValueError(
+                '`affine` cannot be combined with `spacing` or `origin`')
+        affine = np.asarray(affine, dtype=np.float64)
+        if affine.shape not in ((3, 4), (4, 4)):
+            raise ValueError(
+                'affine must have shape (4, 4) or (3, 4), got %s'
+                % (affine.shape,))
+        return affine[:3]
+    if spacing is None and origin is None:
+        return None
+    transform = np.zeros((3, 4))
+    transform[:, :3] = np.diag(np.broadcast_to(
+        1. if spacing is None else spacing, (3,)))
+    transform[:, 3] = 0. if origin is None else origin
+    return transform
+
+
+def _transform_vertices(vertexes, transform):
+    """
+    Apply a (3, 4) transform from `_affine` to (N, 3) vertex positions.
+
+    Products are accumulated in float64 in a fixed order, matching
+    `numba_impl`, and cast back to the dtype of `vertexes`.
+    """
+    out = transform[:, 3] + vertexes[:, :1] * transform[:, 0]
+    out += vertexes[:, 1:2] * transform[:, 1]
+    out += vertexes[:, 2:] * transform[:, 2]
+    return out.astype(vertexes.dtype)
+
+
+def _transform_normals(normals, transform):
+    """
+    Transform (N, 3) unit normals by the inverse transpose of a transform.
+
+    Returns unit normals of the transformed surface.
+    """
+    normals = normals.dot(np.linalg.inv(transform[:, :3])).astype(
+        normals.dtype)
+    norm = np.sqrt(np.sum(normals ** 2, axis=1, keepdims=True))
+    return normals / np.where(norm > 0, norm, 1)
+
+
+def _transform_faces(faces, transform):
+    """
+    Reverse the winding of faces if a transform mirrors space.
+
+    Vertex order is swapped when `transform` has a negative determinant, so
+    faces stay consistent with transformed normals.
+    """
+    if np.linalg.det(transform[:, :3]) < 0:
+        return faces[:, [0, 2, 1]]
+    return faces
+
+
+def _face_keys(cells, index, shape):
+    """
+    Get the cut edges making up each face of the given cells.
+
+    *cells*  (N,) array of flat indices of cells into a grid of `shape`.
+    *index*  (N,) array of cube indices of `cells`.
+    *shape*  Shape of the grid of data values.
+
+    Returns an (Nf, 3) array of flat indices into an (x, y, z, axis) grid of
+    edges, with faces ordered by cell.
+    """
+    # offsets of face edges relative to the cell's first edge, for each row
+    # of the flattened face table
+    edgeStrides = np.cumprod((shape[1:] + (3, 1))[::-1])[::-1]
+    caseKeys = tables.faceShifts.dot(edgeStrides)
+    # faces of each cell are consecutive rows of the face table, starting at
+    # its cube index's offset
+    nFaces = tables.nTableFaces[index]
+    faceStarts = np.cumsum(nFaces, dtype=np.intp) - nFaces
+    rows = np.arange(nFaces.sum(dtype=np.intp)) + \
+        np.repeat(tables.faceOffsets[index] - faceStarts, nFaces)
+    return np.repeat(3 * cells, nFaces)[:, np.newaxis] + caseKeys[rows]
+
+
+def isosurface(data, level, pyramid=None, workers=1, compact=False,
+               return_edges=False, normals=False, attributes=None,
+               spacing=None, origin=None, affine=None):
     """
     Generate isosurface from volumetric data using marching cubes algorithm.
     See Paul Bourke, "Polygonising a Scalar Field"
     (http://paulbourke.net/geometry/polygonise/)
 
-    *data*   3D numpy array of scalar values. Must be contiguous.
-    *level*  The level at which to generate an isosurface
+    *data*     3D numpy array of scalar values. May have any strides.
+    *level*    The level at which to generate an isosurface
+    *pyramid*  Optional `MinMaxPyramid` of `data`. If given, only cells in
+               bricks whose range includes `level` are processed (see
+               `sparse_isosurface`), and faces may be in a different order.
+    *workers*  Number of threads. If more than 1, slabs of the volume along
+               its first axis are extracted in parallel and stitched
+               together. Output is identical for any number of workers.
+               Ignored if `pyramid` is given.
+    *compact*  If True, the mesh is passed through `compact_mesh`.
+    *return_edges*  If True, also return the (Nv, 4) array of cut edges
+               (x, y, z, axis) on which each vertex lies.
+    *normals*  If True, also return an (Nv, 3) array of unit vertex normals,
+               interpolated from central-difference gradients of `data` at
+               the ends of each vertex's edge. Normals point towards
+               decreasing values, consistent with the winding of faces.
+    *attributes*  Optional array of shape data.shape + (...) of per-voxel
+               channels, e.g. colour or uncertainty. If given, also return
+               an (Nv, ...) array of channels linearly interpolated at each
+               vertex with the same edge weights as vertex positions.
+    *spacing*  Optional scalar or (3,) grid spacing, e.g. anisotropic voxel
+               size, by which vertex positions are scaled.
+    *origin*   Optional scalar or (3,) position of `data[0, 0, 0]`, added to
+               vertex positions.
+    *affine*   Optional (4, 4) matrix mapping homogeneous grid indices to
+               vertex positions, instead of `spacing` and `origin`. Normals
+               are transformed consistently, and the winding of faces is
+               reversed if the affine mirrors space (has a negative
+               determinant). Edges are always grid indices.
 
     Returns an array of vertex coordinates (Nv, 3) and an array of
-    per-face vertex indexes (Nf, 3)
+    per-face vertex indexes (Nf, 3). Vertices are float64 for float64 data and
+    float32 otherwise. There is exactly one vertex per cut edge, so no two
+    vertices share an edge, and every vertex is used by a face unless `data`
+    has no cells (i.e. a dimension of size 1). Vertices may only coincide
+    where `level` is equal to a value of `data`. Normals, attributes and
+    edges, if requested, follow in that order.
     """
     # For improvement, see:
     ##
@@ -364,114 +282,518 @@ def isosurface(data, level):
     # Thomas Lewiner, Helio Lopes, Antonio Wilson Vieira and Geovan Tavares.
     # Journal of Graphics Tools 8(2): pp. 1-15 (december 2003)
 
-    # Precompute lookup tables on the first run
-    global IsosurfaceDataCache
-    if IsosurfaceDataCache is None:
-        IsosurfaceDataCache = _get_isosurface_data()
-    faceShiftTables, edgeShifts, edgeTable, nTableFaces = \
-        IsosurfaceDataCache
+    transform = _affine(spacing, origin, affine)
+    if pyramid is not None:
+        if pyramid.shape != data.shape:
+            raise ValueError(
+                'pyramid shape %s does not match data shape %s'
+                % (pyramid.shape, data.shape))
+        vertexes, faces, keys = _sparse_isosurface(
+            data, level, pyramid=pyramid)
+    elif workers > 1 and data.shape[0] > 2:
+        vertexes, faces, keys = _parallel_isosurface(data, level, workers)
+    else:
+        vertexes, faces, keys = _isosurface(data, level)
 
-    # We use strides below, which means we need contiguous array input.
-    # Ideally we can fix this just by removing the dependency on strides.
-    if not data.flags['C_CONTIGUOUS']:
-        raise TypeError("isosurface input data must be c-contiguous.")
+    edges = None
+    if attributes is not None:
+        attributes = np.asarray(attributes)
+        if attributes.shape[:3] != data.shape:
+            raise ValueError(
+                'attributes shape %s does not match data shape %s'
+                % (attributes.shape, data.shape))
+    if return_edges or normals or attributes is not None:
+        edges = np.stack(np.unravel_index(keys, data.shape + (3,)), axis=1)
+    if compact:
+        vertexes, faces, edges = compact_mesh(vertexes, faces, edges)
+    if transform is not None:
+        vertexes = _transform_vertices(vertexes, transform)
+        faces = _transform_faces(faces, transform)
+    result = (vertexes, faces)
+    if normals:
+        vertexNormals = _vertex_normals(
+            data, level, edges[:, :3], edges[:, 3])
+        if transform is not None:
+            vertexNormals = _transform_normals(vertexNormals, transform)
+        result += (vertexNormals,)
+    if attributes is not None:
+        result += (_vertex_attributes(
+            data, level, edges[:, :3], edges[:, 3], attributes),)
+    if return_edges:
+        result += (edges,)
+    return result
 
+
+def compact_mesh(vertexes, faces, edges=None):
+    """
+    Remove unreferenced vertices and store faces in the smallest index type.
+
+    *vertexes*  (Nv, 3) array of vertex coordinates.
+    *faces*     (Nf, 3) array of vertex indexes.
+    *edges*     Optional (Nv, ...) array of per-vertex data, e.g. the cut
+                edges from `isosurface(..., return_edges=True)`.
+
+    Returns vertices used by at least one face, in their original order, and
+    faces indexing into them, as uint16 if there are fewer than 2**16 - 1
+    vertices (leaving 0xFFFF free as a primitive restart index) and int32
+    otherwise. If `edges` is given, rows of referenced vertices are returned
+    as a third value, otherwise None.
+    """
+    used = np.zeros((len(vertexes),), dtype=bool)
+    used[faces.ravel()] = True
+    dtype = np.uint16 if used.sum() < np.iinfo(np.uint16).max else np.int32
+    if used.all():
+        faces = faces.astype(dtype)
+    else:
+        newIds = np.cumsum(used, dtype=dtype) - used
+        faces = newIds.take(faces)
+        vertexes = vertexes[used]
+        if edges is not None:
+            edges = edges[used]
+    return vertexes, faces, edges
+
+
+def _isosurface(data, level, offset=(0, 0, 0)):
+    """
+    Dense marching cubes over all cells of `data`.
+
+    Returns vertices and faces as for `isosurface`, along with the flat
+    (x, y, z, axis) index of each vertex's edge. `offset` is added to
+    vertices.
+    """
     # mark everything below the isosurface level
     mask = data < level
 
-    # make eight sub-fields and compute indexes for grid cells
-    index = np.zeros([x - 1 for x in data.shape], dtype=np.ubyte)
-    fields = np.empty((2, 2, 2), dtype=object)
+    # make eight sub-fields and compute indexes for grid cells. index has the
+    # shape of data so flat indices of cells and grid points coincide; the
+    # far faces of the grid hold no cells and remain 0.
+    index = np.zeros(data.shape, dtype=np.ubyte)
+    cellIndex = index[:-1, :-1, :-1]
+    maskBytes = mask.view(np.ubyte)
     slices = [slice(0, -1), slice(1, None)]
     for i in [0, 1]:
         for j in [0, 1]:
             for k in [0, 1]:
-                fields[i, j, k] = mask[slices[i], slices[j], slices[k]]
                 # this is just to match Bourk's vertex numbering scheme
                 vertIndex = i - 2 * j * i + 3 * j + 4 * k
-                np.add(index, fields[i, j, k] * 2 **
-                       vertIndex, out=index, casting='unsafe')
+                np.bitwise_or(
+                    cellIndex,
+                    maskBytes[slices[i], slices[j], slices[k]] << vertIndex,
+                    out=cellIndex)
 
-    # Generate table of edges that have been cut
-    cutEdges = np.zeros([x + 1 for x in index.shape] + [3], dtype=np.uint32)
-    edges = edgeTable[index]
-    for i, shift in enumerate(edgeShifts[:12]):
-        slices = [slice(shift[j], cutEdges.shape[j] + (shift[j] - 1))
-                  for j in range(3)]
-        cutEdges[slices[0], slices[1], slices[2], shift[3]] += edges & 2**i
+    # Generate table of edges that have been cut, i.e. those with ends on
+    # either side of the isosurface.
+    cutEdges = np.zeros(data.shape + (3,), dtype=bool)
+    np.not_equal(mask[1:], mask[:-1], out=cutEdges[:-1, :, :, 0])
+    np.not_equal(mask[:, 1:], mask[:, :-1], out=cutEdges[:, :-1, :, 1])
+    np.not_equal(mask[:, :, 1:], mask[:, :, :-1], out=cutEdges[:, :, :-1, 2])
 
     # for each cut edge, interpolate to see where exactly the edge is cut and
-    # generate vertex positions
-    m = cutEdges > 0
-    vertexInds = np.argwhere(m)  # argwhere is slow!
-    vertexes = vertexInds[:, :3].astype(np.float32)
-    dataFlat = data.reshape(data.shape[0] * data.shape[1] * data.shape[2])
-
-    # re-use the cutEdges array as a lookup table for vertex IDs
-    cutEdges[vertexInds[:, 0], vertexInds[:, 1], vertexInds[:, 2],
-             vertexInds[:, 3]] = np.arange(vertexInds.shape[0])
-
-    for i in [0, 1, 2]:
-        vim = vertexInds[:, 3] == i
-        vi = vertexInds[vim, :3]
-        viFlat = np.array(data.strides[:3]) // data.itemsize
-        viFlat = (vi * viFlat[np.newaxis, :]).sum(axis=1)
-        v1 = dataFlat[viFlat]
-        v2 = dataFlat[viFlat + data.strides[i] // data.itemsize]
-        vertexes[vim, i] += (level - v1) / (v2 - v1)
-
-    # compute the set of vertex indexes for each face.
-
-    # This works, but runs a bit slower.
-    # # all cells with at least one face
-    # cells = np.argwhere((index != 0) & (index != 255))
-    # cellInds = index[cells[:,0], cells[:,1], cells[:,2]]
-    # verts = faceTable[cellInds]
-    # mask = verts[...,0,0] != 9
-    # # we now have indexes into cutEdges
-    # verts[...,:3] += cells[:,np.newaxis,np.newaxis,:]
-    # verts = verts[mask]
-    # faces = cutEdges[verts[...,0], verts[...,1], verts[...,2], verts[...,3]]
-    # ## and these are the vertex indexes we want.
-
-    # To allow this to be vectorized efficiently, we count the number of faces
-    # in each grid cell and handle each group of cells with the same number
-    # together.
-    # determine how many faces to assign to each grid cell
-    nFaces = nTableFaces[index]
-    totFaces = nFaces.sum()
-    faces = np.empty((totFaces, 3), dtype=np.uint32)
-    ptr = 0
-
-    # this helps speed up an indexing operation later on
-    cs = np.array(cutEdges.strides) // cutEdges.itemsize
-    cutEdges = cutEdges.flatten()
-
-    # this, strangely, does not seem to help.
-    # ins = np.array(index.strides)/index.itemsize
-    # index = index.flatten()
-
-    for i in range(1, 6):
-        # expensive:
-        # all cells which require i faces  (argwhere is expensive)
-        cells = np.argwhere(nFaces == i)
-        if cells.shape[0] == 0:
+    # generate vertex positions. Flat indices into cutEdges are sorted, so
+    # vertices are in (x, y, z, axis) order.
+    keys = np.flatnonzero(cutEdges)
+    vertexes = _interpolate_vertices(
+        data, level, np.stack(np.unravel_index(keys // 3, data.shape), axis=1),
+        keys % 3, offset)
+
+    # lookup table of vertex IDs. Only entries for cut edges are ever read.
+    vertexIds = np.empty(cutEdges.size, dtype=np.uint32)
+    vertexIds[keys] = np.arange(len(keys), dtype=np.uint32)
+
+    # compute the set of vertex indexes for each face, taking all cells with
+    # at least one face in a single pass.
+    cells = np.flatnonzero(tables.nTableFaces.take(index))
+    faces = vertexIds.take(_face_keys(cells, index.take(cells), data.shape))
+
+    return vertexes, faces, keys
+
+
+def _parallel_isosurface(data, level, workers):
+    """
+    Extract slabs of `data` in a thread pool and stitch the results.
+
+    Slabs along the first axis overlap by one plane of grid points. Vertices
+    on a shared plane are kept from the later slab, where they come first,
+    so the output is identical to that of a single slab.
+    """
+    bounds = np.linspace(
+        0, data.shape[0] - 1, min(workers, data.shape[0] - 1) + 1)
+    bounds = bounds.astype(np.intp)
+
+    def extract(bound):
+        start, stop = bound
+        return _isosurface(data[start:stop + 1], level, (start, 0, 0))
+
+    pool = ThreadPool(workers)
+    try:
+        results = pool.map(extract, list(zip(bounds[:-1], bounds[1:])))
+    finally:
+        pool.close()
+
+    # vertices in the last plane of each slab belong to the next slab
+    planeSize = 3 * data.shape[1] * data.shape[2]
+    nKeep = [np.searchsorted(keys, (stop - start) * planeSize)
+             for (_, _, keys), start, stop
+             in zip(results[:-1], bounds[:-2], bounds[1:-1])]
+    nKeep.append(len(results[-1][0]))
+    vertexStarts = np.concatenate([[0], np.cumsum(nKeep)])
+
+    vertexes = []
+    faces = []
+    allKeys = []
+    for i, (verts, slabFaces, keys) in enumerate(results):
+        vertexIds = np.empty((len(keys),), dtype=np.uint32)
+        vertexIds[:nKeep[i]] = np.arange(
+            vertexStarts[i], vertexStarts[i + 1])
+        if i < len(results) - 1:
+            # shared vertices have the same key relative to their plane
+            nextKeys = results[i + 1][2]
+            shared = keys[nKeep[i]:] - (bounds[i + 1] - bounds[i]) * planeSize
+            vertexIds[nKeep[i]:] = vertexStarts[i + 1] + np.searchsorted(
+                nextKeys, shared)
+        vertexes.append(verts[:nKeep[i]])
+        faces.append(vertexIds.take(slabFaces))
+        allKeys.append(keys[:nKeep[i]] + bounds[i] * planeSize)
+    return np.concatenate(vertexes), np.concatenate(faces), \
+        np.concatenate(allKeys)
+
+
+def isosurface_levels(data, levels):
+    """
+    Generate isosurfaces of `data` at a number of levels.
+
+    The extrema of each plane of grid points along each axis are found once
+    and shared between levels. Extraction at each level is then restricted to
+    the bounding box of slabs of cells straddling that level, and levels
+    outside the range of `data` are skipped.
+
+    *data*    3D numpy array of scalar values.
+    *levels*  Sequence of levels at which to generate isosurfaces.
+
+    Returns vertices (Nv, 3) and faces (Nf, 3) of all levels, concatenated,
+    and row splits of each, `vertexSplits` and `faceSplits`, with shape
+    (len(levels) + 1,). The mesh at `levels[i]` has vertices
+    `vertexes[vertexSplits[i]:vertexSplits[i+1]]` and faces
+    `faces[faceSplits[i]:faceSplits[i+1]]`, identical to those of
+    `isosurface(data, levels[i])`.
+    """
+    # extrema of the two planes of grid points bounding each slab of cells
+    slabRanges = []
+    if min(data.shape) > 1:
+        for axis in range(3):
+            others = tuple(a for a in range(3) if a != axis)
+            planeMin = data.min(axis=others)
+            planeMax = data.max(axis=others)
+            slabRanges.append((np.minimum(planeMin[:-1], planeMin[1:]),
+                               np.maximum(planeMax[:-1], planeMax[1:])))
+
+    # seeded so that empty `levels` give an empty mesh
+    vertexes = [np.zeros((0, 3), dtype=_vertex_dtype(data))]
+    faces = [np.zeros((0, 3), dtype=np.uint32)]
+    for level in levels:
+        # grids without cells may still have cut edges
+        box = [] if slabRanges else [slice(0, None)] * 3
+        for slabMin, slabMax in slabRanges:
+            slabs = np.flatnonzero((slabMin < level) & (slabMax >= level))
+            if len(slabs) == 0:
+                break
+            box.append(slice(slabs[0], slabs[-1] + 2))
+        if len(box) < 3:
+            vertexes.append(np.zeros((0, 3), dtype=_vertex_dtype(data)))
+            faces.append(np.zeros((0, 3), dtype=np.uint32))
             continue
-        # index values of cells to process for this round
-        cellInds = index[cells[:, 0], cells[:, 1], cells[:, 2]]
-        # profiler()
-
-        # expensive:
-        verts = faceShiftTables[i][cellInds]
-        np.add(verts[..., :3], cells[:, np.newaxis, np.newaxis, :],
-               out=verts[..., :3], casting='unsafe')
-        verts = verts.reshape((verts.shape[0] * i,) + verts.shape[2:])
-
-        # expensive:
-        verts = (verts * cs[np.newaxis, np.newaxis, :]).sum(axis=2)
-        vertInds = cutEdges[verts]
-        nv = vertInds.shape[0]
-        faces[ptr:ptr + nv] = vertInds
-        ptr += nv
-
-    return vertexes, faces
+        verts, fcs, _ = _isosurface(
+            data[tuple(box)], level, [b.start for b in box])
+        vertexes.append(verts)
+        faces.append(fcs)
+
+    vertexSplits = np.cumsum([len(v) for v in vertexes])
+    faceSplits = np.cumsum([len(f) for f in faces])
+    return np.concatenate(vertexes), np.concatenate(faces), vertexSplits, \
+        faceSplits
+
+
+def minmax(data, chunk_size=2**17):
+    """
+    Get the minimum and maximum of `data` in a single pass over memory.
+
+    Separate `np.min` and `np.max` calls each read all of `data`. Here both
+    are computed over chunks of about `chunk_size` elements along the first
+    axis, so each chunk is still in cache for the second reduction.
+
+    *data*        numpy array with at least one element. May have any
+                  strides.
+    *chunk_size*  Approximate number of elements per chunk.
+
+    Returns `(min, max)` as numpy scalars.
+    """
+    data = np.atleast_1d(data)
+    step = max(1, chunk_size // max(1, data[0].size))
+    mins = []
+    maxs = []
+    for start in range(0, len(data), step):
+        chunk = data[start:start + step]
+        mins.append(chunk.min())
+        maxs.append(chunk.max())
+    return min(mins), max(maxs)
+
+
+def _brick_reduce(ufunc, data, brick_size, axis):
+    """Reduce `data` along `axis` over bricks of `brick_size` cells."""
+    n = data.shape[axis] - 1
+    if n < 1:
+        # no cells, so no bricks
+        return np.take(data, [], axis=axis)
+    starts = np.arange(0, n, brick_size)
+    reduced = ufunc.reduceat(data, starts, axis=axis)
+    # cells [s, s + brick_size) also have corners at s + brick_size
+    ends = np.minimum(starts + brick_size, n)
+    return ufunc(reduced, np.take(data, ends, axis=axis))
+
+
+class MinMaxPyramid(object):
+    """
+    Hierarchy of min/max values over bricks of cells of a volume.
+
+    The finest level holds the min/max of the data over bricks of
+    `brick_size`**3 cells (including the far corners of each cell). Each
+    coarser level combines 2x2x2 blocks of the level below, up to a single
+    root. Building the pyramid costs one pass over the volume, after which
+    the cells straddling any level can be found by descending only into
+    blocks whose range includes that level.
+
+    Reuse a pyramid when extracting many levels from the same volume, e.g.
+    `isosurface(data, level, pyramid=pyramid)`.
+    """
+
+    def __init__(self, data, brick_size=8):
+        self.shape = data.shape
+        self.brick_size = brick_size
+        mins = maxs = data
+        for axis in range(3):
+            mins = _brick_reduce(np.minimum, mins, brick_size, axis)
+            maxs = _brick_reduce(np.maximum, maxs, brick_size, axis)
+        self.mins = [mins]
+        self.maxs = [maxs]
+        while mins.size > 1:
+            for axis in range(3):
+                starts = np.arange(0, mins.shape[axis], 2)
+                mins = np.minimum.reduceat(mins, starts, axis=axis)
+                maxs = np.maximum.reduceat(maxs, starts, axis=axis)
+            self.mins.append(mins)
+            self.maxs.append(maxs)
+
+    def active_bricks(self, level):
+        """Get (N, 3) coordinates of finest bricks whose range has `level`."""
+        if self.mins[0].size == 0:
+            return np.zeros((0, 3), dtype=np.intp)
+        offsets = np.stack(
+            np.meshgrid([0, 1], [0, 1], [0, 1], indexing='ij'),
+            axis=-1).reshape(-1, 3)
+        # start from the root, descending into children of active blocks
+        blocks = np.zeros((1, 3), dtype=np.intp)
+        for i in range(len(self.mins) - 1, -1, -1):
+            mins, maxs = self.mins[i], self.maxs[i]
+            if i < len(self.mins) - 1:
+                blocks = (blocks[:, np.newaxis] * 2 + offsets).reshape(-1, 3)
+                blocks = blocks[np.all(blocks < mins.shape, axis=1)]
+            b = tuple(blocks.T)
+            blocks = blocks[(mins[b] < level) & (maxs[b] >= level)]
+        return blocks
+
+    def active_cells(self, level):
+        """
+        Get (N, 3) coordinates of cells in bricks whose range has `level`.
+
+        Not all returned cells straddle `level` themselves, and some may lie
+        beyond the grid where it does not divide evenly into bricks.
+        """
+        r = np.arange(self.brick_size)
+        offsets = np.stack(np.meshgrid(r, r, r, indexing='ij'), axis=-1)
+        cells = self.active_bricks(level)[:, np.newaxis] * self.brick_size + \
+            offsets.reshape(-1, 3)
+        return cells.reshape(-1, 3)
+
+
+def sparse_isosurface(data, level, active_cells=None, brick_size=8):
+    """
+    Generate isosurface using only the cells which straddle `level`.
+
+    *data*          3D numpy array of scalar values. May have any strides.
+    *level*         The level at which to generate an isosurface
+    *active_cells*  Optional (N, 3) integer array of candidate cell
+                    coordinates, e.g. the narrow band of an SDF. Cells which
+                    are outside the grid or do not straddle `level` are
+                    ignored. If None, candidates are found using a coarse
+                    min/max pass over bricks of cells.
+    *brick_size*    Number of cells along each dimension of the bricks used to
+                    find candidate cells. Ignored if `active_cells` is given.
+                    See `MinMaxPyramid` to reuse bricks between levels.
+
+    Returns the same vertices and faces as `isosurface`, though faces may be
+    in a different order. Rather than evaluating cube indices and edge cuts
+    over the entire grid, only active cells are processed, so memory usage
+    scales with the surface area rather than the volume. If bricks are used
+    and more than `DenseBrickFraction` of them are active, the dense
+    `isosurface` is faster and is used instead.
+    """
+    return _sparse_isosurface(data, level, active_cells, brick_size)[:2]
+
+
+# Fraction of active bricks above which dense extraction is faster than
+# gathering the corners of each active brick.
+DenseBrickFraction = 0.25
+
+
+def _sparse_isosurface(data, level, active_cells=None, brick_size=8,
+                       pyramid=None):
+    """
+    Sparse marching cubes, as `sparse_isosurface`.
+
+    *pyramid*  Optional `MinMaxPyramid` of `data`, used to find active bricks
+               if `active_cells` is None.
+
+    Returns vertices and faces as for `sparse_isosurface`, along with the flat
+    (x, y, z, axis) index of each vertex's edge.
+    """
+    if any(x < 2 for x in data.shape):
+        # no cells, though there may still be cut edges
+        return _isosurface(data, level)
+
+    if active_cells is None:
+        if pyramid is None:
+            pyramid = MinMaxPyramid(data, brick_size)
+        bricks = pyramid.active_bricks(level)
+        if len(bricks) > DenseBrickFraction * pyramid.mins[0].size:
+            return _isosurface(data, level)
+        cells, index = _brick_cell_indices(
+            data, level, bricks, pyramid.brick_size)
+    else:
+        cells, index = _cell_indices(data, level, active_cells)
+
+    # identify edges shared between cells by their flat index into an
+    # (x, y, z, axis) grid of edges
+    keys = _face_keys(cells, index, data.shape)
+    keys, faces = _unique(keys, return_inverse=True)
+    faces = faces.reshape(-1, 3).astype(np.uint32)
+
+    # interpolate to see where exactly each edge is cut
+    vertexes = _interpolate_vertices(
+        data, level, np.stack(np.unravel_index(keys // 3, data.shape), axis=1),
+        keys % 3)
+
+    return vertexes, faces, keys
+
+
+def _unique(values, return_inverse=False):
+    """
+    Sorted unique values of an integer array, as `np.unique`.
+
+    Neighbours of sorted values are compared rather than hashing values,
+    which is many times faster for large arrays of flat indices.
+    """
+    flat = values.ravel()
+    if return_inverse:
+        order = np.argsort(flat, kind='stable')
+        ordered = flat[order]
+    else:
+        ordered = np.sort(flat)
+    first = np.ones(ordered.shape, dtype=bool)
+    np.not_equal(ordered[1:], ordered[:-1], out=first[1:])
+    unique = ordered[first]
+    if not return_inverse:
+        return unique
+    inverse = np.empty(flat.shape, dtype=np.intp)
+    inverse[order] = np.cumsum(first) - 1
+    return unique, inverse.reshape(values.shape)
+
+
+def _brick_cell_indices(data, level, bricks, brick_size):
+    """
+    Get cells of the given bricks which straddle `level`.
+
+    The corners of each brick are gathered as one block, from which cube
+    indices are computed by slicing, so each grid point is read about once
+    per brick rather than once per cell corner. Bricks are disjoint, so
+    cells need no deduplication.
+
+    *data*        3D numpy array of scalar values.
+    *level*       The level of the isosurface.
+    *bricks*      (N, 3) integer array of brick coordinates.
+    *brick_size*  Number of cells along each dimension of a brick.
+
+    Returns flat indices of straddling cells into `data`, in brick order, and
+    their cube indices.
+    """
+    dataFlat, ds, origin = _flat_data(data)
+    r = np.arange(brick_size + 1)
+    starts = bricks * brick_size
+    # coordinates of brick corners along each axis, clipped to the grid
+    coords = [np.minimum(starts[:, a, np.newaxis] + r, data.shape[a] - 1)
+              for a in range(3)]
+    flat = origin + \
+        (coords[0] * ds[0])[:, :, np.newaxis, np.newaxis] + \
+        (coords[1] * ds[1])[:, np.newaxis, :, np.newaxis] + \
+        (coords[2] * ds[2])[:, np.newaxis, np.newaxis, :]
+    maskBytes = (dataFlat[flat] < level).view(np.ubyte)
+
+    index = np.zeros((len(bricks),) + (brick_size,) * 3, dtype=np.ubyte)
+    slices = [slice(0, -1), slice(1, None)]
+    for i in [0, 1]:
+        for j in [0, 1]:
+            for k in [0, 1]:
+                # this is just to match Bourk's vertex numbering scheme
+                vertIndex = i - 2 * j * i + 3 * j + 4 * k
+                np.bitwise_or(
+                    index,
+                    maskBytes[:, slices[i], slices[j], slices[k]] <<
+                    vertIndex, out=index)
+    # cells beyond the far side of the grid, with clipped corners, are empty
+    for a in range(3):
+        outside = starts[:, a, np.newaxis] + r[:-1] >= data.shape[a] - 1
+        shape = [len(bricks), 1, 1, 1]
+        shape[a + 1] = brick_size
+        index[np.broadcast_to(outside.reshape(shape), index.shape)] = 0
+
+    active = np.flatnonzero(tables.nTableFaces.take(index))
+    b, x, y, z = np.unravel_index(active, index.shape)
+    cells = np.ravel_multi_index(
+        (starts[b, 0] + x, starts[b, 1] + y, starts[b, 2] + z), data.shape)
+    return cells, index.ravel()[active]
+
+
+def _cell_indices(data, level, active_cells):
+    """
+    Get cells of `active_cells` which straddle `level`.
+
+    *data*          3D numpy array of scalar values.
+    *level*         The level of the isosurface.
+    *active_cells*  (N, 3) integer array of candidate cell coordinates.
+                    Duplicates and cells outside the grid are ignored.
+
+    Returns sorted flat indices of straddling cells into `data`, and their
+    cube indices.
+    """
+    cells = np.asarray(active_cells).reshape(-1, 3)
+    # negative coordinates wrap to large unsigned values
+    cells = cells[np.all(
+        cells.astype(np.uintp) < np.array(data.shape, dtype=np.uintp) - 1,
+        axis=1)]
+    # remove duplicates and sort cells, using flat indices into the grid
+    cells = _unique(np.ravel_multi_index(cells.T, data.shape))
+
+    dataFlat, ds, origin = _flat_data(data)
+
+    # compute indexes of candidate cells from their eight corners
+    cellOffsets = origin + np.stack(
+        np.unravel_index(cells, data.shape), axis=1).dot(ds)
+    index = np.zeros(cells.shape, dtype=np.ubyte)
+    for i in [0, 1]:
+        for j in [0, 1]:
+            for k in [0, 1]:
+                # this is just to match Bourk's vertex numbering scheme
+                vertIndex = i - 2 * j * i + 3 * j + 4 * k
+                m = dataFlat[cellOffsets + np.dot([i, j, k], ds)] < level
+                np.add(index, m * 2 ** vertIndex, out=index, casting='unsafe')
+    active = (index != 0) & (index != 255)
+    return cells[active], index[active]
@@ -0,0 +1,208 @@
+"""
+Numba-compiled marching cubes.
+
+Produces exactly the same output as `np_impl.isosurface`, falling back to it
+if numba is not installed.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+from . import np_impl
+from . import tables
+
+try:
+    import numba
+    _prange = numba.prange
+except ImportError:
+    numba = None
+    _prange = range
+
+
+def _jit(**kwargs):
+    """`numba.njit`, or a no-op if numba is not installed."""
+    if numba is None:
+        return lambda fn: fn
+    return numba.njit(**kwargs)
+
+
+@_jit()
+def _face_index(mask, x, y, z):
+    """
+    Get the cube index bits of the four corners (x + i, y + j, z).
+
+    The index of cell (x, y, z) is then `_face_index(mask, x, y, z) |
+    _face_index(mask, x, y, z + 1) << 4`, matching Bourk's vertex numbering.
+    """
+    return (mask[x, y, z] | mask[x + 1, y, z] << 1 |
+            mask[x + 1, y + 1, z] << 2 | mask[x, y + 1, z] << 3)
+
+
+@_jit(parallel=True)
+def _count(mask, nTableFaces, nVerts, nFaces):
+    """Count the vertices and faces originating in each x-plane."""
+    nx, ny, nz = mask.shape
+    for x in _prange(nx):
+        nv = 0
+        nf = 0
+        for y in range(ny):
+            for z in range(nz):
+                m = mask[x, y, z]
+                if x < nx - 1 and m != mask[x + 1, y, z]:
+                    nv += 1
+                if y < ny - 1 and m != mask[x, y + 1, z]:
+                    nv += 1
+                if z < nz - 1 and m != mask[x, y, z + 1]:
+                    nv += 1
+        if x < nx - 1:
+            for y in range(ny - 1):
+                lower = _face_index(mask, x, y, 0)
+                for z in range(nz - 1):
+                    upper = _face_index(mask, x, y, z + 1)
+                    nf += nTableFaces[lower | upper << 4]
+                    lower = upper
+        nVerts[x] = nv
+        nFaces[x] = nf
+
+
+@_jit()
+def _plane_vertices(mask, values, level, x, vertexId, ids, vertexes, write,
+                    transform, transformed):
+    """
+    Assign IDs to vertices originating in x-plane `x`.
+
+    Vertex positions are only computed if `write` is True, so each vertex is
+    interpolated once even when its plane is shared between slabs. If
+    `transformed`, positions are mapped by the (3, 4) `transform`.
+    """
+    nx, ny, nz = mask.shape
+    for y in range(ny):
+        for z in range(nz):
+            m = mask[x, y, z]
+            for axis in range(3):
+                if axis == 0:
+                    if x == nx - 1 or m == mask[x + 1, y, z]:
+                        continue
+                    v2 = values[x + 1, y, z]
+                elif axis == 1:
+                    if y == ny - 1 or m == mask[x, y + 1, z]:
+                        continue
+                    v2 = values[x, y + 1, z]
+                else:
+                    if z == nz - 1 or m == mask[x, y, z + 1]:
+                        continue
+                    v2 = values[x, y, z + 1]
+                ids[y, z, axis] = vertexId
+                if write:
+                    v1 = values[x, y, z]
+                    vertexes[vertexId, 0] = x
+                    vertexes[vertexId, 1] = y
+                    vertexes[vertexId, 2] = z
+                    vertexes[vertexId, axis] += (level - v1) / (v2 - v1)
+                    if transformed:
+                        _transform_vertex(vertexes, vertexId, transform)
+                vertexId += 1
+
+
+@_jit()
+def _transform_vertex(vertexes, vertexId, transform):
+    """Map a vertex in place, in the same order as `np_impl`."""
+    p0 = vertexes[vertexId, 0]
+    p1 = vertexes[vertexId, 1]
+    p2 = vertexes[vertexId, 2]
+    for a in range(3):
+        out = transform[a, 3] + p0 * transform[a, 0]
+        out += p1 * transform[a, 1]
+        out += p2 * transform[a, 2]
+        vertexes[vertexId, a] = out
+
+
+@_jit(parallel=True)
+def _extract(mask, values, level, faceShifts, faceOffsets, vertexStarts,
+             faceStarts, slabs, transform, transformed, vertexes, faces):
+    """Extract vertices and faces of each slab of cells in parallel."""
+    nx, ny, nz = mask.shape
+    for s in _prange(len(slabs) - 1):
+        x0 = slabs[s]
+        x1 = slabs[s + 1]
+        # vertex IDs of the current and next x-planes
+        ids0 = np.empty((ny, nz, 3), dtype=np.uint32)
+        ids1 = np.empty((ny, nz, 3), dtype=np.uint32)
+        _plane_vertices(
+            mask, values, level, x0, vertexStarts[x0], ids0, vertexes, True,
+            transform, transformed)
+        faceId = faceStarts[x0]
+        for x in range(x0, x1):
+            # the first plane of the next slab is written by that slab
+            _plane_vertices(
+                mask, values, level, x + 1, vertexStarts[x + 1], ids1,
+                vertexes, x + 1 < x1 or x1 == nx - 1, transform, transformed)
+            for y in range(ny - 1):
+                lower = _face_index(mask, x, y, 0)
+                for z in range(nz - 1):
+                    upper = _face_index(mask, x, y, z + 1)
+                    index = lower | upper << 4
+                    lower = upper
+                    for f in range(faceOffsets[index], faceOffsets[index + 1]):
+                        for k in range(3):
+                            shift = faceShifts[f, k]
+                            ids = ids0 if shift[0] == 0 else ids1
+                            faces[faceId, k] = ids[
+                                y + shift[1], z + shift[2], shift[3]]
+                        faceId += 1
+            ids0, ids1 = ids1, ids0
+
+
+def isosurface(data, level, slabs_per_thread=4, spacing=None, origin=None,
+               affine=None):
+    """
+    Generate isosurface from volumetric data using marching cubes algorithm.
+
+    Compiled equivalent of `np_impl.isosurface`, making a single pass over
+    cells with each vertex computed once. Slabs of cells along the first
+    axis are processed in parallel.
+
+    *data*              3D numpy array of scalar values.
+    *level*             The level at which to generate an isosurface
+    *slabs_per_thread*  Number of slabs per numba thread.
+    *spacing*, *origin*, *affine*  Optional transform from grid indices to
+                        vertex positions, as in `np_impl.isosurface`. It is
+                        applied as each vertex is written.
+
+    Returns an array of vertex coordinates (Nv, 3) and an array of
+    per-face vertex indexes (Nf, 3), identical to those of
+    `np_impl.isosurface`. If numba is not installed, `np_impl.isosurface` is
+    used.
+    """
+    if numba is None:
+        return np_impl.isosurface(
+            data, level, spacing=spacing, origin=origin, affine=affine)
+    transform = np_impl._affine(spacing, origin, affine)
+    transformed = transform is not None
+    if not transformed:
+        transform = np.zeros((3, 4))
+    # match dtypes of intermediate values in np_impl
+    mask = (data < level).view(np.uint8)
+    dtype = np_impl._vertex_dtype(data)
+    values = data if data.dtype == dtype else data.astype(dtype)
+    level = (level - np.zeros((1,), dtype=dtype))[0]
+
+    nx = data.shape[0]
+    nVerts = np.empty((nx,), dtype=np.int64)
+    nFaces = np.empty((nx,), dtype=np.int64)
+    _count(mask, tables.nTableFaces, nVerts, nFaces)
+    vertexStarts = np.concatenate([[0], np.cumsum(nVerts)])
+    faceStarts = np.concatenate([[0], np.cumsum(nFaces)])
+
+    vertexes = np.empty((vertexStarts[-1], 3), dtype=dtype)
+    faces = np.empty((faceStarts[-1], 3), dtype=np.uint32)
+    nSlabs = max(1, min(nx - 1, slabs_per_thread * numba.get_num_threads()))
+    slabs = np.linspace(0, nx - 1, nSlabs + 1).astype(np.int64)
+    _extract(
+        mask, values, level, tables.faceShifts, tables.faceOffsets,
+        vertexStarts, faceStarts, slabs, transform, transformed, vertexes,
+        faces)
+    if transformed:
+        faces = np_impl._transform_faces(faces, transform)
+    return vertexes, faces
@@ -0,0 +1,72 @@
+"""
+Numpy helpers around `skimage.measure` used by `wrapped`.
+
+skimage is imported on first use, and this module does not import
+tensorflow, so worker processes of `wrapped.batch_marching_cubes_lewiner`
+do not import it on its account. Spawned workers still re-import the
+caller's `__main__` module, and everything it imports.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from .np_impl import minmax
+
+
+def _measure():
+    """Import `skimage.measure` on first use."""
+    from skimage import measure
+    return measure
+
+
+def _marching_cubes_classic(volume, level, **kwargs):
+    """`skimage.measure.marching_cubes_classic`, returning (verts, faces)."""
+    measure = _measure()
+    if hasattr(measure, 'marching_cubes_classic'):
+        return measure.marching_cubes_classic(volume, level, **kwargs)
+    # removed in skimage 0.19 in favour of `marching_cubes(method='lorensen')`
+    return measure.marching_cubes(
+        volume, level, method='lorensen', **kwargs)[:2]
+
+
+def _marching_cubes_lewiner(volume, level, **kwargs):
+    """`skimage.measure.marching_cubes_lewiner`."""
+    measure = _measure()
+    # `marching_cubes_lewiner` was merged into `marching_cubes` in skimage 0.19
+    fn = getattr(measure, 'marching_cubes_lewiner', None) or \
+        measure.marching_cubes
+    return fn(volume, level=level, **kwargs)
+
+
+def _lewiner(vol, level, **kwargs):
+    """Numpy implementation of `marching_cubes_lewiner` for a single volume."""
+    volMin, volMax = minmax(vol)
+    if volMin < level < volMax:
+        verts, faces, normals, values = _marching_cubes_lewiner(
+            vol, level, **kwargs)
+        verts = verts.astype(np.float32, copy=False)
+        faces = faces.astype(np.int32, copy=False)
+        normals = normals.astype(np.float32, copy=False)
+        values = values.astype(np.float32, copy=False)
+        empty = False
+    else:
+        verts = np.zeros(shape=(0, 3), dtype=np.float32)
+        faces = np.zeros(shape=(0, 3), dtype=np.int32)
+        normals = np.zeros(shape=(0, 3), dtype=np.float32)
+        values = np.zeros(shape=(0,), dtype=np.float32)
+        empty = True
+    return verts, faces, normals, values, empty
+
+
+def _lewiner_worker(name, shape, dtype, index, level, kwargs):
+    """Extract the mesh of volume `index` of a shared memory batch."""
+    shm = SharedMemory(name=name)
+    try:
+        vol = np.ndarray(shape, dtype=dtype, buffer=shm.buf)[index]
+        verts, faces = _lewiner(vol, level, **kwargs)[:2]
+        del vol
+    finally:
+        shm.close()
+    return verts, faces
@@ -0,0 +1,165 @@
+"""
+Marching cubes and marching squares lookup tables.
+
+Generated by `make_tables.py`, do not edit.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+
+def _unpack(hexData, dtype, shape):
+    return np.frombuffer(bytes.fromhex(hexData), dtype=dtype).reshape(shape)
+
+
+# marching cubes: cut edges by cube index
+edgeTable = _unpack(
+    '0000090103020a0306040f0505060c070c0805090f0a060b0a0c030d090e000f'
+    '9001990093039a0296059f0495079c069c0995089f0b960a9a0d930c990f900e'
+    '3002390333003a0136063f0735043c053c0a350b3f0836093a0e330f390c300d'
+    'a003a902a301aa00a607af06a505ac04ac0ba50aaf09a608aa0fa30ea90da00c'
+    '6004690563066a0766006f0165026c036c0c650d6f0e660f6a086309690a600b'
+    'f005f904f307fa06f601ff00f503fc02fc0df50cff0ff60efa09f308f90bf00a'
+    '5006590753045a0556025f0355005c015c0e550f5f0c560d5a0a530b59085009'
+    'c007c906c305ca04c603cf02c501cc00cc0fc50ecf0dc60cca0bc30ac909c008'
+    'c008c909c30aca0bc60ccf0dc50ecc0fcc00c501cf02c603ca04c305c906c007'
+    '50095908530b5a0a560d5f0c550f5c0e5c0155005f0356025a05530459075006'
+    'f00af90bf308fa09f60eff0ff50cfc0dfc02f503ff00f601fa06f307f904f005'
+    '600b690a63096a08660f6f0e650d6c0c6c0365026f0166006a07630669056004'
+    'a00ca90da30eaa0fa608af09a50aac0bac04a505af06a607aa00a301a902a003'
+    '300d390c330f3a0e36093f08350b3c0a3c0535043f0736063a01330039033002'
+    '900e990f930c9a0d960a9f0b95089c099c0695079f0496059a02930399009001'
+    '000f090e030d0a0c060b0f0a05090c080c0705060f0506040a03030209010000',
+    '<u2', (256,))
+
+
+# maps edge ID (0-11) to (x,y,z) cell offset and edge ID (0-2)
+edgeShifts = _unpack(
+    '0000000000000000010000000000010000000100000000000000000000000100'
+    '0000000001000000010000000100010000000100010000000000000001000100'
+    '0000000000000200010000000000020001000100000002000000010000000200',
+    '<u2', (12, 4))
+
+
+# number of faces by cube index
+nTableFaces = _unpack(
+    '0001010201020203010202030203030201020203020303040203030403040403'
+    '0102020302030304020303040304040302030302030404030304040304050502'
+    '0102020302030304020303040304040302030304030404050304040504050504'
+    '0203030403040203030404050405030203040403040503020405050405020401'
+    '0102020302030304020303040304040302030304030404050302040304030502'
+    '0203030403040405030404050405050403040403040505040403050205040201'
+    '0203030403040405030404050203030203040405040505020403050403020401'
+    '0304040504050304040505020304020102030302030402010302040102010100',
+    '|u1', (256,))
+
+
+# edge IDs of the faces of all cube indices, concatenated
+faceEdges = _unpack(
+    '00080300010901080309080101020a00080301020a09020a000209020803020a'
+    '080a0908030b02000b02080b0001090002030b010b0201090b09080b030a010b'
+    '0a03000a0100080a080b0a030900030b090b0a0909080a0a080b040708040300'
+    '07030400010908040704010904070107030101020a0804070304070300040102'
+    '0a09020a090002080407020a09020907020703070904080407030b020b04070b'
+    '020402000409000108040702030b04070b09040b090b02090201030a01030b0a'
+    '070804010b0a01040b010004070b0404070809000b090b0a0b000304070b040b'
+    '09090b0a09050409050400080300050401050008050408030503010501020a09'
+    '050403000801020a04090505020a050402040002020a05030205030504030408'
+    '09050402030b000b0200080b04090500050400010502030b0201050205080208'
+    '0b0408050a030b0a0103090504040905000801080a01080b0a05040005000b05'
+    '0b0a0b000305040805080a0a080b090708050709090300090503050703000708'
+    '0001070105070105030305070907080905070a01020a01020905000503000507'
+    '030800020802050805070a0502020a05020503030507070905070809030b0209'
+    '050709070209020002070b02030b0001080107080105070b02010b0107070105'
+    '0905080805070a01030a030b050700050009070b0001000a0b0a000b0a000b00'
+    '030a05000800070507000b0a05070b050a0605000803050a06090001050a0601'
+    '0803010908050a06010605020601010605010206030008090605090006000206'
+    '05090805080205020603020802030b0a06050b00080b02000a06050001090203'
+    '0b050a06050a06010902090b0209080b06030b06050305010300080b000b0500'
+    '0501050b06030b0600030600060500050906050906090b0b0908050a06040708'
+    '04030004070306050a010900050a060804070a06050109070107030709040601'
+    '0206050104070801020505020603000403040708040709000500060500020607'
+    '0309070904030209050906020609030b020708040a0605050a06040702040200'
+    '02070b00010904070802030b050a06090201090b0209040b070b04050a060804'
+    '07030b05030501050b0605010b050b0601000b070b0400040b00050900060500'
+    '03060b060308040706050906090b040709070b090a040906040a040a0604090a'
+    '0008030a00010a060006040008030108010608060406010a0104090102040206'
+    '040300080102090204090206040002040402060803020802040402060a04090a'
+    '06040b020300080202080b04090a040a06030b0200010600060406010a060401'
+    '06010a04080102010b080b010906040903060901030b0603080b010801000b06'
+    '01090104060401030b060306000006040604080b0608070a0607080a08090a00'
+    '0703000a0700090a06070a0a0607010a070107080108000a06070a0701010703'
+    '0102060106080108090806070206090209010607090009030703090708000700'
+    '0606000207030206070202030b0a06080a080908060702000702070b00090706'
+    '070a090a07010800010708010a0706070a02030b0b02010b01070a0601060701'
+    '0809060806070901060b06030103060009010b0607070800070006030b000b06'
+    '00070b0607060b0300080b07060001090b07060801090803010b07060a010206'
+    '0b0701020a030008060b07020900020a09060b07060b07020a030a08030a0908'
+    '0702030602070700080706000602000207060203070001090106020108060109'
+    '080807060a07060a01070103070a070601070a01080701000800030700070a00'
+    '0a09060a0707060a070a08080a090608040b080603060b03000600040608060b'
+    '0804060900010904060906030903010b0306060804060b08020a0101020a0300'
+    '0b00060b000406040b0804060b000209020a090a09030a03020904030b030604'
+    '0603080203080402040602000402040602010900020304020406040308010904'
+    '010402020406080103080601080406060a010a01000a00060600040406030403'
+    '08060a030003090a09030a0904060a0404090507060b0008030409050b070605'
+    '000105040007060b0b07060803040305040301050905040a010207060b060b07'
+    '01020a00080304090507060b05040a04020a0400020304080305040302050a05'
+    '020b070607020307060205040909050400080600060206080703060203070601'
+    '05000504000602080608070201080408050105080905040a0106010706010307'
+    '01060a01070601000708070009050404000a040a0500030a060a0703070a0706'
+    '0a070a0805040a04080a060905060b090b080903060b00060300050600090500'
+    '0b0800050b00010505060b060b0306030505030101020a09050b090b080b0506'
+    '000b0300060b00090605060901020a0b08050b05060800050a0502000205060b'
+    '03060305020a030a050305080905020805060203080209050609060000060201'
+    '050801080005060803080206020801050602010601030601060a030806050609'
+    '0809060a01000a000609050005060000030805060a0a05060b050a07050b0b05'
+    '0a0b0705080300050b07050a0b0109000a07050a0b070908010803010b01020b'
+    '070107050100080301020701070507020b090705090207090002020b07070502'
+    '07020b05090203020809080202050a0203050307050802000805020807050a02'
+    '05090001050a03050307030a020908020902010807020a020507050201030503'
+    '0705000807000701010705090003090305050307090807050907050804050a08'
+    '0a0b08050004050b00050a0b0b030000010908040a080a0b0a04050a0b040a04'
+    '050b0304090401030104020501020805020b0804050800040b000b0304050b02'
+    '0b0105010b000205000509020b050405080b0805090405020b0302050a030502'
+    '030405030804050a02050204040200030a0203050a030805040508000109050a'
+    '0205020401090209040208040508050303050100040501000508040508050309'
+    '0005000305090405040b0704090b090a0b000803040907090b07090a0b010a0b'
+    '010b0401040007040b030104030408010a0407040b0a0b04040b07090b040902'
+    '0b090102090704090b0709010b020b010008030b07040b04020204000b07040b'
+    '040208030403020402090a020709020307070409090a070907040a0207080700'
+    '02000703070a030a0207040a010a0004000a010a020807040409010401070701'
+    '03040901040107000801080701040003070403040807090a080a0b0803000903'
+    '090b0b090a00010a000a08080a0b03010a0b030a01020b010b09090b08030009'
+    '03090b010209020b0900020b08000b03020b02030802080a0a0809090a020009'
+    '0202030802080a000108010a08010a02010308090108000901000308',
+    '|u1', (820, 3))
+
+
+# marching squares: maps edge ID (0-3) to (x,y) offset and axis
+segmentEdgeShifts = _unpack(
+    '000000000000010000000100000001000000000000000100',
+    '<u2', (4, 3))
+
+
+# number of segments by square index
+nTableSegments = _unpack(
+    '00010101010201010101020101010100',
+    '|u1', (16,))
+
+
+# edge IDs of the segments of all square indices, concatenated
+segmentEdges = _unpack(
+    '0003010001030201000102030200020303020002030001020102030100010300',
+    '|u1', (16, 2))
+
+
+# Faces of cube index i are rows faceOffsets[i]:faceOffsets[i + 1] of
+# faceEdges, or of faceShifts giving the (x,y,z) cell offset and edge ID of
+# each face vertex. Segments of square indices are stored likewise.
+faceOffsets = np.pad(np.cumsum(nTableFaces, dtype=np.int32), (1, 0))
+faceShifts = edgeShifts[faceEdges]
+segmentOffsets = np.pad(np.cumsum(nTableSegments, dtype=np.int32), (1, 0))
+segmentShifts = segmentEdgeShifts[segmentEdges]
@@ -0,0 +1,92 @@
+"""`numba_impl.isosurface` must match `np_impl.isosurface` bit-for-bit."""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from .. import np_impl
+from .. import numba_impl
+
+data_dir = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    'example', 'data')
+data_paths = sorted(glob.glob(os.path.join(data_dir, '*.npy')))
+
+
+def _smooth(voxels):
+    """Blur voxels so vertices are not all at edge midpoints."""
+    data = voxels.astype(np.float64)
+    for axis in range(3):
+        data = (np.roll(data, 1, axis) + 2 * data +
+                np.roll(data, -1, axis)) / 4
+    return data
+
+
+def _volumes():
+    for path in data_paths:
+        voxels = np.load(path)
+        name = os.path.basename(path)
+        yield name + '-float32', voxels.astype(np.float32), 0.5
+        yield name + '-smooth64', _smooth(voxels), 0.3
+        yield name + '-smooth32', _smooth(voxels).astype(np.float32), 0.3
+
+
+volumes = list(_volumes())
+volume_ids = [v[0] for v in volumes]
+
+
+def _assert_identical(actual, expected):
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert a.dtype == e.dtype
+        np.testing.assert_array_equal(a, e)
+
+
+def test_data_found():
+    assert len(data_paths) > 0
+
+
+@pytest.mark.parametrize('name,data,level', volumes, ids=volume_ids)
+@pytest.mark.parametrize('slabs_per_thread', [1, 4, 64])
+def test_matches_np_impl(name, data, level, slabs_per_thread):
+    expected = np_impl.isosurface(data, level)
+    actual = numba_impl.isosurface(
+        data, level, slabs_per_thread=slabs_per_thread)
+    _assert_identical(actual, expected)
+
+
+@pytest.mark.parametrize('name,data,level', volumes, ids=volume_ids)
+def test_strided_matches_np_impl(name, data, level):
+    data = np.asfortranarray(data[::-1, :, ::2])
+    _assert_identical(
+        numba_impl.isosurface(data, level), np_impl.isosurface(data, level))
+
+
+@pytest.mark.parametrize('name,data,level', volumes, ids=volume_ids)
+@pytest.mark.parametrize('kwargs', [
+    dict(spacing=(0.5, 0.5, 2.5), origin=(1, -2, 3)),
+    # mirrored, so faces are rewound
+    dict(affine=np.diag([-1., 1., 2., 1.]))])
+def test_transform_matches_np_impl(name, data, level, kwargs):
+    _assert_identical(
+        numba_impl.isosurface(data, level, **kwargs),
+        np_impl.isosurface(data, level, **kwargs))
+
+
+@pytest.mark.parametrize('name,data,level', volumes, ids=volume_ids)
+def test_numpy_fallback(name, data, level, monkeypatch):
+    monkeypatch.setattr(numba_impl, 'numba', None)
+    _assert_identical(
+        numba_impl.isosurface(data, level), np_impl.isosurface(data, level))
+
+
+@pytest.mark.parametrize('shape', [(1, 5, 6), (5, 1, 6), (5, 6, 1), (2, 2, 2)])
+def test_small_grids(shape):
+    data = np.random.RandomState(0).randn(*shape).astype(np.float32)
+    _assert_identical(
+        numba_impl.isosurface(data, 0.1), np_impl.isosurface(data, 0.1))
@@ -0,0 +1,86 @@
+"""Gradient checks of `tf_impl.isosurface` vertices."""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from .. import np_impl  # noqa: E402
+from .. import tf_impl  # noqa: E402
+
+
+def _ellipsoid(shape=(12, 10, 14)):
+    x, y, z = (np.linspace(-1, 1, n) for n in shape)
+    x, y, z = np.meshgrid(x, y, z, indexing='ij')
+    return x ** 2 + 1.3 * y ** 2 + z ** 2 + 0.1 * np.sin(5 * x) * y
+
+
+def _cut_edges(data, level):
+    """Start and end points of every cut edge of `data`."""
+    edges = np_impl.isosurface(data, level, return_edges=True)[2]
+    vi1 = edges[:, :3].astype(np.int32)
+    vi2 = vi1 + np.eye(3, dtype=np.int32)[edges[:, 3]]
+    return vi1, vi2
+
+
+def test_edge_weights_gradient():
+    data = _ellipsoid()
+    level = 0.5
+    vi1, vi2 = _cut_edges(data, level)
+    levels = np.full((len(vi1),), level)
+
+    def fn(data, levels):
+        return tf_impl._edge_weights(data, levels, vi1, vi2)
+
+    theoretical, numerical = tf.test.compute_gradient(
+        fn, [tf.constant(data), tf.constant(levels)], delta=1e-6)
+    for t, n in zip(theoretical, numerical):
+        np.testing.assert_allclose(t, n, rtol=1e-6, atol=1e-6)
+
+
+def _loss_weights(numVertices):
+    return np.random.RandomState(0).randn(numVertices, 3)
+
+
+@pytest.mark.parametrize('level', [0.3, 0.5])
+def test_isosurface_gradient(level):
+    data = _ellipsoid()
+    weights = _loss_weights(len(np_impl.isosurface(data, level)[0]))
+
+    x = tf.Variable(data.astype(np.float32))
+    lvl = tf.Variable(level, dtype=tf.float32)
+    with tf.GradientTape() as tape:
+        vertices = tf_impl.isosurface(x, lvl)[0]
+        loss = tf.reduce_sum(vertices * weights.astype(np.float32))
+    dData, dLevel = tape.gradient(loss, [x, lvl])
+    dData = tf.convert_to_tensor(dData).numpy()
+
+    # central differences of the float64 reference implementation, whose
+    # vertices and faces are in the same order
+    def ref_loss(data, level):
+        return np.sum(np_impl.isosurface(data, level)[0] * weights)
+
+    eps = 1e-6
+    direction = np.random.RandomState(1).randn(*data.shape)
+    expected = (ref_loss(data + eps * direction, level) -
+                ref_loss(data - eps * direction, level)) / (2 * eps)
+    np.testing.assert_allclose(
+        np.sum(dData * direction), expected, rtol=1e-3)
+
+    expected = (ref_loss(data, level + eps) -
+                ref_loss(data, level - eps)) / (2 * eps)
+    np.testing.assert_allclose(dLevel.numpy(), expected, rtol=1e-3)
+
+    # per-voxel gradients of a few edge end points
+    vi1, vi2 = _cut_edges(data, level)
+    for point in np.concatenate([vi1[:5], vi2[-5:]]):
+        point = tuple(point)
+        step = np.zeros_like(data)
+        step[point] = eps
+        expected = (ref_loss(data + step, level) -
+                    ref_loss(data - step, level)) / (2 * eps)
+        np.testing.assert_allclose(dData[point], expected, rtol=1e-3,
+                                   atol=1e-3)
@@ -2,465 +2,218 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import warnings
 import tensorflow as tf
 import numpy as np
+from . import tables
 
 
-def _gathered(indices, shape, fn):
-    values = tf.ones(shape=tf.shape(indices)[0], dtype=tf.int32)
-    condition = tf.scatter_nd(indices, values, shape)
-    return fn(condition)
+IsosurfaceTensorCache = None
 
 
-def _scatter_op1d(ref, condition, true_transform, false_transform=None):
-    condition = tf.cast(condition, tf.int32)
-    partitioned_data = tf.dynamic_partition(ref, condition, 2)
-    if false_transform is not None:
-        partitioned_data[0] = false_transform(partitioned_data[0])
-    partitioned_data[1] = true_transform(partitioned_data[1])
-    condition_indices = tf.dynamic_partition(
-        tf.range(tf.shape(ref)[0]), condition, 2)
-    return tf.dynamic_stitch(condition_indices, partitioned_data)
-
+def _get_cache_tensors():
+    """
+    Get lookup tables as constant tensors, created once per process.
 
-def _scatter_op(ref, condition, true_transform, false_transform=None):
-    shape = condition.shape
-    if len(shape) == 1:
-        return _scatter_op1d(
-            ref, condition, true_transform, false_transform)
-    else:
-        ref_shape = ref.shape.as_list()
-        ref_shape = [-1 if s is None else s for s in ref_shape]
-        new_shape = tf.concat(
-            [tf.constant([-1], dtype=tf.int32), ref_shape[len(shape)+1:]],
-            axis=0)
-        ref = tf.reshape(
-            ref, new_shape)
-        condition = tf.reshape(condition, (-1,))
-        updated = _scatter_op1d(
-            ref, condition, true_transform, false_transform)
-        return tf.reshape(updated, ref_shape)
+    Tensors are created eagerly, so may be captured by any `tf.function`.
+    """
+    global IsosurfaceTensorCache
+    if IsosurfaceTensorCache is None:
+        with tf.init_scope():
+            IsosurfaceTensorCache = (
+                tf.constant(tables.faceShifts, dtype=tf.int32),
+                tf.constant(tables.faceOffsets, dtype=tf.int32),
+                tf.constant(tables.nTableFaces, dtype=tf.int32))
+    return IsosurfaceTensorCache
+
+
+def _interpolate_vertices(data, level, vertexInds, ndims=3, normals=False,
+                          attributes=None, transform=None):
+    """
+    Get vertex positions on cut edges.
 
+    Args:
+        `data`: float32 tensor of scalar values, an `ndims`-D grid optionally
+            preceded by batch dimensions.
+        `level`: the level of the isosurface. Either a scalar or a (N,)
+            tensor of levels for each edge.
+        `vertexInds`: (N, rank(data) + 1) int32 tensor of cut edges, each the
+            coordinates of the edge start in `data` followed by the edge axis.
+        `ndims`: number of grid dimensions.
+        `normals`: if True, also return unit normals, interpolated with the
+            same weights from the gradients of `data` at both edge ends.
+        `attributes`: optional float32 tensor of shape
+            data.shape + (num_channels,) to interpolate at each vertex.
+        `transform`: optional (ndims, ndims + 1) float32 tensor `[L | b]`
+            mapping grid positions `p` to `L p + b`. Normals are mapped by
+            the inverse transpose of `L`.
 
-def scatter_added(ref, condition, updates):
+    Returns:
+        (N, ndims) float32 tensor of vertex positions within each grid. If
+        `normals` or `attributes` are given, a tuple of vertex positions
+        followed by (N, ndims) float32 normals pointing towards decreasing
+        values of `data` and/or (N, num_channels) float32 attributes.
     """
-    Performs scatter_add for non-variables, i.e.
-        ref[mask] += updates.
+    vi1, axis = tf.split(vertexInds, [-1, 1], axis=1)
+    nBatchDims = len(data.shape) - ndims
+    shift = tf.one_hot(
+        tf.squeeze(axis, axis=1) + nBatchDims, ndims + nBatchDims,
+        dtype=tf.int32)
+    vi2 = vi1 + shift
+    levels = tf.zeros(tf.shape(vi1)[:1]) + level
+    update = _edge_weights(data, levels, vi1, vi2)
+    vertexes = tf.cast(vi1[:, nBatchDims:], tf.float32) + \
+        tf.cast(shift[:, nBatchDims:], tf.float32) * \
+        tf.expand_dims(update, axis=1)
+    if transform is not None:
+        linear, offset = tf.split(transform, [ndims, 1], axis=1)
+        vertexes = tf.matmul(vertexes, linear, transpose_b=True) + \
+            tf.reshape(offset, (1, ndims))
+    if not normals and attributes is None:
+        return vertexes
+    t = tf.expand_dims(update, axis=1)
+    outputs = (vertexes,)
+    if normals:
+        grads = (1 - t) * _grid_gradient(data, vi1, ndims) + \
+            t * _grid_gradient(data, vi2, ndims)
+        if transform is not None:
+            grads = tf.matmul(grads, tf.linalg.inv(linear))
+        outputs += (-tf.math.l2_normalize(grads, axis=1),)
+    if attributes is not None:
+        a1 = tf.gather_nd(attributes, vi1)
+        outputs += (a1 + t * (tf.gather_nd(attributes, vi2) - a1),)
+    return outputs
+
+
+def _grid_gradient(data, points, ndims):
     """
-    with tf.name_scope('scatter_added'):
-        return _scatter_op(ref, condition, lambda x: x + updates)
+    Get the gradient of `data` at grid points by central differences.
 
+    One-sided differences are used at the grid boundary.
 
-def gather_added(ref, indices, updates):
-    def f(condition):
-        return scatter_added(ref, condition, updates)
+    Args:
+        `data`: float32 tensor of scalar values, an `ndims`-D grid optionally
+            preceded by batch dimensions.
+        `points`: (N, rank(data)) int32 tensor of grid point coordinates.
+        `ndims`: number of grid dimensions.
 
-    return _gathered(indices, ref.shape, f)
+    Returns:
+        (N, ndims) float32 tensor of gradients.
+    """
+    nBatchDims = len(data.shape) - ndims
+    upper = tf.shape(data, out_type=points.dtype) - 1
+    grads = []
+    for axis in range(nBatchDims, nBatchDims + ndims):
+        shift = tf.one_hot(axis, nBatchDims + ndims, dtype=points.dtype)
+        hi = tf.minimum(points + shift, upper)
+        lo = tf.maximum(points - shift, 0)
+        step = tf.cast(tf.maximum(hi[:, axis] - lo[:, axis], 1), tf.float32)
+        grads.append((tf.gather_nd(data, hi) - tf.gather_nd(data, lo)) / step)
+    return tf.stack(grads, axis=1)
+
+
+def _edge_weights(data, levels, vi1, vi2):
+    """
+    Get the fraction along each edge at which data is equal to the level.
 
+    Gradients are computed analytically and scattered directly into a
+    grid-shaped gradient, rather than back through gathers.
 
-def scatter_updated(ref, condition, updates):
-    with tf.name_scope('scatter_updated'):
-        return _scatter_op(ref, condition, lambda x: updates)
+    Args:
+        `data`: float32 tensor of scalar values.
+        `levels`: (N,) float32 tensor of levels.
+        `vi1`, `vi2`: (N, rank(data)) int32 tensors of edge end points.
+
+    Returns:
+        (N,) float32 tensor, `(levels - v1) / (v2 - v1)`.
+    """
+    @tf.custom_gradient
+    def fn(data, levels):
+        v1 = tf.gather_nd(data, vi1)
+        v2 = tf.gather_nd(data, vi2)
+        dv = v2 - v1
+        t = (levels - v1) / dv
 
+        def grad(dt):
+            # dt/dv1 = (t - 1) / dv, dt/dv2 = -t / dv, dt/dlevel = 1 / dv
+            g = dt / dv
+            dData = tf.scatter_nd(
+                tf.concat([vi1, vi2], axis=0),
+                tf.concat([g * (t - 1), -g * t], axis=0),
+                tf.shape(data, out_type=vi1.dtype))
+            return dData, g
 
-def gather_updated(ref, indices, updates):
-    def f(condition):
-        return scatter_updated(ref, condition, updates)
-
-    return _gathered(indices, ref.shape, f)
-
-
-def _get_isosurface_data():
-    # map from grid cell index to edge index.
-    # grid cell index tells us which corners are below the isosurface,
-    # edge index tells us which edges are cut by the isosurface.
-    # (Data stolen from Bourk; see above.)
-    edgeTable = np.array([
-          0x0  , 0x109, 0x203, 0x30a, 0x406, 0x50f, 0x605, 0x70c,  # NOQA
-          0x80c, 0x905, 0xa0f, 0xb06, 0xc0a, 0xd03, 0xe09, 0xf00,  # NOQA
-          0x190, 0x99 , 0x393, 0x29a, 0x596, 0x49f, 0x795, 0x69c,  # NOQA
-          0x99c, 0x895, 0xb9f, 0xa96, 0xd9a, 0xc93, 0xf99, 0xe90,  # NOQA
-          0x230, 0x339, 0x33 , 0x13a, 0x636, 0x73f, 0x435, 0x53c,  # NOQA
-          0xa3c, 0xb35, 0x83f, 0x936, 0xe3a, 0xf33, 0xc39, 0xd30,  # NOQA
-          0x3a0, 0x2a9, 0x1a3, 0xaa , 0x7a6, 0x6af, 0x5a5, 0x4ac,  # NOQA
-          0xbac, 0xaa5, 0x9af, 0x8a6, 0xfaa, 0xea3, 0xda9, 0xca0,  # NOQA
-          0x460, 0x569, 0x663, 0x76a, 0x66 , 0x16f, 0x265, 0x36c,  # NOQA
-          0xc6c, 0xd65, 0xe6f, 0xf66, 0x86a, 0x963, 0xa69, 0xb60,  # NOQA
-          0x5f0, 0x4f9, 0x7f3, 0x6fa, 0x1f6, 0xff , 0x3f5, 0x2fc,  # NOQA
-          0xdfc, 0xcf5, 0xfff, 0xef6, 0x9fa, 0x8f3, 0xbf9, 0xaf0,  # NOQA
-          0x650, 0x759, 0x453, 0x55a, 0x256, 0x35f, 0x55 , 0x15c,  # NOQA
-          0xe5c, 0xf55, 0xc5f, 0xd56, 0xa5a, 0xb53, 0x859, 0x950,  # NOQA
-          0x7c0, 0x6c9, 0x5c3, 0x4ca, 0x3c6, 0x2cf, 0x1c5, 0xcc ,  # NOQA
-          0xfcc, 0xec5, 0xdcf, 0xcc6, 0xbca, 0xac3, 0x9c9, 0x8c0,  # NOQA
-          0x8c0, 0x9c9, 0xac3, 0xbca, 0xcc6, 0xdcf, 0xec5, 0xfcc,  # NOQA
-          0xcc , 0x1c5, 0x2cf, 0x3c6, 0x4ca, 0x5c3, 0x6c9, 0x7c0,  # NOQA
-          0x950, 0x859, 0xb53, 0xa5a, 0xd56, 0xc5f, 0xf55, 0xe5c,  # NOQA
-          0x15c, 0x55 , 0x35f, 0x256, 0x55a, 0x453, 0x759, 0x650,  # NOQA
-          0xaf0, 0xbf9, 0x8f3, 0x9fa, 0xef6, 0xfff, 0xcf5, 0xdfc,  # NOQA
-          0x2fc, 0x3f5, 0xff , 0x1f6, 0x6fa, 0x7f3, 0x4f9, 0x5f0,  # NOQA
-          0xb60, 0xa69, 0x963, 0x86a, 0xf66, 0xe6f, 0xd65, 0xc6c,  # NOQA
-          0x36c, 0x265, 0x16f, 0x66 , 0x76a, 0x663, 0x569, 0x460,  # NOQA
-          0xca0, 0xda9, 0xea3, 0xfaa, 0x8a6, 0x9af, 0xaa5, 0xbac,  # NOQA
-          0x4ac, 0x5a5, 0x6af, 0x7a6, 0xaa , 0x1a3, 0x2a9, 0x3a0,  # NOQA
-          0xd30, 0xc39, 0xf33, 0xe3a, 0x936, 0x83f, 0xb35, 0xa3c,  # NOQA
-          0x53c, 0x435, 0x73f, 0x636, 0x13a, 0x33 , 0x339, 0x230,  # NOQA
-          0xe90, 0xf99, 0xc93, 0xd9a, 0xa96, 0xb9f, 0x895, 0x99c,  # NOQA
-          0x69c, 0x795, 0x49f, 0x596, 0x29a, 0x393, 0x99 , 0x190,  # NOQA
-          0xf00, 0xe09, 0xd03, 0xc0a, 0xb06, 0xa0f, 0x905, 0x80c,  # NOQA
-          0x70c, 0x605, 0x50f, 0x406, 0x30a, 0x203, 0x109, 0x0  # NOQA
-          ], dtype=np.uint16)
-
-    # Table of triangles to use for filling each grid cell.
-    # Each set of three integers tells us which three edges to
-    # draw a triangle between.
-    # (Data stolen from Bourk; see above.)
-    triTable = [
-        [],
-        [0, 8, 3],
-        [0, 1, 9],
-        [1, 8, 3, 9, 8, 1],
-        [1, 2, 10],
-        [0, 8, 3, 1, 2, 10],
-        [9, 2, 10, 0, 2, 9],
-        [2, 8, 3, 2, 10, 8, 10, 9, 8],
-        [3, 11, 2],
-        [0, 11, 2, 8, 11, 0],
-        [1, 9, 0, 2, 3, 11],
-        [1, 11, 2, 1, 9, 11, 9, 8, 11],
-        [3, 10, 1, 11, 10, 3],
-        [0, 10, 1, 0, 8, 10, 8, 11, 10],
-        [3, 9, 0, 3, 11, 9, 11, 10, 9],
-        [9, 8, 10, 10, 8, 11],
-        [4, 7, 8],
-        [4, 3, 0, 7, 3, 4],
-        [0, 1, 9, 8, 4, 7],
-        [4, 1, 9, 4, 7, 1, 7, 3, 1],
-        [1, 2, 10, 8, 4, 7],
-        [3, 4, 7, 3, 0, 4, 1, 2, 10],
-        [9, 2, 10, 9, 0, 2, 8, 4, 7],
-        [2, 10, 9, 2, 9, 7, 2, 7, 3, 7, 9, 4],
-        [8, 4, 7, 3, 11, 2],
-        [11, 4, 7, 11, 2, 4, 2, 0, 4],
-        [9, 0, 1, 8, 4, 7, 2, 3, 11],
-        [4, 7, 11, 9, 4, 11, 9, 11, 2, 9, 2, 1],
-        [3, 10, 1, 3, 11, 10, 7, 8, 4],
-        [1, 11, 10, 1, 4, 11, 1, 0, 4, 7, 11, 4],
-        [4, 7, 8, 9, 0, 11, 9, 11, 10, 11, 0, 3],
-        [4, 7, 11, 4, 11, 9, 9, 11, 10],
-        [9, 5, 4],
-        [9, 5, 4, 0, 8, 3],
-        [0, 5, 4, 1, 5, 0],
-        [8, 5, 4, 8, 3, 5, 3, 1, 5],
-        [1, 2, 10, 9, 5, 4],
-        [3, 0, 8, 1, 2, 10, 4, 9, 5],
-        [5, 2, 10, 5, 4, 2, 4, 0, 2],
-        [2, 10, 5, 3, 2, 5, 3, 5, 4, 3, 4, 8],
-        [9, 5, 4, 2, 3, 11],
-        [0, 11, 2, 0, 8, 11, 4, 9, 5],
-        [0, 5, 4, 0, 1, 5, 2, 3, 11],
-        [2, 1, 5, 2, 5, 8, 2, 8, 11, 4, 8, 5],
-        [10, 3, 11, 10, 1, 3, 9, 5, 4],
-        [4, 9, 5, 0, 8, 1, 8, 10, 1, 8, 11, 10],
-        [5, 4, 0, 5, 0, 11, 5, 11, 10, 11, 0, 3],
-        [5, 4, 8, 5, 8, 10, 10, 8, 11],
-        [9, 7, 8, 5, 7, 9],
-        [9, 3, 0, 9, 5, 3, 5, 7, 3],
-        [0, 7, 8, 0, 1, 7, 1, 5, 7],
-        [1, 5, 3, 3, 5, 7],
-        [9, 7, 8, 9, 5, 7, 10, 1, 2],
-        [10, 1, 2, 9, 5, 0, 5, 3, 0, 5, 7, 3],
-        [8, 0, 2, 8, 2, 5, 8, 5, 7, 10, 5, 2],
-        [2, 10, 5, 2, 5, 3, 3, 5, 7],
-        [7, 9, 5, 7, 8, 9, 3, 11, 2],
-        [9, 5, 7, 9, 7, 2, 9, 2, 0, 2, 7, 11],
-        [2, 3, 11, 0, 1, 8, 1, 7, 8, 1, 5, 7],
-        [11, 2, 1, 11, 1, 7, 7, 1, 5],
-        [9, 5, 8, 8, 5, 7, 10, 1, 3, 10, 3, 11],
-        [5, 7, 0, 5, 0, 9, 7, 11, 0, 1, 0, 10, 11, 10, 0],
-        [11, 10, 0, 11, 0, 3, 10, 5, 0, 8, 0, 7, 5, 7, 0],
-        [11, 10, 5, 7, 11, 5],
-        [10, 6, 5],
-        [0, 8, 3, 5, 10, 6],
-        [9, 0, 1, 5, 10, 6],
-        [1, 8, 3, 1, 9, 8, 5, 10, 6],
-        [1, 6, 5, 2, 6, 1],
-        [1, 6, 5, 1, 2, 6, 3, 0, 8],
-        [9, 6, 5, 9, 0, 6, 0, 2, 6],
-        [5, 9, 8, 5, 8, 2, 5, 2, 6, 3, 2, 8],
-        [2, 3, 11, 10, 6, 5],
-        [11, 0, 8, 11, 2, 0, 10, 6, 5],
-        [0, 1, 9, 2, 3, 11, 5, 10, 6],
-        [5, 10, 6, 1, 9, 2, 9, 11, 2, 9, 8, 11],
-        [6, 3, 11, 6, 5, 3, 5, 1, 3],
-        [0, 8, 11, 0, 11, 5, 0, 5, 1, 5, 11, 6],
-        [3, 11, 6, 0, 3, 6, 0, 6, 5, 0, 5, 9],
-        [6, 5, 9, 6, 9, 11, 11, 9, 8],
-        [5, 10, 6, 4, 7, 8],
-        [4, 3, 0, 4, 7, 3, 6, 5, 10],
-        [1, 9, 0, 5, 10, 6, 8, 4, 7],
-        [10, 6, 5, 1, 9, 7, 1, 7, 3, 7, 9, 4],
-        [6, 1, 2, 6, 5, 1, 4, 7, 8],
-        [1, 2, 5, 5, 2, 6, 3, 0, 4, 3, 4, 7],
-        [8, 4, 7, 9, 0, 5, 0, 6, 5, 0, 2, 6],
-        [7, 3, 9, 7, 9, 4, 3, 2, 9, 5, 9, 6, 2, 6, 9],
-        [3, 11, 2, 7, 8, 4, 10, 6, 5],
-        [5, 10, 6, 4, 7, 2, 4, 2, 0, 2, 7, 11],
-        [0, 1, 9, 4, 7, 8, 2, 3, 11, 5, 10, 6],
-        [9, 2, 1, 9, 11, 2, 9, 4, 11, 7, 11, 4, 5, 10, 6],
-        [8, 4, 7, 3, 11, 5, 3, 5, 1, 5, 11, 6],
-        [5, 1, 11, 5, 11, 6, 1, 0, 11, 7, 11, 4, 0, 4, 11],
-        [0, 5, 9, 0, 6, 5, 0, 3, 6, 11, 6, 3, 8, 4, 7],
-        [6, 5, 9, 6, 9, 11, 4, 7, 9, 7, 11, 9],
-        [10, 4, 9, 6, 4, 10],
-        [4, 10, 6, 4, 9, 10, 0, 8, 3],
-        [10, 0, 1, 10, 6, 0, 6, 4, 0],
-        [8, 3, 1, 8, 1, 6, 8, 6, 4, 6, 1, 10],
-        [1, 4, 9, 1, 2, 4, 2, 6, 4],
-        [3, 0, 8, 1, 2, 9, 2, 4, 9, 2, 6, 4],
-        [0, 2, 4, 4, 2, 6],
-        [8, 3, 2, 8, 2, 4, 4, 2, 6],
-        [10, 4, 9, 10, 6, 4, 11, 2, 3],
-        [0, 8, 2, 2, 8, 11, 4, 9, 10, 4, 10, 6],
-        [3, 11, 2, 0, 1, 6, 0, 6, 4, 6, 1, 10],
-        [6, 4, 1, 6, 1, 10, 4, 8, 1, 2, 1, 11, 8, 11, 1],
-        [9, 6, 4, 9, 3, 6, 9, 1, 3, 11, 6, 3],
-        [8, 11, 1, 8, 1, 0, 11, 6, 1, 9, 1, 4, 6, 4, 1],
-        [3, 11, 6, 3, 6, 0, 0, 6, 4],
-        [6, 4, 8, 11, 6, 8],
-        [7, 10, 6, 7, 8, 10, 8, 9, 10],
-        [0, 7, 3, 0, 10, 7, 0, 9, 10, 6, 7, 10],
-        [10, 6, 7, 1, 10, 7, 1, 7, 8, 1, 8, 0],
-        [10, 6, 7, 10, 7, 1, 1, 7, 3],
-        [1, 2, 6, 1, 6, 8, 1, 8, 9, 8, 6, 7],
-        [2, 6, 9, 2, 9, 1, 6, 7, 9, 0, 9, 3, 7, 3, 9],
-        [7, 8, 0, 7, 0, 6, 6, 0, 2],
-        [7, 3, 2, 6, 7, 2],
-        [2, 3, 11, 10, 6, 8, 10, 8, 9, 8, 6, 7],
-        [2, 0, 7, 2, 7, 11, 0, 9, 7, 6, 7, 10, 9, 10, 7],
-        [1, 8, 0, 1, 7, 8, 1, 10, 7, 6, 7, 10, 2, 3, 11],
-        [11, 2, 1, 11, 1, 7, 10, 6, 1, 6, 7, 1],
-        [8, 9, 6, 8, 6, 7, 9, 1, 6, 11, 6, 3, 1, 3, 6],
-        [0, 9, 1, 11, 6, 7],
-        [7, 8, 0, 7, 0, 6, 3, 11, 0, 11, 6, 0],
-        [7, 11, 6],
-        [7, 6, 11],
-        [3, 0, 8, 11, 7, 6],
-        [0, 1, 9, 11, 7, 6],
-        [8, 1, 9, 8, 3, 1, 11, 7, 6],
-        [10, 1, 2, 6, 11, 7],
-        [1, 2, 10, 3, 0, 8, 6, 11, 7],
-        [2, 9, 0, 2, 10, 9, 6, 11, 7],
-        [6, 11, 7, 2, 10, 3, 10, 8, 3, 10, 9, 8],
-        [7, 2, 3, 6, 2, 7],
-        [7, 0, 8, 7, 6, 0, 6, 2, 0],
-        [2, 7, 6, 2, 3, 7, 0, 1, 9],
-        [1, 6, 2, 1, 8, 6, 1, 9, 8, 8, 7, 6],
-        [10, 7, 6, 10, 1, 7, 1, 3, 7],
-        [10, 7, 6, 1, 7, 10, 1, 8, 7, 1, 0, 8],
-        [0, 3, 7, 0, 7, 10, 0, 10, 9, 6, 10, 7],
-        [7, 6, 10, 7, 10, 8, 8, 10, 9],
-        [6, 8, 4, 11, 8, 6],
-        [3, 6, 11, 3, 0, 6, 0, 4, 6],
-        [8, 6, 11, 8, 4, 6, 9, 0, 1],
-        [9, 4, 6, 9, 6, 3, 9, 3, 1, 11, 3, 6],
-        [6, 8, 4, 6, 11, 8, 2, 10, 1],
-        [1, 2, 10, 3, 0, 11, 0, 6, 11, 0, 4, 6],
-        [4, 11, 8, 4, 6, 11, 0, 2, 9, 2, 10, 9],
-        [10, 9, 3, 10, 3, 2, 9, 4, 3, 11, 3, 6, 4, 6, 3],
-        [8, 2, 3, 8, 4, 2, 4, 6, 2],
-        [0, 4, 2, 4, 6, 2],
-        [1, 9, 0, 2, 3, 4, 2, 4, 6, 4, 3, 8],
-        [1, 9, 4, 1, 4, 2, 2, 4, 6],
-        [8, 1, 3, 8, 6, 1, 8, 4, 6, 6, 10, 1],
-        [10, 1, 0, 10, 0, 6, 6, 0, 4],
-        [4, 6, 3, 4, 3, 8, 6, 10, 3, 0, 3, 9, 10, 9, 3],
-        [10, 9, 4, 6, 10, 4],
-        [4, 9, 5, 7, 6, 11],
-        [0, 8, 3, 4, 9, 5, 11, 7, 6],
-        [5, 0, 1, 5, 4, 0, 7, 6, 11],
-        [11, 7, 6, 8, 3, 4, 3, 5, 4, 3, 1, 5],
-        [9, 5, 4, 10, 1, 2, 7, 6, 11],
-        [6, 11, 7, 1, 2, 10, 0, 8, 3, 4, 9, 5],
-        [7, 6, 11, 5, 4, 10, 4, 2, 10, 4, 0, 2],
-        [3, 4, 8, 3, 5, 4, 3, 2, 5, 10, 5, 2, 11, 7, 6],
-        [7, 2, 3, 7, 6, 2, 5, 4, 9],
-        [9, 5, 4, 0, 8, 6, 0, 6, 2, 6, 8, 7],
-        [3, 6, 2, 3, 7, 6, 1, 5, 0, 5, 4, 0],
-        [6, 2, 8, 6, 8, 7, 2, 1, 8, 4, 8, 5, 1, 5, 8],
-        [9, 5, 4, 10, 1, 6, 1, 7, 6, 1, 3, 7],
-        [1, 6, 10, 1, 7, 6, 1, 0, 7, 8, 7, 0, 9, 5, 4],
-        [4, 0, 10, 4, 10, 5, 0, 3, 10, 6, 10, 7, 3, 7, 10],
-        [7, 6, 10, 7, 10, 8, 5, 4, 10, 4, 8, 10],
-        [6, 9, 5, 6, 11, 9, 11, 8, 9],
-        [3, 6, 11, 0, 6, 3, 0, 5, 6, 0, 9, 5],
-        [0, 11, 8, 0, 5, 11, 0, 1, 5, 5, 6, 11],
-        [6, 11, 3, 6, 3, 5, 5, 3, 1],
-        [1, 2, 10, 9, 5, 11, 9, 11, 8, 11, 5, 6],
-        [0, 11, 3, 0, 6, 11, 0, 9, 6, 5, 6, 9, 1, 2, 10],
-        [11, 8, 5, 11, 5, 6, 8, 0, 5, 10, 5, 2, 0, 2, 5],
-        [6, 11, 3, 6, 3, 5, 2, 10, 3, 10, 5, 3],
-        [5, 8, 9, 5, 2, 8, 5, 6, 2, 3, 8, 2],
-        [9, 5, 6, 9, 6, 0, 0, 6, 2],
-        [1, 5, 8, 1, 8, 0, 5, 6, 8, 3, 8, 2, 6, 2, 8],
-        [1, 5, 6, 2, 1, 6],
-        [1, 3, 6, 1, 6, 10, 3, 8, 6, 5, 6, 9, 8, 9, 6],
-        [10, 1, 0, 10, 0, 6, 9, 5, 0, 5, 6, 0],
-        [0, 3, 8, 5, 6, 10],
-        [10, 5, 6],
-        [11, 5, 10, 7, 5, 11],
-        [11, 5, 10, 11, 7, 5, 8, 3, 0],
-        [5, 11, 7, 5, 10, 11, 1, 9, 0],
-        [10, 7, 5, 10, 11, 7, 9, 8, 1, 8, 3, 1],
-        [11, 1, 2, 11, 7, 1, 7, 5, 1],
-        [0, 8, 3, 1, 2, 7, 1, 7, 5, 7, 2, 11],
-        [9, 7, 5, 9, 2, 7, 9, 0, 2, 2, 11, 7],
-        [7, 5, 2, 7, 2, 11, 5, 9, 2, 3, 2, 8, 9, 8, 2],
-        [2, 5, 10, 2, 3, 5, 3, 7, 5],
-        [8, 2, 0, 8, 5, 2, 8, 7, 5, 10, 2, 5],
-        [9, 0, 1, 5, 10, 3, 5, 3, 7, 3, 10, 2],
-        [9, 8, 2, 9, 2, 1, 8, 7, 2, 10, 2, 5, 7, 5, 2],
-        [1, 3, 5, 3, 7, 5],
-        [0, 8, 7, 0, 7, 1, 1, 7, 5],
-        [9, 0, 3, 9, 3, 5, 5, 3, 7],
-        [9, 8, 7, 5, 9, 7],
-        [5, 8, 4, 5, 10, 8, 10, 11, 8],
-        [5, 0, 4, 5, 11, 0, 5, 10, 11, 11, 3, 0],
-        [0, 1, 9, 8, 4, 10, 8, 10, 11, 10, 4, 5],
-        [10, 11, 4, 10, 4, 5, 11, 3, 4, 9, 4, 1, 3, 1, 4],
-        [2, 5, 1, 2, 8, 5, 2, 11, 8, 4, 5, 8],
-        [0, 4, 11, 0, 11, 3, 4, 5, 11, 2, 11, 1, 5, 1, 11],
-        [0, 2, 5, 0, 5, 9, 2, 11, 5, 4, 5, 8, 11, 8, 5],
-        [9, 4, 5, 2, 11, 3],
-        [2, 5, 10, 3, 5, 2, 3, 4, 5, 3, 8, 4],
-        [5, 10, 2, 5, 2, 4, 4, 2, 0],
-        [3, 10, 2, 3, 5, 10, 3, 8, 5, 4, 5, 8, 0, 1, 9],
-        [5, 10, 2, 5, 2, 4, 1, 9, 2, 9, 4, 2],
-        [8, 4, 5, 8, 5, 3, 3, 5, 1],
-        [0, 4, 5, 1, 0, 5],
-        [8, 4, 5, 8, 5, 3, 9, 0, 5, 0, 3, 5],
-        [9, 4, 5],
-        [4, 11, 7, 4, 9, 11, 9, 10, 11],
-        [0, 8, 3, 4, 9, 7, 9, 11, 7, 9, 10, 11],
-        [1, 10, 11, 1, 11, 4, 1, 4, 0, 7, 4, 11],
-        [3, 1, 4, 3, 4, 8, 1, 10, 4, 7, 4, 11, 10, 11, 4],
-        [4, 11, 7, 9, 11, 4, 9, 2, 11, 9, 1, 2],
-        [9, 7, 4, 9, 11, 7, 9, 1, 11, 2, 11, 1, 0, 8, 3],
-        [11, 7, 4, 11, 4, 2, 2, 4, 0],
-        [11, 7, 4, 11, 4, 2, 8, 3, 4, 3, 2, 4],
-        [2, 9, 10, 2, 7, 9, 2, 3, 7, 7, 4, 9],
-        [9, 10, 7, 9, 7, 4, 10, 2, 7, 8, 7, 0, 2, 0, 7],
-        [3, 7, 10, 3, 10, 2, 7, 4, 10, 1, 10, 0, 4, 0, 10],
-        [1, 10, 2, 8, 7, 4],
-        [4, 9, 1, 4, 1, 7, 7, 1, 3],
-        [4, 9, 1, 4, 1, 7, 0, 8, 1, 8, 7, 1],
-        [4, 0, 3, 7, 4, 3],
-        [4, 8, 7],
-        [9, 10, 8, 10, 11, 8],
-        [3, 0, 9, 3, 9, 11, 11, 9, 10],
-        [0, 1, 10, 0, 10, 8, 8, 10, 11],
-        [3, 1, 10, 11, 3, 10],
-        [1, 2, 11, 1, 11, 9, 9, 11, 8],
-        [3, 0, 9, 3, 9, 11, 1, 2, 9, 2, 11, 9],
-        [0, 2, 11, 8, 0, 11],
-        [3, 2, 11],
-        [2, 3, 8, 2, 8, 10, 10, 8, 9],
-        [9, 10, 2, 0, 9, 2],
-        [2, 3, 8, 2, 8, 10, 0, 1, 8, 1, 10, 8],
-        [1, 10, 2],
-        [1, 3, 8, 9, 1, 8],
-        [0, 9, 1],
-        [0, 3, 8],
-        []
-    ]
-    edgeShifts = np.array([
-        # #maps edge ID (0-11) to (x,y,z) cell offset and edge ID (0-2)
-        [0, 0, 0, 0],
-        [1, 0, 0, 1],
-        [0, 1, 0, 0],
-        [0, 0, 0, 1],
-        [0, 0, 1, 0],
-        [1, 0, 1, 1],
-        [0, 1, 1, 0],
-        [0, 0, 1, 1],
-        [0, 0, 0, 2],
-        [1, 0, 0, 2],
-        [1, 1, 0, 2],
-        [0, 1, 0, 2],
-        # [9, 9, 9, 9]  ## fake
-    ], dtype=np.uint16)
-    # don't use ubyte here! This value gets added to cell index later;
-    # will need the extra precision.
-    nTableFaces = np.array(
-        [len(f)/3 for f in triTable], dtype=np.ubyte)
-    faceShiftTables = [None]
-    for i in range(1, 6):
-        # # compute lookup table of index: vertexes mapping
-        faceTableI = np.zeros((len(triTable), i*3), dtype=np.ubyte)
-        faceTableInds = np.argwhere(nTableFaces == i)
-
-        faceTableI[faceTableInds[:, 0]] = np.array(
-                [triTable[j] for j in faceTableInds[:, 0]])
-        faceTableI = faceTableI.reshape((len(triTable), i, 3))
-        faceShiftTables.append(edgeShifts[faceTableI])
-
-    return faceShiftTables, edgeShifts, edgeTable, nTableFaces
-
-
-IsosurfaceDataCache = None
-
-
-def _get_cache_data():
-    global IsosurfaceDataCache
-    if IsosurfaceDataCache is None:
-        IsosurfaceDataCache = _get_isosurface_data()
-    return IsosurfaceDataCache
+        return t, grad
 
+    return fn(data, levels)
 
-def _get_cache_tensors():
-    faceShiftTables, edgeShifts, edgeTable, nTableFaces = _get_cache_data()
-    graph = tf.get_default_graph()
-    try:
-        nTableFaces_tf = graph.get_tensor_by_name('n_table_faces:0')
-        edgeTable_tf = graph.get_tensor_by_name('edge_table:0')
-        faceShiftTables_tf = tuple(
-            graph.get_tensor_by_name('face_shift_table%d:0' % i)
-            for i in range(len(faceShiftTables)-1))
-        paddings_tf = tuple(
-            graph.get_tensor_by_name('paddings%d:0' % i)
-            for i in range(len(edgeShifts))
-        )
-    except KeyError:
-        faceShiftTables_tf = tuple(tf.constant(
-            f, tf.int32, name='face_shift_table%d' % i)
-            for i, f in enumerate(faceShiftTables[1:]))
-
-        nTableFaces_tf = tf.constant(
-            nTableFaces, dtype=tf.int32, name='n_table_faces')
-        edgeTable_tf = tf.constant(
-            edgeTable, dtype=tf.uint16, name='edge_table')
-        paddings_tf = [tf.constant(
-            [[s, 1 - s] for s in padding], name='paddings%d' % i,
-            dtype=tf.int32)
-            for i, padding in enumerate(edgeShifts[:, :3])]
-    edge_shifts = edgeShifts[:, 3]
-    return faceShiftTables_tf, edgeTable_tf, nTableFaces_tf, paddings_tf, \
-        edge_shifts
-
-
-def isosurface(data, level):
+
+def _face_edges(cells, cellInds, faceShifts_tf, faceOffsets_tf, ndims=3):
     """
-    Generate isosurface from volumetric data using marching cubes algorithm.
-    See Paul Bourke, "Polygonising a Scalar Field"
-    (http://paulbourke.net/geometry/polygonise/)
+    Get the cut edges making up each face of the given cells.
 
     Args:
-        `data`: 3D float32 tensor of scalar values.
-        `level`: Scalar, the level at which to generate an isosurface
+        `cells`: (N, ndims) int32 tensor of cell coordinates, optionally
+            preceded by batch indices, i.e. (N, nBatchDims + ndims).
+        `cellInds`: (N,) int32 tensor of cube indices of `cells`.
+        `faceShifts_tf`, `faceOffsets_tf`: flattened face table and offsets
+            of each cube index's faces into it.
+        `ndims`: number of grid dimensions.
 
-    Returns an array of vertex coordinates (Nv, 3) (float32) and an array of
-    per-face vertex indexes (Nf, 3), (int32).
+    Returns:
+        (Nf, ndims, nBatchDims + ndims + 1) int32 tensor of edges for each
+        face, each the batch indices and coordinates of the cell followed by
+        the edge axis.
+    """
+    # Each cell is expanded into its faces, which are consecutive rows of
+    # the flattened face table, so each face needs a single gather. Faces are
+    # ordered by the prefix sum of nFaces over cells.
+    faceStarts = tf.gather(faceOffsets_tf, cellInds)
+    nFaces = tf.gather(faceOffsets_tf, cellInds + 1) - faceStarts
+    cellIds = tf.repeat(tf.range(tf.shape(cellInds)[0]), nFaces)
+    rows = tf.range(tf.shape(cellIds)[0]) + tf.gather(
+        faceStarts - tf.cumsum(nFaces, exclusive=True), cellIds)
+
+    verts = tf.gather(faceShifts_tf, rows)
+    v0, v1 = tf.split(verts, [ndims, 1], axis=-1)
+    # batch indices are unshifted
+    v0 = tf.pad(v0, [[0, 0], [0, 0], [tf.shape(cells)[1] - ndims, 0]])
+    v0 = v0 + tf.expand_dims(tf.gather(cells, cellIds), axis=1)
+    return tf.concat([v0, v1], axis=-1)
+
+
+def batch_flat_isosurface(data, level, normals=False, attributes=None,
+                          spacing=None, origin=None, affine=None):
+    """
+    Generate isosurfaces for a batch of volumes in a single set of ops.
 
-    Heavily based on numpy implementation in pyqt.
+    The batch is treated as an additional grid dimension, so cube indices,
+    cut edges and faces of all examples are computed together rather than
+    sequentially. Each example gives the same mesh as `isosurface`.
+
+    Args:
+        `data`: 4D float32 tensor of batch_size 3D grids of scalar values.
+        `level`: scalar, or (batch_size,) tensor of per-example levels.
+        `normals`: if True, also return vertex normals, as in `isosurface`.
+        `attributes`: optional tensor of per-voxel channels of shape
+            data.shape or data.shape + (num_channels,), interpolated at each
+            vertex as in `isosurface`.
+        `spacing`, `origin`, `affine`: optional transform from grid indices
+            to vertex positions shared by all examples, as in `isosurface`.
+
+    Returns:
+        `vertices`: (Nv, 3) float32 tensor of vertex positions of all
+            examples, concatenated.
+        `faces`: (Nf, 3) int32 tensor of faces of all examples, concatenated.
+            Vertex indices are relative to the example's first vertex.
+        `vertex_splits`: (batch_size + 1,) int32 tensor of row splits,
+            vertices of example i being
+            `vertices[vertex_splits[i]:vertex_splits[i+1]]`.
+        `face_splits`: (batch_size + 1,) int32 tensor of row splits of
+            `faces`.
+        `normals`: if `normals`, (Nv, 3) float32 tensor of vertex normals.
+        `attributes`: if `attributes` is given, (Nv,) or (Nv, num_channels)
+            float32 tensor of vertex attributes.
     """
     # For improvement, see:
     ##
@@ -472,13 +225,59 @@ def isosurface(data, level):
         data = tf.convert_to_tensor(data, dtype=tf.float32)
     if data.dtype != tf.float32:
         data = tf.cast(data, tf.float32)
+    levels = tf.zeros(tf.shape(data)[:1]) + tf.cast(level, tf.float32)
+    return _call_isosurface_fn(
+        data, levels, normals, attributes,
+        _affine_transform(spacing, origin, affine))
+
+
+def _call_isosurface_fn(data, levels, normals, attributes, transform=None):
+    """
+    Run the traced `_flat_isosurface` with the requested outputs.
+
+    Args:
+        `data`: 4D float32 tensor of batch_size 3D grids.
+        `levels`: (batch_size,) float32 tensor of per-example levels.
+        `normals`: whether to compute vertex normals.
+        `attributes`: None, or a tensor of shape data.shape or
+            data.shape + (num_channels,).
+        `transform`: None, or a (3, 4) float32 tensor from
+            `_affine_transform`.
+    """
+    args = () if transform is None else (transform,)
+    if attributes is None:
+        return _get_isosurface_fn(normals, False, bool(args))(
+            data, levels, *args)
+    attributes = tf.cast(attributes, tf.float32)
+    channels = len(attributes.shape) > len(data.shape)
+    if not channels:
+        attributes = tf.expand_dims(attributes, axis=-1)
+    outputs = _get_isosurface_fn(normals, True, bool(args))(
+        data, levels, attributes, *args)
+    if not channels:
+        outputs = outputs[:-1] + (tf.squeeze(outputs[-1], axis=-1),)
+    return outputs
+
+
+def _flat_isosurface(data, levels, attributes=None, transform=None,
+                     normals=False):
+    """
+    Batched marching cubes, as `batch_flat_isosurface`.
 
+    Args:
+        `data`: 4D float32 tensor of batch_size 3D grids.
+        `levels`: (batch_size,) float32 tensor of per-example levels.
+        `attributes`: optional float32 tensor of shape
+            data.shape + (num_channels,) to interpolate at vertices.
+        `transform`: optional (3, 4) float32 tensor mapping grid positions to
+            vertex positions, from `_affine_transform`.
+        `normals`: if True, also return vertex normals.
+    """
     # Precompute lookup tables on the first run
-    faceShiftTables_tf, edgeTable_tf, nTableFaces_tf, paddings_tf, \
-        edge_shifts = _get_cache_tensors()
+    faceShifts_tf, faceOffsets_tf, nTableFaces_tf = _get_cache_tensors()
 
     # mark everything below the isosurface level
-    mask = tf.cast(data < level, tf.int32)
+    mask = tf.cast(data < tf.reshape(levels, (-1, 1, 1, 1)), tf.int32)
 
     # make eight sub-fields and compute indexes for grid cells
     updates = []
@@ -488,110 +287,609 @@ def isosurface(data, level):
             for k in [0, 1]:
                 # this is just to match Bourk's vertex numbering scheme
                 vertIndex = i - 2 * j * i + 3 * j + 4 * k
-                m = mask[slices[i], slices[j], slices[k]]
+                m = mask[:, slices[i], slices[j], slices[k]]
                 updates.append(m * 2 ** vertIndex)
     index = tf.add_n(updates)
 
-    # Generate table of edges that have been cut
-    cutEdges = [[], [], []]
-
-    edges = tf.gather(edgeTable_tf, index)
-
-    # for i, shift in enumerate(edgeShifts):
-    for i, (padding, edge_shift) in enumerate(zip(paddings_tf, edge_shifts)):
-        update = tf.bitwise.bitwise_and(edges, 2**i)
-        update = tf.pad(update, padding)
-        cutEdges[edge_shift].append(update)
-    cutEdges = [tf.cast(tf.add_n(c), tf.int32) for c in cutEdges]
+    # Generate table of edges that have been cut. An edge is cut iff its end
+    # points are on different sides of the level.
+    cutEdges = []
+    for axis in range(3):
+        lower = [slice(None)] * 4
+        upper = [slice(None)] * 4
+        lower[axis + 1] = slice(0, -1)
+        upper[axis + 1] = slice(1, None)
+        padding = [[0, 0]] * 4
+        padding[axis + 1] = [0, 1]
+        cutEdges.append(tf.pad(
+            tf.not_equal(mask[lower], mask[upper]), padding))
     cutEdges = tf.stack(cutEdges, axis=-1)
-    shape = np.array(index.shape.as_list()) + 1
-    cutEdges.set_shape(tuple(shape) + (3,))
 
     # for each cut edge, interpolate to see where exactly the edge is cut and
-    # generate vertex positions
-    m = cutEdges > 0
-    vertexInds = tf.where(m)
-    vertexes = tf.cast(vertexInds[:, :3], tf.float32)
-
-    # re-use the cutEdges array as a lookup table for vertex IDs
-    update = tf.range(tf.shape(vertexInds)[0])
-    cutEdges = gather_updated(cutEdges, vertexInds, update)
-
-    assert(index.dtype == tf.int32)
-    # index = tf.cast(index, tf.int32)
-
-    vs = tf.unstack(vertexInds, axis=-1)
-    vertexes_unstacked = tf.unstack(vertexes, axis=1)
-    for i in [0, 1, 2]:
-        vim = tf.equal(vs[3], i)
-        vi1 = tf.boolean_mask(vertexInds, vim)
-        vss = tf.unstack(vi1, axis=1)[:3]
-        vi1 = tf.stack(vss, axis=1)
-        vss[i] += 1
-        vi2 = tf.stack(vss, axis=1)
-        v1 = tf.gather_nd(data, vi1)
-        v2 = tf.gather_nd(data, vi2)
+    # generate vertex positions. Cut edges are found in row-major order, so
+    # vertices are grouped by example.
+    vertexInds = tf.cast(tf.where(cutEdges), tf.int32)
+    vertexes = _interpolate_vertices(
+        data, tf.gather(levels, vertexInds[:, 0]),
+        vertexInds, normals=normals,
+        attributes=attributes, transform=transform)
+
+    nVertices = tf.reduce_sum(tf.cast(cutEdges, tf.int32), axis=[1, 2, 3, 4])
+    vertex_splits = tf.pad(tf.cumsum(nVertices), [[1, 0]])
+
+    # lookup volume of vertex IDs relative to each example's first vertex.
+    # The running count of cut edges in row-major order matches the ordering
+    # of vertexInds above. Entries for edges that are not cut are never read.
+    vertexIds = tf.reshape(
+        tf.cumsum(tf.reshape(tf.cast(cutEdges, tf.int32), (-1,)),
+                  exclusive=True),
+        tf.shape(cutEdges))
+    vertexIds -= tf.reshape(vertex_splits[:-1], (-1, 1, 1, 1, 1))
+
+    # compute the set of vertex indexes for each face.
+    # All cells with at least one face are found in a single pass.
+    nFaces = tf.gather(nTableFaces_tf, index)
+    face_splits = tf.pad(
+        tf.cumsum(tf.reduce_sum(nFaces, axis=[1, 2, 3])), [[1, 0]])
+    cells = tf.cast(tf.where(nFaces > 0), tf.int32)
+    # index values of cells to process
+    cellInds = tf.gather_nd(index, cells)
+    verts = _face_edges(cells, cellInds, faceShifts_tf, faceOffsets_tf)
+    faces = tf.gather_nd(vertexIds, verts)
+    if transform is not None:
+        # keep the winding consistent with normals if the transform mirrors
+        faces = tf.where(
+            tf.linalg.det(transform[:, :3]) < 0,
+            tf.gather(faces, [0, 2, 1], axis=1), faces)
+
+    if normals or attributes is not None:
+        return (vertexes[0], faces, vertex_splits, face_splits) + \
+            vertexes[1:]
+    return vertexes, faces, vertex_splits, face_splits
+
+
+# Traced once for all grid sizes, batch sizes and levels
+_batch_flat_isosurface_fn = tf.function(
+    _flat_isosurface, input_signature=(
+        tf.TensorSpec((None, None, None, None), tf.float32),
+        tf.TensorSpec((None,), tf.float32)))
+
+
+def _levels_isosurface(data, levels):
+    """
+    Marching cubes of a single 3D grid at each of `levels` in turn.
 
-        update = (level - v1) / (v2 - v1)
-        vertexes_unstacked[i] = scatter_added(
-            vertexes_unstacked[i], vim, update)
+    Extrema of each plane of grid points are found once and shared between
+    levels. Each level is then extracted from the bounding box of slabs of
+    cells straddling it, so peak memory is that of a single extraction
+    rather than growing with the number of levels.
 
-    vertexes = tf.stack(vertexes_unstacked, axis=1)
+    Args:
+        `data`: 3D float32 tensor of scalar values.
+        `levels`: (num_levels,) float32 tensor of levels.
 
-    # compute the set of vertex indexes for each face.
+    Returns:
+        vertices, faces, vertex_splits and face_splits, as
+        `isosurface_levels`.
+    """
+    shape = tf.shape(data)
+    # extrema of the two planes of grid points bounding each slab of cells
+    slabRanges = []
+    for axis in range(3):
+        others = [a for a in range(3) if a != axis]
+        planeMin = tf.reduce_min(data, axis=others)
+        planeMax = tf.reduce_max(data, axis=others)
+        slabRanges.append((tf.minimum(planeMin[:-1], planeMin[1:]),
+                           tf.maximum(planeMax[:-1], planeMax[1:])))
+
+    def body(i, vertexArray, faceArray, vertexCounts, faceCounts):
+        level = levels[i]
+        starts = []
+        ends = []
+        empty = tf.constant(False)
+        for axis, (slabMin, slabMax) in enumerate(slabRanges):
+            slabs = tf.cast(
+                tf.where((slabMin < level) & (slabMax >= level))[:, 0],
+                tf.int32)
+            # grids without cells may still have cut edges
+            degenerate = shape[axis] < 2
+            starts.append(tf.where(degenerate, 0, tf.reduce_min(slabs)))
+            ends.append(tf.where(
+                degenerate, shape[axis], tf.reduce_max(slabs) + 2))
+            empty = empty | (~degenerate & tf.equal(tf.size(slabs), 0))
+
+        def extract():
+            box = data[starts[0]:ends[0], starts[1]:ends[1],
+                       starts[2]:ends[2]]
+            vertices, faces = _flat_isosurface(
+                tf.expand_dims(box, axis=0), tf.expand_dims(level, axis=0))[:2]
+            return vertices + tf.cast(tf.stack(starts), tf.float32), faces
+
+        def skip():
+            return tf.zeros((0, 3)), tf.zeros((0, 3), dtype=tf.int32)
+
+        vertices, faces = tf.cond(empty, skip, extract)
+        return (i + 1, vertexArray.write(i, vertices),
+                faceArray.write(i, faces),
+                vertexCounts.write(i, tf.shape(vertices)[0]),
+                faceCounts.write(i, tf.shape(faces)[0]))
+
+    numLevels = tf.shape(levels)[0]
+    arrays = [
+        tf.TensorArray(dtype, size=numLevels, infer_shape=False,
+                       element_shape=(None, 3))
+        for dtype in (tf.float32, tf.int32)]
+    arrays += [tf.TensorArray(tf.int32, size=numLevels) for _ in range(2)]
+    # one level at a time, so intermediate grids are not held for all levels
+    _, vertexArray, faceArray, vertexCounts, faceCounts = tf.while_loop(
+        lambda i, *arrays: i < numLevels, body, [0] + arrays,
+        parallel_iterations=1)
+    vertices = tf.reshape(vertexArray.concat(), (-1, 3))
+    faces = tf.reshape(faceArray.concat(), (-1, 3))
+    vertex_splits = tf.pad(tf.cumsum(vertexCounts.stack()), [[1, 0]])
+    face_splits = tf.pad(tf.cumsum(faceCounts.stack()), [[1, 0]])
+    return vertices, faces, vertex_splits, face_splits
+
+
+_levels_isosurface_fn = tf.function(
+    _levels_isosurface, input_signature=(
+        tf.TensorSpec((None, None, None), tf.float32),
+        tf.TensorSpec((None,), tf.float32)))
+
+
+IsosurfaceFunctionCache = {}
+
+
+def _get_isosurface_fn(normals=False, attributes=False, transform=False):
+    """
+    Get `_flat_isosurface` traced for 4D data with the given extra inputs
+    and outputs.
+
+    The returned function takes data and levels, followed by attributes
+    and/or a transform if requested. Each combination is traced once for all
+    grid sizes, batch sizes, levels and transforms.
+    """
+    if not normals and not attributes and not transform:
+        return _batch_flat_isosurface_fn
+    key = (normals, attributes, transform)
+    if key not in IsosurfaceFunctionCache:
+        signature = [
+            tf.TensorSpec((None, None, None, None), tf.float32),
+            tf.TensorSpec((None,), tf.float32)]
+        names = []
+        if attributes:
+            signature.append(
+                tf.TensorSpec((None, None, None, None, None), tf.float32))
+            names.append('attributes')
+        if transform:
+            signature.append(tf.TensorSpec((3, 4), tf.float32))
+            names.append('transform')
+
+        def fn(data, levels, *args):
+            return _flat_isosurface(
+                data, levels, normals=normals, **dict(zip(names, args)))
+
+        IsosurfaceFunctionCache[key] = tf.function(
+            fn, input_signature=signature)
+    return IsosurfaceFunctionCache[key]
+
+
+def _affine_transform(spacing=None, origin=None, affine=None):
+    """
+    Get the transform from grid indices to vertex positions.
+
+    Args:
+        `spacing`: optional scalar or (3,) grid spacing.
+        `origin`: optional scalar or (3,) position of grid index (0, 0, 0).
+        `affine`: optional (4, 4) or (3, 4) affine matrix mapping homogeneous
+            grid indices to vertex positions. Exclusive with `spacing` and
+            `origin`.
+
+    Returns:
+        (3, 4) float32 tensor `[L | b]` mapping grid positions `p` to
+        `L p + b`, or None if no transform is given. May be computed from
+        tensors, in which case gradients propagate to them.
+    """
+    if affine is not None:
+        if spacing is not None or origin is not None:
+            raise ValueError(
+                '`affine` cannot be combined with `spacing` or `origin`')
+        affine = tf.cast(affine, tf.float32)
+        if tuple(affine.shape) not in ((3, 4), (4, 4)):
+            raise ValueError(
+                'affine must have shape (4, 4) or (3, 4), got %s'
+                % (affine.shape,))
+        return affine[:3]
+    if spacing is None and origin is None:
+        return None
+    spacing = tf.ones((3,)) * (
+        1. if spacing is None else tf.cast(spacing, tf.float32))
+    origin = tf.zeros((3,)) + (
+        0. if origin is None else tf.cast(origin, tf.float32))
+    return tf.concat(
+        [tf.linalg.diag(spacing), tf.expand_dims(origin, axis=1)], axis=1)
+
+
+def isosurface(data, level, normals=False, attributes=None, spacing=None,
+               origin=None, affine=None):
+    """
+    Generate isosurface from volumetric data using marching cubes algorithm.
+    See Paul Bourke, "Polygonising a Scalar Field"
+    (http://paulbourke.net/geometry/polygonise/)
+
+    Args:
+        `data`: 3D float32 tensor of scalar values.
+        `level`: Scalar, the level at which to generate an isosurface
+        `normals`: if True, also return unit vertex normals, interpolated
+            from central-difference gradients of `data` at the ends of each
+            vertex's edge. Normals point towards decreasing values,
+            consistent with the winding of faces.
+        `attributes`: optional tensor of per-voxel channels, e.g. colour or
+            uncertainty, of shape data.shape or data.shape + (num_channels,).
+            If given, also return the channels linearly interpolated at each
+            vertex with the same edge weights as vertex positions.
+        `spacing`: optional scalar or (3,) grid spacing, e.g. anisotropic
+            voxel size, by which vertex positions are scaled.
+        `origin`: optional scalar or (3,) position of `data[0, 0, 0]`, added
+            to vertex positions.
+        `affine`: optional (4, 4) matrix mapping homogeneous grid indices to
+            vertex positions, instead of `spacing` and `origin`. Normals are
+            transformed consistently, and the winding of faces is reversed if
+            the affine mirrors space (has a negative determinant).
+
+    The transform is applied as vertices are interpolated, so gradients with
+    respect to `data` (and any transform tensors) account for it.
+
+    Returns an array of vertex coordinates (Nv, 3) (float32) and an array of
+    per-face vertex indexes (Nf, 3), (int32), followed by an array of vertex
+    normals (Nv, 3) (float32) if `normals` and an array of vertex attributes
+    (Nv,) or (Nv, num_channels) (float32) if `attributes` is given.
+
+    Heavily based on numpy implementation in pyqt.
+    """
+    if not isinstance(data, tf.Tensor):
+        data = tf.convert_to_tensor(data, dtype=tf.float32)
+    if data.dtype != tf.float32:
+        data = tf.cast(data, tf.float32)
+    levels = tf.reshape(tf.cast(level, tf.float32), (1,))
+    if attributes is not None:
+        attributes = tf.expand_dims(attributes, axis=0)
+    outputs = _call_isosurface_fn(
+        tf.expand_dims(data, axis=0), levels, normals, attributes,
+        _affine_transform(spacing, origin, affine))
+    return outputs[:2] + outputs[4:]
+
+
+def isosurface_levels(data, levels):
+    """
+    Generate isosurfaces of a single volume at a number of levels.
+
+    The extrema of each plane of grid points are found once and shared
+    between levels, which are then extracted one at a time from the bounding
+    box of slabs of cells straddling each level. Peak memory is that of a
+    single `isosurface` call, whatever the number of levels.
+
+    Args:
+        `data`: 3D float32 tensor of scalar values.
+        `levels`: (num_levels,) float32 tensor of levels.
+
+    Returns:
+        `vertices`: (Nv, 3) float32 tensor of vertex positions of all
+            levels, concatenated.
+        `faces`: (Nf, 3) int32 tensor of faces of all levels, concatenated.
+            Vertex indices are relative to the level's first vertex.
+        `vertex_splits`: (num_levels + 1,) int32 tensor of row splits,
+            vertices of level i being
+            `vertices[vertex_splits[i]:vertex_splits[i+1]]`.
+        `face_splits`: (num_levels + 1,) int32 tensor of row splits of
+            `faces`.
+
+    Level ids of each vertex/face are given by
+    `tf.ragged.row_splits_to_segment_ids`, or ragged meshes by
+    `tf.RaggedTensor.from_row_splits`.
+    """
+    if not isinstance(data, tf.Tensor):
+        data = tf.convert_to_tensor(data, dtype=tf.float32)
+    if data.dtype != tf.float32:
+        data = tf.cast(data, tf.float32)
+    levels = tf.reshape(tf.cast(levels, tf.float32), (-1,))
+    return _levels_isosurface_fn(data, levels)
+
+
+def static_isosurface(data, level, max_vertices, max_faces):
+    """
+    Generate an isosurface using only ops with static output shapes.
+
+    Vertices and faces are compacted into buffers of fixed capacity using
+    prefix sums and segment sums rather than `tf.where`/`tf.boolean_mask`, so
+    the graph can be compiled by XLA, e.g. within
+    `tf.function(jit_compile=True)`. Within capacity, output matches
+    `isosurface`, except that grids without cells (i.e. with a dimension of
+    size 1) give an empty mesh rather than vertices without faces.
+
+    Args:
+        `data`: 3D float32 tensor of scalar values with fully-defined shape.
+        `level`: Scalar, the level at which to generate an isosurface
+        `max_vertices`: python int, capacity of the vertex buffer.
+        `max_faces`: python int, capacity of the face buffer.
+
+    Returns:
+        `vertices`: (max_vertices, 3) float32 tensor of vertex positions,
+            padded with infs.
+        `faces`: (max_faces, 3) int32 tensor of faces, padded with -1.
+        `num_vertices`: int32 scalar, number of vertices of the isosurface.
+        `num_faces`: int32 scalar, number of faces of the isosurface.
+        `overflow`: bool scalar, True if either count exceeds its capacity,
+            in which case the excess is dropped and faces may reference
+            vertices beyond `max_vertices`.
+    """
+    if not isinstance(data, tf.Tensor):
+        data = tf.convert_to_tensor(data, dtype=tf.float32)
+    if data.dtype != tf.float32:
+        data = tf.cast(data, tf.float32)
+    if not data.shape.is_fully_defined():
+        raise ValueError(
+            'static_isosurface requires a fully-defined data shape, got %s'
+            % data.shape)
+    shape = data.shape.as_list()
+    if min(shape) < 2:
+        # no cells, so nothing to mesh. Decided statically from the shape.
+        return (tf.fill((max_vertices, 3), np.float32(np.inf)),
+                tf.fill((max_faces, 3), -1),
+                tf.constant(0), tf.constant(0), tf.constant(False))
+    _, faceOffsets_tf, nTableFaces_tf = _get_cache_tensors()
+
+    # flat (x, y, z, axis) edge key offsets of each face vertex of each row
+    # of the flattened face table
+    edgeStrides = np.array([shape[1] * shape[2] * 3, shape[2] * 3, 3, 1])
+    caseKeys_tf = tf.constant(tables.faceShifts.dot(edgeStrides), tf.int32)
+
+    # mark everything below the isosurface level
+    mask = tf.cast(data < level, tf.int32)
 
-    # This works, but runs a bit slower.
-    # # all cells with at least one face
-    # cells = np.argwhere((index != 0) & (index != 255))
-    # cellInds = index[cells[:,0], cells[:,1], cells[:,2]]
-    # verts = faceTable[cellInds]
-    # mask = verts[...,0,0] != 9
-    # # we now have indexes into cutEdges
-    # verts[...,:3] += cells[:,np.newaxis,np.newaxis,:]
-    # verts = verts[mask]
-    # faces = cutEdges[verts[...,0], verts[...,1], verts[...,2], verts[...,3]]
-    # ## and these are the vertex indexes we want.
-
-    # To allow this to be vectorized efficiently, we count the number of faces
-    # in each grid cell and handle each group of cells with the same number
-    # together.
-    # determine how many faces to assign to each grid cell
+    # make eight sub-fields and compute indexes for grid cells, padded so
+    # flat indices of cells and grid points coincide.
+    updates = []
+    slices = [slice(0, -1), slice(1, None)]
+    for i in [0, 1]:
+        for j in [0, 1]:
+            for k in [0, 1]:
+                # this is just to match Bourk's vertex numbering scheme
+                vertIndex = i - 2 * j * i + 3 * j + 4 * k
+                m = mask[slices[i], slices[j], slices[k]]
+                updates.append(m * 2 ** vertIndex)
+    index = tf.reshape(tf.pad(tf.add_n(updates), [[0, 1]] * 3), (-1,))
+
+    # cut edges and interpolation parameters of all edges
+    cutEdges = []
+    params = []
+    for axis in range(3):
+        lower = [slice(None)] * 3
+        upper = [slice(None)] * 3
+        lower[axis] = slice(0, -1)
+        upper[axis] = slice(1, None)
+        padding = [[0, 0]] * 3
+        padding[axis] = [0, 1]
+        cut = tf.not_equal(mask[lower], mask[upper])
+        v1 = data[lower]
+        # avoid nans in the unused branch, which would poison gradients
+        dv = tf.where(cut, data[upper] - v1, tf.ones_like(v1))
+        cutEdges.append(tf.pad(cut, padding))
+        params.append(tf.pad((level - v1) / dv, padding))
+    cutEdges = tf.reshape(tf.stack(cutEdges, axis=-1), (-1,))
+    params = tf.reshape(tf.stack(params, axis=-1), (-1,))
+
+    # vertex IDs are the running count of cut edges in row-major order.
+    # Segment ids of -1 are dropped.
+    cutCount = tf.cast(cutEdges, tf.int32)
+    vertexIds = tf.cumsum(cutCount, exclusive=True)
+    num_vertices = tf.reduce_sum(cutCount)
+    segmentIds = tf.where(
+        tf.logical_and(cutEdges, vertexIds < max_vertices),
+        vertexIds, -tf.ones_like(vertexIds))
+    keys = tf.range(np.prod(shape) * 3, dtype=tf.int32)
+    keys = tf.math.unsorted_segment_sum(keys, segmentIds, max_vertices)
+    params = tf.math.unsorted_segment_sum(params, segmentIds, max_vertices)
+    points = keys // 3
+    coords = tf.stack([
+        points // (shape[1] * shape[2]),
+        points // shape[2] % shape[1],
+        points % shape[2]], axis=1)
+    vertices = tf.cast(coords, tf.float32) + \
+        tf.one_hot(keys % 3, 3) * tf.expand_dims(params, axis=1)
+    vertices = tf.where(
+        tf.expand_dims(tf.range(max_vertices) < num_vertices, axis=1),
+        vertices, np.inf)
+
+    # compact cells with faces into a buffer of max_faces, which bounds the
+    # number of such cells
     nFaces = tf.gather(nTableFaces_tf, index)
+    hasFaces = nFaces > 0
+    cellIds = tf.cumsum(tf.cast(hasFaces, tf.int32), exclusive=True)
+    segmentIds = tf.where(
+        tf.logical_and(hasFaces, cellIds < max_faces),
+        cellIds, -tf.ones_like(cellIds))
+    cells = tf.math.unsorted_segment_sum(
+        tf.range(np.prod(shape), dtype=tf.int32), segmentIds, max_faces)
+    cellInds = tf.math.unsorted_segment_sum(index, segmentIds, max_faces)
+    num_faces = tf.reduce_sum(nFaces)
+
+    # expand each cell into a fixed number of slots for its faces, which are
+    # consecutive rows of the flattened face table
+    cellFaces = tf.expand_dims(tf.gather(nTableFaces_tf, cellInds), axis=1)
+    slots = tf.range(int(tables.nTableFaces.max()))
+    faceIds = tf.cumsum(cellFaces, exclusive=True) + slots
+    rows = tf.minimum(
+        tf.expand_dims(tf.gather(faceOffsets_tf, cellInds), axis=1) + slots,
+        len(tables.faceShifts) - 1)
+    faceKeys = tf.reshape(cells * 3, (-1, 1, 1)) + \
+        tf.gather(caseKeys_tf, rows)
+    faces = tf.gather(vertexIds, faceKeys)
+    segmentIds = tf.where(
+        tf.logical_and(slots < cellFaces, faceIds < max_faces),
+        faceIds, -tf.ones_like(faceIds))
+    # offset by 1 so unused entries are -1
+    faces = tf.math.unsorted_segment_sum(faces + 1, segmentIds, max_faces) - 1
+
+    overflow = tf.logical_or(
+        num_vertices > max_vertices, num_faces > max_faces)
+    return vertices, faces, num_vertices, num_faces, overflow
+
+
+def _brick_active_cells(data, level, brick_size):
+    """
+    Get the cells of all bricks whose range of values includes `level`.
+
+    Computes the min/max of `data` over bricks of `brick_size`**3 cells
+    (including the far corners of the brick's cells) using a pooling pass.
+    Not all returned cells straddle `level` themselves.
+
+    Returns:
+        (N, 3) int32 tensor of cell coordinates. May include cells beyond the
+        grid where it does not divide evenly into bricks.
+    """
+    shape = tf.shape(data)
+    nBricks = (shape + brick_size - 2) // brick_size
+    # pad so the far corners of the last brick lie within the padded data
+    padding = nBricks * brick_size + 1 - shape
+    paddings = tf.pad(
+        tf.stack([tf.zeros_like(padding), padding], axis=1), [[1, 1], [0, 0]])
+    x = tf.expand_dims(tf.expand_dims(data, axis=0), axis=-1)
+    ksize = [1] + [brick_size + 1]*3 + [1]
+    strides = [1] + [brick_size]*3 + [1]
+
+    def brick_max(x):
+        x = tf.pad(x, paddings, constant_values=-np.inf)
+        return tf.nn.max_pool3d(x, ksize, strides, 'VALID')[0, ..., 0]
+
+    maxs = brick_max(x)
+    mins = -brick_max(-x)
+    bricks = tf.cast(
+        tf.where(tf.logical_and(mins < level, maxs >= level)), tf.int32)
+    r = tf.range(brick_size)
+    offsets = tf.reshape(
+        tf.stack(tf.meshgrid(r, r, r, indexing='ij'), axis=-1), (-1, 3))
+    cells = tf.expand_dims(bricks * brick_size, axis=1) + offsets
+    return tf.reshape(cells, (-1, 3))
+
+
+def sparse_isosurface(data, level, active_cells=None, brick_size=8):
+    """
+    Generate isosurface using only the cells which straddle `level`.
+
+    Produces the same mesh as `isosurface`, but rather than evaluating cube
+    indices and edge cuts over the entire grid, active cells are found first
+    and only those are processed. Memory usage hence scales with the surface
+    area rather than the volume.
 
-    faces = []
-
-    # cutEdges = tf.constant(cutEdges, dtype=tf.int32)
-    if not isinstance(index, tf.Tensor):
-        index = tf.constant(index, dtype=tf.int32)
-    elif index.dtype != tf.int32:
-        index = tf.cast(index, tf.int32)
-
-    for i in range(1, 6):
-        # expensive:
-        # all cells which require i faces  (argwhere is expensive)
-        cells = tf.where(tf.equal(nFaces, i))
-        cells = tf.cast(cells, tf.int32)
-        # index values of cells to process for this round
-        cellInds = tf.gather_nd(index, cells)
-
-        # expensive:
-        verts = tf.gather(faceShiftTables_tf[i-1], cellInds)
-        v0, v1 = tf.split(verts, [3, 1], axis=-1)
-        s0, s1 = (-1 if s is None else s for s in cells.shape.as_list())
-        cells = tf.reshape(cells, (s0, 1, 1, s1))
-        v0 = v0 + cells
-        verts = tf.concat([v0, v1], axis=-1)
-
-        verts = tf.reshape(verts, [-1] + verts.shape.as_list()[2:])
-
-        # expensive:
-        vertInds = tf.gather_nd(cutEdges, verts)
-        faces.append(vertInds)
-    faces = tf.concat(faces, axis=0)
+    Args:
+        `data`: 3D float32 tensor of scalar values.
+        `level`: Scalar, the level at which to generate an isosurface
+        `active_cells`: optional (N, 3) int32 tensor of candidate cell
+            coordinates, e.g. the narrow band of an SDF. Duplicates and cells
+            which are outside the grid or do not straddle `level` are
+            ignored. If None, candidates are found using a coarse min/max
+            pass over bricks of cells.
+        `brick_size`: number of cells along each dimension of the bricks used
+            to find candidate cells. Ignored if `active_cells` is given.
+
+    Returns an array of vertex coordinates (Nv, 3) (float32) and an array of
+    per-face vertex indexes (Nf, 3), (int32). Vertices are ordered by first
+    use in faces, so ordering may differ from that of `isosurface`. Grids
+    with fewer than two points along some axis have no cells, but may have
+    cut edges, so are extracted with `isosurface`.
+    """
+    if not isinstance(data, tf.Tensor):
+        data = tf.convert_to_tensor(data, dtype=tf.float32)
+    if data.dtype != tf.float32:
+        data = tf.cast(data, tf.float32)
+
+    def sparse_fn():
+        return _sparse_isosurface(data, level, active_cells, brick_size)
+
+    return tf.cond(
+        tf.reduce_min(tf.shape(data)) < 2,
+        lambda: isosurface(data, level), sparse_fn)
+
+
+def _sparse_isosurface(data, level, active_cells, brick_size):
+    """`sparse_isosurface` of a grid with at least one cell."""
+    faceShifts_tf, faceOffsets_tf, nTableFaces_tf = _get_cache_tensors()
+
+    shape = tf.shape(data)
+    if active_cells is None:
+        cells = _brick_active_cells(data, level, brick_size)
+    else:
+        cells = tf.cast(active_cells, tf.int32)
+    valid = tf.reduce_all(
+        tf.logical_and(cells >= 0, cells < shape - 1), axis=1)
+    cells = tf.boolean_mask(cells, valid)
+    if active_cells is not None:
+        # remove duplicates using flat indices into the grid
+        cellShape = tf.cast(shape, tf.int64)
+        cellStrides = tf.math.cumprod(cellShape, exclusive=True, reverse=True)
+        keys = tf.reduce_sum(tf.cast(cells, tf.int64) * cellStrides, axis=-1)
+        keys = tf.unique(keys)[0]
+        cells = tf.cast(
+            tf.expand_dims(keys, axis=1) // cellStrides % cellShape, tf.int32)
+
+    # compute indexes of candidate cells from their eight corners
+    updates = []
+    for i in [0, 1]:
+        for j in [0, 1]:
+            for k in [0, 1]:
+                # this is just to match Bourk's vertex numbering scheme
+                vertIndex = i - 2 * j * i + 3 * j + 4 * k
+                m = tf.gather_nd(data, cells + [i, j, k]) < level
+                updates.append(tf.cast(m, tf.int32) * 2 ** vertIndex)
+    index = tf.add_n(updates)
+    active = tf.logical_and(index > 0, index < 255)
+    cells = tf.boolean_mask(cells, active)
+    index = tf.boolean_mask(index, active)
+
+    verts = _face_edges(cells, index, faceShifts_tf, faceOffsets_tf)
+
+    # identify edges shared between cells by their flat index into an
+    # (x, y, z, axis) grid of edges
+    edgeShape = tf.cast(tf.concat([shape, [3]], axis=0), tf.int64)
+    edgeStrides = tf.math.cumprod(edgeShape, exclusive=True, reverse=True)
+    keys = tf.reduce_sum(tf.cast(verts, tf.int64) * edgeStrides, axis=-1)
+    keys, faces = tf.unique(tf.reshape(keys, (-1,)))
+    faces = tf.reshape(faces, (-1, 3))
+
+    vertexInds = tf.cast(
+        tf.expand_dims(keys, axis=1) // edgeStrides % edgeShape, tf.int32)
+    vertexes = _interpolate_vertices(data, level, vertexInds)
 
     return vertexes, faces
 
 
+def compact_mesh(vertices, faces):
+    """
+    Remove vertices not referenced by any face.
+
+    Meshes from `isosurface` have exactly one vertex per cut edge, each used
+    by some face (unless the grid has no cells). This is useful after
+    selecting a subset of faces, e.g. when cropping.
+
+    Args:
+        `vertices`: (Nv, 3) float32 tensor of vertex positions.
+        `faces`: (Nf, 3) int32 tensor of vertex indices.
+
+    Returns:
+        `vertices`: (Nv', 3) float32 tensor of referenced vertices, in their
+            original order.
+        `faces`: (Nf, 3) int32 tensor of faces indexing into the returned
+            vertices.
+    """
+    flatFaces = tf.reshape(faces, (-1, 1))
+    used = tf.scatter_nd(
+        flatFaces, tf.ones_like(flatFaces[:, 0]),
+        tf.shape(vertices, out_type=faces.dtype)[:1]) > 0
+    newIds = tf.cumsum(tf.cast(used, faces.dtype), exclusive=True)
+    return tf.boolean_mask(vertices, used), tf.gather(newIds, faces)
+
+
 def batch_isosurface(data, level, mesh_map_fn, dtype=None, **map_kwargs):
     """
     Performs isosurface extraction on each entry of data and maps the output.
@@ -616,11 +914,40 @@ def batch_isosurface(data, level, mesh_map_fn, dtype=None, **map_kwargs):
         verts, faces = isosurface(x, level)
         return mesh_map_fn(verts, faces)
 
-    return tf.map_fn(map_fn, data, dtype, **map_kwargs)
+    return tf.map_fn(
+        map_fn, data, fn_output_signature=dtype, **map_kwargs)
+
+
+def batch_ragged_isosurface(data, level):
+    """
+    Extracts isosurfaces from 4D batched embedding grid as ragged tensors.
+
+    Unlike `batch_padded_isosurface`, there are no size caps, so nothing is
+    cropped and no memory is spent on padding.
+
+    Args:
+        `data`: 4D tensor of batch_size 3D grids of embedding function data
+        `level`: scalar, or (batch_size,) tensor of per-example levels.
+
+    Returns:
+        `vertices`: (batch_size, None, 3) float32 `tf.RaggedTensor` of vertex
+            positions.
+        `faces`: (batch_size, None, 3) int32 `tf.RaggedTensor` of faces,
+            indexing into the vertices of the same example.
+
+    See `batch_flat_isosurface` for the underlying values and row splits.
+    """
+    verts, faces, vertex_splits, face_splits = batch_flat_isosurface(
+        data, level)
+    verts = tf.RaggedTensor.from_row_splits(
+        verts, vertex_splits, validate=False)
+    faces = tf.RaggedTensor.from_row_splits(
+        faces, face_splits, validate=False)
+    return verts, faces
 
 
-def batch_padded_isosurface(
-        data, level, max_vertices, max_faces, **map_kwargs):
+def batch_padded_isosurface(data, level, max_vertices, max_faces,
+                            **map_kwargs):
     """
     Extracts an isosurface from 4D batched embedding grid in `data`.
 
@@ -629,21 +956,25 @@ def batch_padded_isosurface(
 
     Args:
         `data`: 4D tensor of batch_size 3D grids of embedding function data
-        `level`: scalar, level of isosurface
+        `level`: scalar, or (batch_size,) tensor of per-example levels.
         `max_vertices`: maximum number of vertices. If the isosurface has less
             vertices, the remaining space is filled with infs. If more, only
             the first `max_vertices` are returned. Note faces may reference
             some of the cropped vertices, and it is up to the user to deal with
-            this.
+            this. If None, vertices are not padded.
         `max_faces`: maximum number of faces. If the calculated isosurface has
             less faces, the remaining spaces are filled with -1. If more, the
-            overflow faces are cropped out.
-        `map_kwargs`: passed to `tf.map_fn`
+            overflow faces are cropped out. If None, faces are not padded.
+        `map_kwargs`: deprecated and ignored. Previously passed to
+            `tf.map_fn`, which is no longer used.
 
     Returns:
         `vertices`: (batch_size, max_vertices, 3) float32 tensor of vertex
-            positions
-        `faces`: (batch_size, max_faces, 3) int32 tensor of triangulated faces
+            positions, or a (batch_size, None, 3) `tf.RaggedTensor` if
+            `max_vertices` is None.
+        `faces`: (batch_size, max_faces, 3) int32 tensor of triangulated
+            faces, or a (batch_size, None, 3) `tf.RaggedTensor` if
+            `max_faces` is None.
         `num_vertices`: (batch_size,) int32 tensor indicating the number
             of vertices in the isosurface. If num_vertices < max_vertices,
             padding occured, otherwise the result was cropped.
@@ -651,27 +982,410 @@ def batch_padded_isosurface(
             of vertices in the isosurface. If num_faces < max_faces,
             padding occured, otherwise the result was cropped.
     """
-    _get_cache_tensors()
-
-    def mesh_map_fn(verts_jagged, faces_jagged):
-        nv = tf.shape(verts_jagged)[0]
-        verts = tf.cond(
-            tf.greater(nv, max_vertices),
-            lambda: verts_jagged[:max_vertices],
-            lambda: tf.pad(
-                verts_jagged, [[0, max_vertices-nv], [0, 0]],
-                constant_values=np.inf)
-            )
-
-        nf = tf.shape(faces_jagged)[0]
-        faces = tf.cond(
-            tf.greater(nf, max_faces),
-            lambda: faces_jagged[:max_faces],
-            lambda: tf.pad(
-                faces_jagged, [[0, max_faces-nf], [0, 0]], constant_values=-1)
-        )
-        return verts, faces, nv, nf
-
-    dtype = tf.float32, tf.int32, tf.int32, tf.int32
-
-    return batch_isosurface(data, level, mesh_map_fn, dtype, **map_kwargs)
+    if map_kwargs:
+        warnings.warn(
+            '`map_kwargs` of `batch_padded_isosurface` are deprecated and '
+            'ignored', DeprecationWarning, stacklevel=2)
+    verts, faces, vertex_splits, face_splits = batch_flat_isosurface(
+        data, level)
+    verts = _batch_rows(
+        verts, vertex_splits, max_vertices, np.inf, data.shape[0])
+    faces = _batch_rows(faces, face_splits, max_faces, -1, data.shape[0])
+    num_vertices = vertex_splits[1:] - vertex_splits[:-1]
+    num_faces = face_splits[1:] - face_splits[:-1]
+    return verts, faces, num_vertices, num_faces
+
+
+def _batch_rows(values, splits, max_rows, pad_value, batch_size=None):
+    """
+    Arrange concatenated rows by example, padded only if `max_rows` is given.
+
+    Args:
+        `values`: (N, 3) tensor of concatenated rows.
+        `splits`: (batch_size + 1,) int32 row splits of `values`.
+        `max_rows`: size of each row in the output, or None.
+        `pad_value`: value of padded entries.
+        `batch_size`: static batch size, if known.
+
+    Returns:
+        (batch_size, max_rows, 3) tensor with static shape set, or a
+        (batch_size, None, 3) `tf.RaggedTensor` if `max_rows` is None.
+    """
+    if max_rows is None:
+        return tf.RaggedTensor.from_row_splits(values, splits, validate=False)
+    padded = _pad_rows(values, splits, max_rows, pad_value)
+    padded.set_shape((batch_size, max_rows, 3))
+    return padded
+
+
+def _pad_rows(values, splits, max_rows, pad_value):
+    """
+    Arrange concatenated rows into a padded (and cropped) dense tensor.
+
+    Args:
+        `values`: (N, 3) tensor of concatenated rows.
+        `splits`: (batch_size + 1,) int32 row splits of `values`.
+        `max_rows`: size of each row in the output.
+        `pad_value`: value of padded entries.
+
+    Returns:
+        (batch_size, max_rows, 3) tensor.
+    """
+    rowIds = tf.ragged.row_splits_to_segment_ids(splits)
+    index = tf.range(tf.shape(values)[0]) - tf.gather(splits, rowIds)
+    keep = index < max_rows
+    indices = tf.boolean_mask(tf.stack([rowIds, index], axis=1), keep)
+    padded = tf.fill(
+        tf.stack([tf.shape(splits)[0] - 1, max_rows, 3]),
+        tf.cast(pad_value, values.dtype))
+    return tf.tensor_scatter_nd_update(
+        padded, indices, tf.boolean_mask(values, keep))
+
+
+ContourTensorCache = None
+
+
+def _get_contour_tensors():
+    """Get marching squares lookup tables as constant tensors."""
+    global ContourTensorCache
+    if ContourTensorCache is None:
+        with tf.init_scope():
+            ContourTensorCache = (
+                tf.constant(tables.segmentShifts, dtype=tf.int32),
+                tf.constant(tables.segmentOffsets, dtype=tf.int32),
+                tf.constant(tables.nTableSegments, dtype=tf.int32))
+    return ContourTensorCache
+
+
+def _flat_contour(data, levels):
+    """
+    Batched marching squares, as `batch_flat_contour`.
+
+    Args:
+        `data`: 3D float32 tensor of batch_size 2D grids.
+        `levels`: (batch_size,) float32 tensor of per-example levels.
+    """
+    segmentShifts_tf, segmentOffsets_tf, nTableSegments_tf = \
+        _get_contour_tensors()
+
+    shape = tf.shape(data)
+    mask = data < tf.reshape(levels, (-1, 1, 1))
+
+    # Cut edges are found with the only passes over the whole grid.
+    # Everything else is computed for cut edges and the squares containing
+    # them, so the cost of contouring many large slices is dominated by
+    # comparisons.
+    vertexInds = []
+    for axis in range(2):
+        lower = [slice(None)] * 3
+        upper = [slice(None)] * 3
+        lower[axis + 1] = slice(0, -1)
+        upper[axis + 1] = slice(1, None)
+        inds = tf.where(tf.not_equal(mask[lower], mask[upper]))
+        vertexInds.append(
+            tf.pad(tf.cast(inds, tf.int32), [[0, 0], [0, 1]],
+                   constant_values=axis))
+    vertexInds = tf.concat(vertexInds, axis=0)
+
+    # identify edges by their flat index into a (batch, x, y, axis) grid of
+    # edges. Sorting gives the row-major order of dense marching squares, so
+    # vertices are grouped by example.
+    edgeShape = tf.cast(tf.concat([shape, [2]], axis=0), tf.int64)
+    edgeStrides = tf.math.cumprod(edgeShape, exclusive=True, reverse=True)
+    keys = tf.reduce_sum(tf.cast(vertexInds, tf.int64) * edgeStrides, axis=1)
+    order = tf.argsort(keys)
+    keys = tf.gather(keys, order)
+    vertexInds = tf.gather(vertexInds, order)
+    vertexes = _interpolate_vertices(
+        data, tf.gather(levels, vertexInds[:, 0]), vertexInds, ndims=2)
+    vertex_splits = tf.searchsorted(
+        keys, tf.range(tf.cast(shape[0] + 1, tf.int64)) * edgeStrides[0],
+        out_type=tf.int32)
+
+    # each cut edge lies in the squares on either side of it. Squares are
+    # identified by the flat index of their first corner, and are in
+    # row-major order after sorting.
+    cellShape = tf.cast(shape, tf.int64)
+    cellStrides = tf.math.cumprod(cellShape, exclusive=True, reverse=True)
+    starts, axes = tf.split(vertexInds, [3, 1], axis=1)
+    across = tf.one_hot(2 - axes[:, 0], 3, dtype=tf.int32)
+    squares = tf.concat([starts, starts - across], axis=0)
+    valid = tf.reduce_all(tf.logical_and(
+        squares[:, 1:] >= 0, squares[:, 1:] < shape[1:] - 1), axis=1)
+    squareKeys = tf.sort(tf.reduce_sum(
+        tf.cast(tf.boolean_mask(squares, valid), tf.int64) * cellStrides,
+        axis=1))
+    squareKeys = tf.boolean_mask(squareKeys, tf.not_equal(
+        squareKeys, tf.pad(squareKeys[:-1], [[1, 0]], constant_values=-1)))
+    squares = tf.cast(
+        tf.expand_dims(squareKeys, axis=1) // cellStrides % cellShape,
+        tf.int32)
+
+    # compute indexes of squares from their four corners
+    updates = []
+    for i in [0, 1]:
+        for j in [0, 1]:
+            vertIndex = i - 2 * j * i + 3 * j
+            m = tf.gather_nd(mask, squares + [0, i, j])
+            updates.append(tf.cast(m, tf.int32) * 2 ** vertIndex)
+    index = tf.add_n(updates)
+
+    nSegments = tf.math.unsorted_segment_sum(
+        tf.gather(nTableSegments_tf, index), squares[:, 0], shape[0])
+    edge_splits = tf.pad(tf.cumsum(nSegments), [[1, 0]])
+    verts = _face_edges(
+        squares, index, segmentShifts_tf, segmentOffsets_tf, ndims=2)
+    edgeKeys = tf.reduce_sum(tf.cast(verts, tf.int64) * edgeStrides, axis=-1)
+    edges = tf.reshape(
+        tf.searchsorted(keys, tf.reshape(edgeKeys, (-1,)),
+                        out_type=tf.int32), (-1, 2))
+    edges -= tf.gather(vertex_splits, verts[:, :1, 0])
+
+    return vertexes, edges, vertex_splits, edge_splits
+
+
+_batch_flat_contour_fn = tf.function(
+    _flat_contour, input_signature=(
+        tf.TensorSpec((None, None, None), tf.float32),
+        tf.TensorSpec((None,), tf.float32)))
+
+
+@tf.function(input_signature=(
+    tf.TensorSpec((None, 2), tf.int32), tf.TensorSpec((), tf.int32)))
+def _chain_segments(edges, numVertices):
+    """
+    Order consistently directed segments into polylines.
+
+    Each vertex starts at most one segment and ends at most one segment, so
+    polylines are found by pointer jumping in O(log(numVertices)) steps.
+    Closed loops are broken at their smallest vertex.
+
+    Args:
+        `edges`: (Ne, 2) int32 tensor of directed segments.
+        `numVertices`: number of vertices.
+
+    Returns:
+        `polylines`: int32 tensor of vertex indices of all polylines,
+            concatenated. Closed loops end with a repeat of their first
+            vertex.
+        `polyline_splits`: int32 row splits of `polylines`.
+    """
+    ids = tf.range(numVertices)
+    pred = tf.tensor_scatter_nd_update(
+        -tf.ones_like(ids), edges[:, 1:], edges[:, 0])
+
+    def jump(pred, values, combine):
+        # `values` combined over all predecessors, and the first vertex
+        ancestor = tf.where(pred >= 0, pred, ids)
+
+        def body(step, ancestor, values):
+            values = combine(values, tf.gather(values, ancestor))
+            return step * 2, tf.gather(ancestor, ancestor), values
+
+        _, ancestor, values = tf.while_loop(
+            lambda step, ancestor, values: step < numVertices, body,
+            (tf.constant(1), ancestor, values))
+        return ancestor, values
+
+    # find the smallest vertex of each loop. Vertices of open polylines jump
+    # to the first vertex, which has no predecessor.
+    first, smallest = jump(pred, ids, tf.minimum)
+    closed = tf.logical_and(tf.gather(pred, first) >= 0, smallest == ids)
+    pred = tf.where(closed, -1, pred)
+
+    first, rank = jump(pred, tf.cast(pred >= 0, tf.int32), tf.add)
+
+    # closed loops are completed by repeating their first vertex
+    loopStarts = tf.boolean_mask(ids, closed)
+    first = tf.concat([first, loopStarts], axis=0)
+    rank = tf.concat(
+        [rank, tf.fill(tf.shape(loopStarts), numVertices)], axis=0)
+    ids = tf.concat([ids, loopStarts], axis=0)
+
+    order = tf.argsort(
+        tf.cast(first, tf.int64) * tf.cast(numVertices + 1, tf.int64) +
+        tf.cast(rank, tf.int64))
+    first = tf.gather(first, order)
+    polylines = tf.gather(ids, order)
+    starts = tf.not_equal(
+        first, tf.pad(first[:-1], [[1, 0]], constant_values=-1))
+    polyline_splits = tf.concat([
+        tf.cast(tf.where(starts)[:, 0], tf.int32),
+        tf.shape(polylines)], axis=0)
+    return polylines, polyline_splits
+
+
+def contour(data, level, chain=False):
+    """
+    Generate contours of a 2D grid using marching squares.
+
+    Shares the table-driven design of `isosurface`, with one vertex per cut
+    edge and segments looked up from a 16-case table. Segments are directed
+    with values below `level` on their left, and in saddle squares values
+    below `level` are connected.
+
+    Args:
+        `data`: 2D float32 tensor of scalar values.
+        `level`: Scalar, the level at which to generate contours.
+        `chain`: if True, also order segments into polylines.
+
+    Returns:
+        `vertices`: (Nv, 2) float32 tensor of vertex coordinates.
+        `edges`: (Ne, 2) int32 tensor of segment vertex indices.
+        `polylines`: if `chain`, int32 tensor of vertex indices of each
+            polyline, concatenated. Closed polylines end with their first
+            vertex.
+        `polyline_splits`: if `chain`, int32 row splits of `polylines`.
+    """
+    if not isinstance(data, tf.Tensor):
+        data = tf.convert_to_tensor(data, dtype=tf.float32)
+    if data.dtype != tf.float32:
+        data = tf.cast(data, tf.float32)
+    levels = tf.reshape(tf.cast(level, tf.float32), (1,))
+    vertexes, edges, _, _ = _batch_flat_contour_fn(
+        tf.expand_dims(data, axis=0), levels)
+    if not chain:
+        return vertexes, edges
+    polylines, polyline_splits = _chain_segments(
+        edges, tf.shape(vertexes)[0])
+    return vertexes, edges, polylines, polyline_splits
+
+
+def batch_flat_contour(data, level):
+    """
+    Generate contours for a batch of 2D grids in a single set of ops.
+
+    Each example gives the same contours as `contour`.
+
+    Args:
+        `data`: 3D float32 tensor of batch_size 2D grids of scalar values.
+        `level`: scalar, or (batch_size,) tensor of per-example levels.
+
+    Returns:
+        `vertices`: (Nv, 2) float32 tensor of vertex coordinates of all
+            examples, concatenated.
+        `edges`: (Ne, 2) int32 tensor of segments of all examples,
+            concatenated. Vertex indices are relative to the example's first
+            vertex.
+        `vertex_splits`: (batch_size + 1,) int32 tensor of row splits of
+            `vertices`.
+        `edge_splits`: (batch_size + 1,) int32 tensor of row splits of
+            `edges`.
+    """
+    if not isinstance(data, tf.Tensor):
+        data = tf.convert_to_tensor(data, dtype=tf.float32)
+    if data.dtype != tf.float32:
+        data = tf.cast(data, tf.float32)
+    levels = tf.zeros(tf.shape(data)[:1]) + tf.cast(level, tf.float32)
+    return _batch_flat_contour_fn(data, levels)
+
+
+def contour_slices(volume, level, axis=0):
+    """
+    Generate contours of every slice of a volume along an axis.
+
+    Slices are treated as a batch of 2D grids, so all contours are computed
+    in a single set of ops rather than one slice at a time. Each slice gives
+    the same contours as `contour`.
+
+    Args:
+        `volume`: 3D float32 tensor of scalar values.
+        `level`: scalar, or (num_slices,) tensor of per-slice levels.
+        `axis`: axis along which to slice `volume`.
+
+    Returns:
+        `vertices`: (num_slices, None, 2) float32 `tf.RaggedTensor` of vertex
+            coordinates within each slice, along the remaining two axes in
+            order.
+        `edges`: (num_slices, None, 2) int32 `tf.RaggedTensor` of segments,
+            indexing into the vertices of the same slice.
+    """
+    if not isinstance(volume, tf.Tensor):
+        volume = tf.convert_to_tensor(volume, dtype=tf.float32)
+    if axis < 0:
+        axis += 3
+    if axis != 0:
+        perm = [axis] + [i for i in range(3) if i != axis]
+        volume = tf.transpose(volume, perm)
+    verts, edges, vertex_splits, edge_splits = batch_flat_contour(
+        volume, level)
+    verts = tf.RaggedTensor.from_row_splits(
+        verts, vertex_splits, validate=False)
+    edges = tf.RaggedTensor.from_row_splits(
+        edges, edge_splits, validate=False)
+    return verts, edges
+
+
+def _warn_deprecated(name, replacement):
+    warnings.warn(
+        '`%s` is deprecated, use `%s`' % (name, replacement),
+        DeprecationWarning, stacklevel=3)
+
+
+def scatter_added(ref, condition, updates):
+    """
+    Deprecated. Performs scatter_add for non-variables, i.e.
+        ref[condition] += updates.
+
+    Use `tf.tensor_scatter_nd_add(ref, tf.where(condition), updates)`.
+    """
+    _warn_deprecated('scatter_added', 'tf.tensor_scatter_nd_add')
+    return _scatter_where(tf.tensor_scatter_nd_add, ref, condition, updates)
+
+
+def scatter_updated(ref, condition, updates):
+    """
+    Deprecated. Performs scatter_update for non-variables, i.e.
+        ref[condition] = updates.
+
+    Use `tf.tensor_scatter_nd_update(ref, tf.where(condition), updates)`.
+    """
+    _warn_deprecated('scatter_updated', 'tf.tensor_scatter_nd_update')
+    return _scatter_where(
+        tf.tensor_scatter_nd_update, ref, condition, updates)
+
+
+def _scatter_where(scatter_fn, ref, condition, updates):
+    """
+    `scatter_fn(ref, tf.where(condition), updates)`, with `updates`
+    broadcast to `ref[condition]` as in the original helpers.
+    """
+    ref = tf.convert_to_tensor(ref)
+    indices = tf.where(condition)
+    updates = tf.broadcast_to(
+        tf.convert_to_tensor(updates, dtype=ref.dtype),
+        tf.shape(tf.gather_nd(ref, indices)))
+    return scatter_fn(ref, indices, updates)
+
+
+def _indices_condition(ref, indices):
+    """Mask of `ref`'s shape, True at `indices`."""
+    indices = tf.convert_to_tensor(indices)
+    return tf.scatter_nd(
+        indices, tf.ones(tf.shape(indices)[:1], dtype=tf.int32),
+        tf.shape(ref, out_type=indices.dtype)[:indices.shape[-1]]) > 0
+
+
+def gather_added(ref, indices, updates):
+    """
+    Deprecated. `scatter_added` at `indices`, with `updates` in row-major
+    order of the (deduplicated) indices.
+
+    Use `tf.tensor_scatter_nd_add`.
+    """
+    _warn_deprecated('gather_added', 'tf.tensor_scatter_nd_add')
+    condition = _indices_condition(ref, indices)
+    return _scatter_where(tf.tensor_scatter_nd_add, ref, condition, updates)
+
+
+def gather_updated(ref, indices, updates):
+    """
+    Deprecated. `scatter_updated` at `indices`, with `updates` in row-major
+    order of the (deduplicated) indices.
+
+    Use `tf.tensor_scatter_nd_update`.
+    """
+    _warn_deprecated('gather_updated', 'tf.tensor_scatter_nd_update')
+    condition = _indices_condition(ref, indices)
+    return _scatter_where(
+        tf.tensor_scatter_nd_update, ref, condition, updates)
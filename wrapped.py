@@ -3,9 +3,18 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import multiprocessing
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
 import numpy as np
 import tensorflow as tf
-from skimage import measure
+from .np_impl import minmax
+from .tf_impl import _batch_rows
+from .sk_impl import _measure, _marching_cubes_classic
+from .sk_impl import _lewiner, _lewiner_worker
 
 
 def find_contours(data, level, back_prop=False, **kwargs):
@@ -25,17 +34,18 @@ def find_contours(data, level, back_prop=False, **kwargs):
         lengths: (m,) array of contour lengths.
     """
     def fn(data):
-        if level < np.min(data) or level > np.max(data):
-            verts = np.zeros((0, 3), dtype=np.float32)
+        dataMin, dataMax = minmax(data)
+        if level < dataMin or level > dataMax:
+            verts = np.zeros((0, 2), dtype=np.float32)
             lengths = np.zeros((0,), dtype=np.int32)
         else:
-            contours = measure.find_contours(data, level, **kwargs)
-            verts = np.concatenate(contours, axis=0).astype(np.float32)
+            contours = _measure().find_contours(data, level, **kwargs)
+            verts = np.concatenate(contours, axis=0, dtype=np.float32)
             lengths = np.array([len(c) for c in contours], dtype=np.int32)
         return verts, lengths
 
     with tf.name_scope('find_contours'):
-        verts, lengths = tf.py_func(
+        verts, lengths = tf.numpy_function(
             fn, (data,), (tf.float32, tf.int32), stateful=False)
         verts.set_shape((None, 2))
         lengths.set_shape((None,))
@@ -53,7 +63,9 @@ def marching_cubes_classic(volume, level, back_prop=False, **kwargs):
         level: value of isosurface to extract
         back_prop: if True, gradients can propagate through vertices via
             `vertex_gradient_hack`
-        **kwargs: passed to `skimage.measure.marching_cubes_classic`
+        **kwargs: passed to `skimage.measure.marching_cubes_classic`, or
+            `skimage.measure.marching_cubes(method='lorensen')` in skimage
+            versions without it.
 
     Note: the outputs are not differentiable.
 
@@ -61,33 +73,31 @@ def marching_cubes_classic(volume, level, back_prop=False, **kwargs):
     http://scikit-image.org/docs/dev/api/skimage.measure.html#skimage.measure.marching_cubes_classic
     """
     def fn(vol):
-        if (np.min(vol) < level < np.max(vol)):
-            vertices, faces = measure.marching_cubes_classic(
-                vol, level, **kwargs)
-            vertices = vertices.astype(np.float32)
-            faces = faces.astype(np.float32)
+        volMin, volMax = minmax(vol)
+        if volMin < level < volMax:
+            vertices, faces = _marching_cubes_classic(vol, level, **kwargs)
+            vertices = vertices.astype(np.float32, copy=False)
+            faces = faces.astype(np.int32, copy=False)
         else:
             vertices = np.zeros((0, 3), np.float32)
             faces = np.zeros((0, 3), np.int32)
         return vertices, faces
 
     with tf.name_scope('marching_cubes_classic'):
-        verts, faces = tf.py_func(
+        verts, faces = tf.numpy_function(
             fn, (volume,), (tf.float32, tf.int32), stateful=False)
         verts.set_shape((None, 3))
         faces.set_shape((None, 3))
         if back_prop:
-            if 'spacing' in kwargs and kwargs['spacing'] != (1, 1, 1):
-                raise NotImplementedError(
-                    'Non-unit spacing not supported')
-            verts = vertex_gradient_hack(verts, volume, level=level)
+            verts = vertex_gradient_hack(
+                verts, volume, level=level, spacing=kwargs.get('spacing'))
     return verts, faces
 
 
 def get_normals(verts, faces, normalize=False):
     vf = tf.gather(verts, faces)
     u, v, w = tf.unstack(vf, axis=-1)
-    normals = tf.cross(v - u, w - u)
+    normals = tf.linalg.cross(v - u, w - u)
     if normalize:
         normals = normals / tf.sqrt(
             tf.reduce_sum(normals**2, axis=-1, keepdims=True))
@@ -121,21 +131,10 @@ def marching_cubes_lewiner(
     http://scikit-image.org/docs/dev/api/skimage.measure.html#skimage.measure.marching_cubes_lewiner
     """
     def fn(vol):
-        if (np.min(vol) < level < np.max(vol)):
-            verts, faces, normals, values = measure.marching_cubes_lewiner(
-                vol, level=level, **kwargs)
-            faces = faces.astype(np.int32)
-            empty = False
-        else:
-            verts = np.zeros(shape=(0, 3), dtype=np.float32)
-            faces = np.zeros(shape=(0, 3), dtype=np.int32)
-            normals = np.zeros(shape=(0, 3), dtype=np.float32)
-            values = np.zeros(shape=(0,), dtype=np.float32)
-            empty = True
-        return verts, faces, normals, values, empty
+        return _lewiner(vol, level, **kwargs)
 
     with tf.name_scope('marching_cubes_lewiner'):
-        verts, faces, normals, values, empty = tf.py_func(
+        verts, faces, normals, values, empty = tf.numpy_function(
             fn, (volume,),
             (tf.float32, tf.int32, tf.float32, tf.float32, tf.bool),
             stateful=False)
@@ -145,14 +144,8 @@ def marching_cubes_lewiner(
         values.set_shape((None,))
         empty.set_shape(())
         if back_prop:
-            if 'spacing' in kwargs and kwargs['spacing'] != (1, 1, 1):
-                raise NotImplementedError(
-                    'Non-unit spacing not supported')
-            verts = tf.check_numerics(verts, 'verts')
-            verts = tf.cond(
-                empty, lambda: verts,
-                lambda: vertex_gradient_hack(verts, volume, level=level))
-            # verts = tf.check_numerics(verts, 'verts_post_hack')
+            verts = vertex_gradient_hack(
+                verts, volume, level=level, spacing=kwargs.get('spacing'))
         if back_prop_normals:
             if not back_prop:
                 raise ValueError(
@@ -164,96 +157,169 @@ def marching_cubes_lewiner(
     return verts, faces, normals, values, empty
 
 
-def vertex_gradient_hack2(vertices, data, level=0):
-    with tf.name_scope('vertex_gradient_hack2'):
-        # vertices = tf.Print(vertices, [vertices])
+LewinerPool = None
 
-        v0 = tf.floor(vertices)
-        v0i = tf.cast(v0, tf.int32)
-        # 2 of 3 dims of vertices is an int, so cannot just add 1 like below
-        # v1 = v0 + 1
-        v1 = tf.ceil(vertices)
-        v1i = tf.cast(v1, tf.int32)
 
-        n_diff = tf.count_nonzero(
-            tf.logical_not(tf.equal(v0i, v1i)), axis=-1)
+def _get_pool(workers):
+    """Get the process pool used by `batch_marching_cubes_lewiner`."""
+    global LewinerPool
+    if LewinerPool is None:
+        # spawn rather than fork, as forking a process running tensorflow
+        # threads is unsafe
+        LewinerPool = ProcessPoolExecutor(
+            workers or os.cpu_count(),
+            mp_context=multiprocessing.get_context('spawn'))
+    return LewinerPool
 
-        valid_mask = tf.equal(n_diff, 1)
-        vertices = tf.boolean_mask(vertices, valid_mask)
 
-        v0, v0i, v1, v1i = (tf.boolean_mask(v, valid_mask) for v in (
-            v0, v0i, v1, v1i))
+def _reset_pool():
+    """Discard a broken pool, so the next call starts a new one."""
+    global LewinerPool
+    if LewinerPool is not None:
+        LewinerPool.shutdown(wait=False)
+        LewinerPool = None
 
-        f0 = tf.gather_nd(data, v0i)
-        f1 = tf.gather_nd(data, v1i)
 
-        numer = f0 if level == 0 else f0 - level
-        denom = f0 - f1
-        alpha = numer / denom  # possible catastrophic cancellation source?
+def batch_marching_cubes_lewiner(
+        volumes, level, max_vertices=None, max_faces=None, workers=None,
+        **kwargs):
+    """
+    Batched `marching_cubes_lewiner` using a persistent process pool.
+
+    Volumes are copied once into shared memory, from which examples are
+    extracted in parallel by worker processes, so extraction scales with
+    cores rather than being serialized by the GIL.
 
-        alpha = tf.expand_dims(alpha, axis=-1)
-        interped = (1 - alpha)*v0 + alpha*v1
-    return interped
+    Workers are started with the `spawn` method, so each re-imports the
+    calling script's `__main__` module: scripts must guard their top-level
+    code with `if __name__ == '__main__':`. The first call also pays for
+    workers importing everything `__main__` imports (e.g. tensorflow), so
+    the pool is best warmed up before timing.
 
+    Args:
+        volumes: 4D tensor of batch_size 3D grids of embedding values.
+        level: value of isosurface to extract
+        max_vertices, max_faces: if given, vertices/faces are padded/cropped
+            to these sizes as in `batch_padded_isosurface`. Otherwise they
+            are ragged, as in `batch_ragged_isosurface`.
+        workers: number of worker processes. Defaults to the number of CPUs.
+            Only used when the pool is first created.
+        **kwargs: passed to wrapped function. Must be normal python
+            variables, not tensors.
 
-def vertex_gradient_hack(vertices, data, level=0):
+    Returns:
+        If `max_vertices` and `max_faces` are None, (batch_size, None, 3)
+        float32 vertex and int32 face `tf.RaggedTensor`s. Otherwise
+        vertices, faces, num_vertices and num_faces as in
+        `batch_padded_isosurface`, with vertices/faces ragged if their cap
+        is None.
+    """
+    def fn(volumes):
+        volumes = np.ascontiguousarray(volumes)
+        shm = SharedMemory(create=True, size=max(volumes.nbytes, 1))
+        try:
+            shared = np.ndarray(
+                volumes.shape, dtype=volumes.dtype, buffer=shm.buf)
+            shared[...] = volumes
+            del shared
+            pool = _get_pool(workers)
+            futures = [
+                pool.submit(
+                    _lewiner_worker, shm.name, volumes.shape,
+                    volumes.dtype.str, i, level, kwargs)
+                for i in range(len(volumes))]
+            verts, faces = zip(*(f.result() for f in futures))
+        except BrokenProcessPool as e:
+            _reset_pool()
+            raise RuntimeError(
+                'batch_marching_cubes_lewiner worker processes died. Workers '
+                'are spawned and re-import `__main__`, so scripts must guard '
+                'top-level code with `if __name__ == \'__main__\':`') from e
+        finally:
+            shm.close()
+            shm.unlink()
+        vertex_splits = np.cumsum(
+            [0] + [len(v) for v in verts], dtype=np.int32)
+        face_splits = np.cumsum([0] + [len(f) for f in faces], dtype=np.int32)
+        return (np.concatenate(verts), np.concatenate(faces), vertex_splits,
+                face_splits)
+
+    with tf.name_scope('batch_marching_cubes_lewiner'):
+        verts, faces, vertex_splits, face_splits = tf.numpy_function(
+            fn, (volumes,), (tf.float32, tf.int32, tf.int32, tf.int32),
+            stateful=False)
+        verts.set_shape((None, 3))
+        faces.set_shape((None, 3))
+        vertex_splits.set_shape((None,))
+        face_splits.set_shape((None,))
+        batch_size = volumes.shape[0]
+        verts = _batch_rows(
+            verts, vertex_splits, max_vertices, np.inf, batch_size)
+        faces = _batch_rows(faces, face_splits, max_faces, -1, batch_size)
+        if max_vertices is None and max_faces is None:
+            return verts, faces
+        num_vertices = vertex_splits[1:] - vertex_splits[:-1]
+        num_faces = face_splits[1:] - face_splits[:-1]
+    return verts, faces, num_vertices, num_faces
+
+
+def vertex_gradient_hack(vertices, data, level=0, spacing=None):
     """
     Get vertices at interpolated roots of data embedding fn with gradients.
 
+    Each vertex is assumed to lie on an edge between neighbouring grid
+    points, along the axis on which its coordinate is furthest from an
+    integer. Vertex values are unchanged, but gradients with respect to
+    `data` (and `level`) are those of linear interpolation along that edge.
+    The Lewiner method may add vertices inside cells to resolve ambiguous
+    cases; these are given the gradient of the nearest such edge.
+
     Args:
         vertices: (N, ndims) float32 array of vertex values from linearly
             interpolated embedding function values
         data: rank `ndims` embedding function values used to generate vertices
+        level: value of the isosurface.
+        spacing: optional (ndims,) grid spacing used to generate vertices.
 
     Returns:
         (N, ndims) float32 array of vertex values with gradient information.
     """
-    raise RuntimeError(
-        'Bugged. Apparently not all vertices are on an edge between grid '
-        'points...')
-
     with tf.name_scope('vertex_gradient_hack'):
-        # vertices = tf.Print(vertices, [vertices])
-
-        v0 = tf.floor(vertices)
-        v0i = tf.cast(v0, tf.int32)
-        # 2 of 3 dims of vertices is an int, so cannot just add 1 like below
-        # v1 = v0 + 1
-        v1 = tf.ceil(vertices)
-        v1i = tf.cast(v1, tf.int32)
+        ndims = vertices.shape[-1]
+        if spacing is not None:
+            spacing = tf.constant(spacing, dtype=tf.float32)
+        points = vertices if spacing is None else vertices / spacing
+        rounded = tf.round(points)
+        axis = tf.argmax(tf.abs(points - rounded), axis=-1)
+        shift = tf.one_hot(axis, ndims, dtype=tf.int32)
+        # start of the edge, kept within the grid so the end is too
+        v0i = tf.cast(tf.where(shift > 0, tf.floor(points), rounded), tf.int32)
+        v0i = tf.clip_by_value(
+            v0i, 0, tf.shape(data, out_type=tf.int32) - 1 - shift)
 
         f0 = tf.gather_nd(data, v0i)
-        f1 = tf.gather_nd(data, v1i)
-
-        # n_diff = tf.count_nonzero(
-        #     tf.logical_not(tf.equal(v0i, v1i)), axis=-1)
-        # v_good = tf.where(tf.equal(n_diff, 1))
-        # v_good = tf.squeeze(v_good, axis=-1)
-
-        # v_special = tf.where(tf.equal(n_diff, 3.0))
-        # v_special = tf.squeeze(v_special, axis=-1)
-        # v_special = tf.gather(vertices, v_special)
-        #
-        #
-        # f0 = tf.Print(f0, [f_special])
-        # ones = tf.ones_like(n_diff)
-        # zeros = tf.zeros_like(n_diff)
-        # n_diffs = [tf.reduce_sum(tf.cast(tf.where(
-        #     tf.equal(n_diff, i), ones, zeros), tf.float32))
-        #     for i in range(5)]
-        # f0 = tf.Print(f0, n_diffs)
-
-        # f0 = tf.Print(f0, [
-        #     tf.reduce_min(tf.abs(f0)), tf.reduce_max(tf.abs(f0)),
-        #     tf.reduce_min(tf.abs(f1)), tf.reduce_max(tf.abs(f1)),
-        #     tf.reduce_min(tf.abs(f0-f1))])
-
-        numer = f0 if level == 0 else f0 - level
-        denom = f0 - f1
-        alpha = numer / denom  # possible catastrophic cancellation source?
-
-        alpha = tf.expand_dims(alpha, axis=-1)
-        interped = (1 - alpha)*v0 + alpha*v1
-        # interped = tf.where(tf.equal(n_diff, 1), interped, vertices)
-
-    return interped
+        f1 = tf.gather_nd(data, v0i + shift)
+        denom = f1 - f0
+        # avoid nans on degenerate edges, where the vertex is a grid point
+        denom = tf.where(tf.equal(denom, 0), tf.ones_like(denom), denom)
+        alpha = (level - f0) / denom
+
+        interped = tf.cast(v0i, tf.float32) + \
+            tf.cast(shift, tf.float32) * tf.expand_dims(alpha, axis=-1)
+        if spacing is not None:
+            interped = interped * spacing
+        # forward values from `vertices`, gradients from `interped`
+        return vertices + (interped - tf.stop_gradient(interped))
+
+
+def vertex_gradient_hack2(vertices, data, level=0):
+    """
+    Deprecated alias of `vertex_gradient_hack`.
+
+    Unlike the original, no vertices are dropped, so the output still lines
+    up with faces.
+    """
+    warnings.warn(
+        '`vertex_gradient_hack2` is deprecated, use `vertex_gradient_hack`',
+        DeprecationWarning, stacklevel=2)
+    return vertex_gradient_hack(vertices, data, level=level)